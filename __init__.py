@@ -1,3 +1,4 @@
+from .async_controller import AsyncDroneController
 from .controller import DroneController, LEGACY, NEW
 
-__all__ = ["DroneController", "LEGACY", "NEW"]
+__all__ = ["AsyncDroneController", "DroneController", "LEGACY", "NEW"]
@@ -0,0 +1,187 @@
+import asyncio
+import time
+
+from .controller import LEGACY, ControlSurface, PacketEncoder
+from .scheduler import DeadlineTicker, IntervalHistogram
+
+
+class ControlProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.transport = None
+        self.errors = 0
+        self.last_error = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        # ICMP port unreachable etc. on a connected endpoint.
+        self.errors += 1
+        self.last_error = exc
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+
+async def open_shared_transport(local_addr=("0.0.0.0", 0)):
+    # One unconnected UDP socket that any number of controllers can send
+    # through; pass it as AsyncDroneController(transport=...).
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(ControlProtocol, local_addr=local_addr)
+    return transport
+
+
+class AsyncDroneController(ControlSurface):
+    # Same packets and one-shot windows as DroneController, sent by a tick
+    # task on the running event loop instead of a thread. Every controller is
+    # just a task and a timer, so thousands can share one loop; pass a
+    # transport from open_shared_transport() to also share the socket.
+    def __init__(self, ip, port=2228, proto=LEGACY, rate_hz=25, transport=None, recorder=None, channel=0):
+        self.ip = ip
+        self.port = int(port)
+        self.encoder = PacketEncoder(proto)
+        self.rate_hz = float(rate_hz)
+        self.cadence = IntervalHistogram(1.0 / self.rate_hz)
+        self.protocol = None
+        self._transport = transport
+        self._owns_transport = transport is None
+        self._remote = (self.ip, self.port)
+        self._connected = False
+        self._task = None
+        self._waiters = []
+        self.recorder = recorder
+        self.channel = channel
+        self.errors = 0
+        self.last_error = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        loop = asyncio.get_running_loop()
+        if self._transport is None:
+            self._transport, self.protocol = await loop.create_datagram_endpoint(
+                ControlProtocol, remote_addr=self._remote
+            )
+            self._connected = True
+        self._task = loop.create_task(self._tick())
+        self._task.add_done_callback(self._tick_done)
+
+    async def close(self):
+        task = self._task
+        self._task = None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._fail_waiters("controller closed before %s was sent")
+        if self._owns_transport and self._transport is not None:
+            self._transport.close()
+            self._transport = None
+            self._connected = False
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def takeoff(self):
+        await self._oneshot_flag("takeoff")
+
+    async def land(self):
+        await self._oneshot_flag("land")
+
+    async def emergency(self):
+        await self._oneshot_flag("emergency")
+
+    async def calibrate(self):
+        await self._oneshot_flag("calibrate")
+
+    def send_once(self):
+        if self._transport is None:
+            raise RuntimeError("controller has no transport; await start() before send_once()")
+        self._transmit(raise_errors=True)
+        self._resolve_waiters()
+
+    def cadence_stats(self):
+        return self.cadence.snapshot()
+
+    def reset_cadence_stats(self):
+        self.cadence.reset()
+
+    async def _oneshot_flag(self, key):
+        # Resolves once the last packet of the one-shot window has been
+        # handed to the transport. A repeat request extends the window.
+        if not self.running:
+            raise RuntimeError("controller is not running; await start() before %s" % key)
+        ticket = self.encoder.request_oneshot(key)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((key, ticket, future))
+        await future
+
+    async def _tick(self):
+        ticker = DeadlineTicker(self.rate_hz, self.cadence)
+        ticker.start()
+        while True:
+            sent_at = self._transmit()
+            self.cadence.record_send(sent_at)
+            if self._waiters:
+                self._resolve_waiters()
+            deadline = ticker.advance()
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+            if time.monotonic() - deadline > ticker.late_threshold:
+                self.cadence.late += 1
+
+    def _transmit(self, raise_errors=False):
+        payload = self.encoder.next_packet()
+        try:
+            if self._connected:
+                self._transport.sendto(payload)
+            else:
+                self._transport.sendto(payload, self._remote)
+        except OSError as exc:
+            # A dropped packet must not end the stream; the next tick retries.
+            self.errors += 1
+            self.last_error = exc
+            if raise_errors:
+                raise
+            return time.monotonic()
+        sent_at = time.monotonic()
+        if self.recorder is not None:
+            self.recorder.record(sent_at, self.encoder.proto, payload, self.channel)
+        return sent_at
+
+    def _tick_done(self, task):
+        # The tick task only ends by close() or by crashing; either way
+        # nobody will send the pending flags.
+        if task.cancelled():
+            self._fail_waiters("controller closed before %s was sent")
+        else:
+            self._fail_waiters("controller stopped before %s was sent", task.exception())
+
+    def _fail_waiters(self, message, cause=None):
+        waiters = self._waiters
+        self._waiters = []
+        for key, _, future in waiters:
+            if not future.done():
+                error = ConnectionAbortedError(message % key)
+                error.__cause__ = cause
+                future.set_exception(error)
+
+    def _resolve_waiters(self):
+        pending = []
+        for key, ticket, future in self._waiters:
+            if future.done():
+                continue
+            if self.encoder.oneshot_sent(key, ticket):
+                future.set_result(None)
+            else:
+                pending.append((key, ticket, future))
+        self._waiters = pending
@@ -0,0 +1,79 @@
+# usage:
+# python3 -m pip install numpy
+# packets = encode_batch(np.column_stack([roll, pitch, yaw, throttle]), flags=flags, proto=NEW)
+# packets[i].tobytes() is what DroneController would send for sample i.
+import numpy as np
+
+from .controller import LEGACY, NEW
+
+# Same mapping as DroneController._sanitize_axis: 0x66/0x99 are the frame
+# markers, so axis and checksum bytes are nudged off them.
+SANITIZE = np.arange(256, dtype=np.uint8)
+SANITIZE[0x66] = 0x67
+SANITIZE[0x99] = 0x9A
+
+
+def normalize_axes(axes):
+    # Columns roll, pitch, yaw in [-1, 1] and throttle in [0, 1], mapped the
+    # way DroneController._normalize_axis does (round half to even, like
+    # Python's round()).
+    axes = np.asarray(axes, dtype=np.float64)
+    out = np.empty(axes.shape, dtype=np.int64)
+    out[:, :3] = np.rint((np.clip(axes[:, :3], -1.0, 1.0) + 1.0) * 127.5)
+    out[:, 3] = np.rint(np.clip(axes[:, 3], 0.0, 1.0) * 255.0)
+    return out
+
+
+def _byte_column(values, n):
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        values = np.trunc(values)
+    values = values.astype(np.int64, copy=False) & 0xFF
+    return np.broadcast_to(values, (n,)).astype(np.uint8)
+
+
+def encode_batch(axes, flags=0, flags2=0, proto=LEGACY, normalized=True):
+    # axes is N x 4 (roll, pitch, yaw, throttle); flags/flags2 are scalars or
+    # length-N columns holding the complete flag bytes, one-shot bits
+    # included. Returns a C-contiguous N x 8 (legacy) or N x 20 (new) uint8
+    # array whose rows match _build_legacy_packet/_build_new_packet.
+    axes = np.asarray(axes)
+    if axes.ndim != 2 or axes.shape[1] != 4:
+        raise ValueError("axes must be N x 4 (roll, pitch, yaw, throttle), got %r" % (axes.shape,))
+    n = axes.shape[0]
+    if normalized:
+        raw = normalize_axes(axes)
+    else:
+        raw = axes
+    roll = SANITIZE[_byte_column(raw[:, 0], n)]
+    pitch = SANITIZE[_byte_column(raw[:, 1], n)]
+    yaw = SANITIZE[_byte_column(raw[:, 2], n)]
+    throttle = _byte_column(raw[:, 3], n)
+    flags = _byte_column(flags, n)
+    chk = roll ^ pitch ^ throttle ^ yaw ^ flags
+
+    if proto == NEW:
+        flags2 = _byte_column(flags2, n)
+        out = np.zeros((n, 20), dtype=np.uint8)
+        out[:, 0] = 0x66
+        out[:, 1] = 0x14
+        out[:, 2] = roll
+        out[:, 3] = pitch
+        out[:, 4] = throttle
+        out[:, 5] = yaw
+        out[:, 6] = flags
+        out[:, 7] = flags2
+        out[:, 18] = SANITIZE[chk ^ flags2]
+        out[:, 19] = 0x99
+        return out
+
+    out = np.empty((n, 8), dtype=np.uint8)
+    out[:, 0] = 0x66
+    out[:, 1] = roll
+    out[:, 2] = pitch
+    out[:, 3] = throttle
+    out[:, 4] = yaw
+    out[:, 5] = flags
+    out[:, 6] = SANITIZE[chk]
+    out[:, 7] = 0x99
+    return out
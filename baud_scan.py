@@ -0,0 +1,244 @@
+# Offline baud-rate and framing detection for a raw logic capture of the
+# flight controller's UART line, instead of reopening the port at every
+# rate like the old scanner in read_uart.py. The capture is reduced to one
+# channel's edge times once; each candidate (baud, framing, polarity) is
+# then decoded from those edges with searchsorted and scored by how many
+# checksum-valid 0x66 ... 0x99 frames UartFrameDecoder gets out of it.
+#
+#   python3 -m drone_ctrl.baud_scan capture.bin --rate 4000000 [--bit 0]
+#   python3 -m drone_ctrl.baud_scan digital.csv [--channel 0]
+import argparse
+import time
+
+import numpy as np
+
+from .read_uart import UartFrameDecoder
+
+CANDIDATE_BAUDS = (4800, 9600, 14400, 19200, 28800, 38400, 57600, 76800, 115200, 230400, 250000, 460800, 921600)
+FRAMINGS = ("8N1", "8E1", "8O1", "8N2")
+MIN_SAMPLES_PER_BIT = 3
+MAX_EDGES = 400000
+PROBE_EDGES = 20000
+FINALISTS = 4
+BLOCK = 1 << 24
+
+
+class Capture:
+    # One digital channel: the level at t=0 plus sorted edge times in seconds.
+    def __init__(self, edges, initial=1, duration=None, sample_rate=None):
+        self.edges = np.ascontiguousarray(edges, dtype=np.float64)
+        self.initial = int(initial) & 1
+        if duration is None:
+            duration = float(self.edges[-1]) if len(self.edges) else 0.0
+        self.duration = duration
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_samples(cls, samples, sample_rate, bit=0):
+        # samples: one integer per sample, channel `bit` of each. Works in
+        # blocks so a memmapped multi-GB capture is never loaded at once.
+        total = len(samples)
+        if not total:
+            return cls(np.empty(0), 1, 0.0, sample_rate)
+        initial = int(samples[0] >> bit) & 1
+        edges = []
+        previous = initial
+        for start in range(0, total, BLOCK):
+            levels = (np.asarray(samples[start:start + BLOCK]) >> bit) & 1
+            changes = np.flatnonzero(np.diff(levels, prepend=previous))
+            edges.append(changes + start)
+            previous = levels[-1]
+        edges = np.concatenate(edges) / float(sample_rate)
+        return cls(edges, initial, total / float(sample_rate), sample_rate)
+
+    @classmethod
+    def from_raw(cls, path, sample_rate, bit=0):
+        # One byte per sample, bit N = channel N (sigrok "binary" output).
+        return cls.from_samples(np.memmap(path, dtype=np.uint8, mode="r"), sample_rate, bit)
+
+    @classmethod
+    def from_csv(cls, path, channel=0):
+        # Logic 2 digital CSV export: "Time [s],Channel 0,..." with one row per
+        # transition on any channel.
+        table = np.loadtxt(path, delimiter=",", skiprows=1, usecols=(0, 1 + channel), ndmin=2)
+        times = table[:, 0] - table[0, 0]
+        levels = table[:, 1].astype(np.int8)
+        changes = np.flatnonzero(np.diff(levels)) + 1
+        return cls(times[changes], levels[0], float(times[-1]))
+
+    def window(self, max_edges=MAX_EDGES):
+        # The first max_edges edges are plenty to score with.
+        if len(self.edges) <= max_edges:
+            return self
+        edges = self.edges[:max_edges]
+        return Capture(edges, self.initial, float(edges[-1]), self.sample_rate)
+
+
+def parse_framing(framing):
+    data_bits, parity, stop_bits = int(framing[0]), framing[1].upper(), int(framing[2])
+    if parity not in "NEO":
+        raise ValueError("bad framing %r" % framing)
+    return data_bits, parity, stop_bits
+
+
+def estimate_baud(capture):
+    # Single-bit pulses are the shortest ones on the line; glitches are
+    # shorter still, so use the low end of the widths rather than the min.
+    widths = np.diff(capture.edges)
+    widths = widths[widths > 0]
+    if len(widths) < 16:
+        return None
+    floor = np.percentile(widths, 2)
+    return 1.0 / float(np.median(widths[widths < floor * 1.5]))
+
+
+def _receiver_chain(ready):
+    # Indices visited by i -> ready[i] from 0, where ready[i] > i is the
+    # first start edge after frame i. Walked by pointer doubling, so it is
+    # log2(n) gathers instead of one Python step per frame.
+    count = len(ready)
+    jumps = [np.append(ready, count)]
+    while (1 << len(jumps)) < count:
+        jumps.append(jumps[-1][jumps[-1]])
+    steps = np.arange(count)
+    position = np.zeros(count, dtype=np.intp)
+    for level, jump in enumerate(jumps):
+        take = (steps >> level) & 1 == 1
+        position[take] = jump[position[take]]
+    return position[: np.searchsorted(position, count)]
+
+
+def uart_decode(capture, baud, framing="8N1", inverted=False):
+    # Returns (data bytes, framing errors, parity errors). Like a real
+    # receiver, a start bit is the first edge into the active level after
+    # the previous frame's stop bit has been sampled.
+    data_bits, parity, stop_bits = parse_framing(framing)
+    edges = capture.edges
+    bit_time = 1.0 / baud
+    idle = 0 if inverted else 1
+    levels_after = capture.initial ^ ((np.arange(1, len(edges) + 1)) & 1)
+    starts = edges[levels_after != idle]
+    nbits = 1 + data_bits + (parity != "N") + stop_bits
+    starts = starts[starts + nbits * bit_time <= capture.duration]
+    if not len(starts):
+        return np.empty(0, np.uint8), 0, 0
+
+    starts = starts[_receiver_chain(np.searchsorted(starts, starts + (nbits - 0.5) * bit_time))]
+
+    offsets = (np.arange(1, nbits) + 0.5) * bit_time
+    sampled = np.searchsorted(edges, starts[:, None] + offsets, side="right")
+    bits = ((sampled & 1) ^ capture.initial ^ inverted).astype(np.uint8)
+    weights = 1 << np.arange(data_bits)
+    data = bits[:, :data_bits] @ weights
+    good = bits[:, nbits - 1 - stop_bits:].all(axis=1)
+    framing_errors = int(np.count_nonzero(~good))
+    parity_errors = 0
+    if parity != "N":
+        odd = (bits[:, :data_bits + 1].sum(axis=1) & 1).astype(bool)
+        parity_ok = odd if parity == "O" else ~odd
+        parity_errors = int(np.count_nonzero(good & ~parity_ok))
+        good &= parity_ok
+    return data[good].astype(np.uint8), framing_errors, parity_errors
+
+
+def score(capture, baud, framing="8N1", inverted=False):
+    data, framing_errors, parity_errors = uart_decode(capture, baud, framing, inverted)
+    decoder = UartFrameDecoder()
+    decoder.feed(data.tobytes())
+    stats = decoder.stats()
+    return {
+        "baud": baud,
+        "framing": framing,
+        "inverted": inverted,
+        "frames": stats["frames"],
+        "legacy": stats["legacy"],
+        "new": stats["new"],
+        "bad_checksum": stats["bad_checksum"],
+        "bytes": len(data),
+        "framing_errors": framing_errors,
+        "parity_errors": parity_errors,
+        "edges": len(capture.edges),
+    }
+
+
+def _rank(result):
+    return -result["frames"], result["framing_errors"] + result["parity_errors"] + result["bad_checksum"]
+
+
+def scan(capture, bauds=CANDIDATE_BAUDS, framings=FRAMINGS, polarities=(False, True), max_edges=MAX_EDGES):
+    # Ranked best first: most valid frames, then fewest errors. Every
+    # candidate is scored on the first PROBE_EDGES edges, then the best few
+    # that found frames are rescored on up to max_edges; "edges" in each
+    # result says which. Rates the capture cannot resolve (under
+    # MIN_SAMPLES_PER_BIT samples per bit) are left out.
+    capture = capture.window(max_edges)
+    probe = capture.window(min(max_edges, PROBE_EDGES))
+    results = []
+    for baud in bauds:
+        if capture.sample_rate and capture.sample_rate / baud < MIN_SAMPLES_PER_BIT:
+            continue
+        for framing in framings:
+            for inverted in polarities:
+                results.append(score(probe, baud, framing, inverted))
+    results.sort(key=_rank)
+    if probe is not capture:
+        finalists = [r for r in results[:FINALISTS] if r["frames"]]
+        rescored = [score(capture, r["baud"], r["framing"], r["inverted"]) for r in finalists]
+        results = sorted(rescored, key=_rank) + results[len(finalists):]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the baud rate and framing of a raw UART capture")
+    parser.add_argument("capture", help="Raw capture (one byte per sample) or a Logic 2 digital CSV export")
+    parser.add_argument("--rate", type=float, help="Sample rate in Hz (required for raw captures)")
+    parser.add_argument("--bit", type=int, default=0, help="Channel bit within each raw sample byte")
+    parser.add_argument("--channel", type=int, default=0, help="Channel column of a CSV export")
+    parser.add_argument("--bauds", help="Comma-separated candidate rates (default: common rates 4800-921600)")
+    parser.add_argument("--framings", default=",".join(FRAMINGS), help="Comma-separated, e.g. 8N1,8E1")
+    parser.add_argument("--max-edges", type=int, default=MAX_EDGES, help="Edges to analyse from the start")
+    parser.add_argument("--top", type=int, default=8, help="Rows to print")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.capture.lower().endswith(".csv"):
+        capture = Capture.from_csv(args.capture, args.channel)
+    else:
+        if not args.rate:
+            parser.error("--rate is required for raw captures")
+        capture = Capture.from_raw(args.capture, args.rate, args.bit)
+    loaded = time.perf_counter()
+    bauds = [int(b) for b in args.bauds.split(",")] if args.bauds else CANDIDATE_BAUDS
+    results = scan(capture, bauds, args.framings.split(","), max_edges=args.max_edges)
+    done = time.perf_counter()
+
+    estimate = estimate_baud(capture.window(args.max_edges))
+    print(
+        "%d edges over %.2fs, load %.0f ms, scan %.0f ms (%d candidates)"
+        % (len(capture.edges), capture.duration, (loaded - started) * 1e3, (done - loaded) * 1e3, len(results))
+    )
+    if estimate:
+        print("shortest pulses suggest ~%.0f baud" % estimate)
+    header = ("baud", "frame", "polarity", "frames", "bad_chk", "f_err", "p_err", "bytes", "edges")
+    print("  %7s %-5s %-8s %7s %7s %7s %7s %7s %7s" % header)
+    for r in results[: args.top]:
+        print(
+            "  %7d %-5s %-8s %7d %7d %7d %7d %7d %7d"
+            % (
+                r["baud"],
+                r["framing"],
+                "inverted" if r["inverted"] else "normal",
+                r["frames"],
+                r["bad_checksum"],
+                r["framing_errors"],
+                r["parity_errors"],
+                r["bytes"],
+                r["edges"],
+            )
+        )
+    if not results or not results[0]["frames"]:
+        print("no candidate produced a valid frame")
+
+
+if __name__ == "__main__":
+    main()
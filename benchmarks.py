@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+# usage: python3 -m drone_ctrl.benchmarks {frames,packets,fleet,batch,baudscan,sal}
+import argparse
+import socket
+import threading
+import time
+
+from .controller import LEGACY, NEW, ONESHOT_BITS, ONESHOT_KEYS, Axes, DroneController, PacketEncoder
+from .fleet import Fleet
+from .wifi_drone_webcam import JpegFrameAssembler, placeholder_jpeg
+
+
+def _legacy_frames(chunks):
+    # The bytearray find/del loop jpeg_frames_from_udp used before
+    # JpegFrameAssembler, kept here as the baseline.
+    buf = bytearray()
+    soi = b"\xff\xd8"
+    eoi = b"\xff\xd9"
+    for data in chunks:
+        buf.extend(data)
+        while True:
+            start = buf.find(soi)
+            if start == -1:
+                if len(buf) > 2 * 1024 * 1024:
+                    buf.clear()
+                break
+            end = buf.find(eoi, start + 2)
+            if end == -1:
+                if start > 0:
+                    del buf[:start]
+                break
+            frame = bytes(buf[start:end + 2])
+            del buf[:end + 2]
+            yield frame
+
+
+def _assembler_frames(chunks, validate=True):
+    assembler = JpegFrameAssembler(validate=validate)
+    for data in chunks:
+        view = assembler.writable(len(data))
+        view[:len(data)] = data
+        for frame in assembler.commit(len(data), datagram=True):
+            yield frame
+
+
+_RESTART_BYTES = 512
+
+
+def _fake_jpeg(size, seed):
+    # A baseline greyscale frame one 8x8 MCU tall with a DRI of one MCU, so
+    # its entropy data has one restart interval per MCU column: ~size bytes
+    # of data with stuffed FF 00 pairs, split by RST0..RST7 in order. The
+    # header is the placeholder's, up to and including SOS.
+    intervals = max(size // _RESTART_BYTES, 1)
+    header = placeholder_jpeg(8 * intervals, 8)
+    header = header[:header.index(b"\xff\xda") + 10]
+    dri = b"\xff\xdd\x00\x04\x00\x01"
+    body = bytes((seed + i * 7) & 0xFF for i in range(size))
+    step = -(-size // intervals)
+    pieces = [body[i * step:(i + 1) * step].replace(b"\xff", b"\xff\x00") for i in range(intervals)]
+    scan = bytearray(pieces[0])
+    for i, piece in enumerate(pieces[1:]):
+        scan += bytes((0xFF, 0xD0 + (i & 7))) + piece
+    sos = header.index(b"\xff\xda")
+    return header[:sos] + dri + header[sos:] + bytes(scan) + b"\xff\xd9"
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_frames(args):
+    frames = [_fake_jpeg(args.frame_size, i) for i in range(args.frames)]
+    stream = b"".join(frames)
+    chunks = [stream[i:i + args.chunk] for i in range(0, len(stream), args.chunk)]
+    print(
+        "frames=%d frame_size=%d chunk=%d (%.1f MB)"
+        % (args.frames, args.frame_size, args.chunk, len(stream) / 1e6)
+    )
+    variants = (
+        ("legacy", _legacy_frames),
+        ("assembler", _assembler_frames),
+        ("no-verify", lambda c: _assembler_frames(c, validate=False)),
+    )
+    for name, fn in variants:
+        elapsed, out = _timed(lambda: list(fn(chunks)))
+        assert out == frames, name
+        print(
+            "  %-10s %8.1f ms  %8.1f MB/s  %8.0f frames/s"
+            % (name, elapsed * 1e3, len(stream) / elapsed / 1e6, len(out) / elapsed)
+        )
+
+
+class _LegacyPacketPath:
+    # Per-tick work DroneController._build_packet did before PacketEncoder:
+    # lock, copy Axes and the one-shot dict, lock again to count down, then
+    # build a fresh bytearray. Kept here as the baseline.
+    def __init__(self, proto):
+        self.proto = proto
+        self._lock = threading.Lock()
+        self.axes = Axes()
+        self.flags_legacy = 0
+        self.flags_new = 0
+        self.flags_new2 = 0
+        self._oneshot = {}
+
+    def set_axes(self, roll, pitch, yaw, throttle):
+        with self._lock:
+            self.axes.roll = roll
+            self.axes.pitch = pitch
+            self.axes.yaw = yaw
+            self.axes.throttle = throttle
+
+    def build(self):
+        with self._lock:
+            axes = Axes(self.axes.roll, self.axes.pitch, self.axes.yaw, self.axes.throttle)
+            flags_legacy = self.flags_legacy
+            flags_new = self.flags_new
+            flags_new2 = self.flags_new2
+            oneshot = dict(self._oneshot)
+        for key, (bit_legacy, bit_new) in zip(ONESHOT_KEYS, ONESHOT_BITS):
+            if oneshot.get(key, 0) > 0:
+                flags_legacy |= bit_legacy
+                flags_new |= bit_new
+        with self._lock:
+            for key in list(self._oneshot):
+                self._oneshot[key] -= 1
+                if self._oneshot[key] <= 0:
+                    del self._oneshot[key]
+        if self.proto == NEW:
+            return DroneController._build_new_packet(axes, flags_new, flags_new2)
+        return DroneController._build_legacy_packet(axes, flags_legacy)
+
+
+def _packet_rate(build, update, packets, change_every):
+    start = time.perf_counter()
+    for i in range(packets):
+        if change_every and i % change_every == 0:
+            update(i)
+        build()
+    return packets / (time.perf_counter() - start)
+
+
+def bench_packets(args):
+    print("packets=%d" % args.packets)
+    for proto in (LEGACY, NEW):
+        for label, change_every in (("steady", 0), ("change/tick", 1), ("change/%d" % args.every, args.every)):
+            baseline = _LegacyPacketPath(proto)
+            encoder = PacketEncoder(proto)
+            old = _packet_rate(
+                baseline.build,
+                lambda i: baseline.set_axes(i & 0xFF, 128, 128, i & 0x7F),
+                args.packets,
+                change_every,
+            )
+            new = _packet_rate(
+                encoder.next_packet,
+                lambda i: encoder.set_axes(i & 0xFF, 128, 128, i & 0x7F, normalized=False),
+                args.packets,
+                change_every,
+            )
+            print(
+                "  %-6s %-12s legacy-path %9.0f pkt/s  encoder %9.0f pkt/s  (x%.1f)"
+                % (proto, label, old, new, new / old)
+            )
+
+
+def bench_fleet(args):
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    port = sink.getsockname()[1]
+    fleet = Fleet(rate_hz=args.rate)
+    for i in range(args.drones):
+        fleet.add("127.0.0.1", port, proto=NEW if i % 2 else LEGACY, name="drone%d" % i)
+    fleet.start()
+    time.sleep(1.0)
+    fleet.reset_health()
+    cpu = time.process_time()
+    time.sleep(args.seconds)
+    cpu = time.process_time() - cpu
+    health = fleet.health()
+    fleet.close()
+    sink.close()
+    p99 = sorted(stats["p99_ms"] for stats in health.values())
+    print(
+        "drones=%d rate=%.0f Hz: healthy %d/%d  p99 median %.1f ms max %.1f ms  late %d  skipped %d  cpu %.0f%%"
+        % (
+            args.drones,
+            args.rate,
+            sum(stats["healthy"] for stats in health.values()),
+            args.drones,
+            p99[len(p99) // 2],
+            p99[-1],
+            sum(stats["late_ticks"] for stats in health.values()),
+            sum(stats["skipped_ticks"] for stats in health.values()),
+            cpu / args.seconds * 100,
+        )
+    )
+
+
+def _scalar_packets(axes, flags, flags2, proto, normalized):
+    # Per-sample path: what calling set_axes + _build_packet costs today.
+    normalize = DroneController._normalize_axis
+    out = []
+    for (roll, pitch, yaw, throttle), flag, flag2 in zip(axes, flags, flags2):
+        if normalized:
+            sample = Axes(
+                normalize(roll, center=True),
+                normalize(pitch, center=True),
+                normalize(yaw, center=True),
+                normalize(throttle, center=False),
+            )
+        else:
+            sample = Axes(int(roll), int(pitch), int(yaw), int(throttle))
+        if proto == NEW:
+            out.append(bytes(DroneController._build_new_packet(sample, int(flag), int(flag2))))
+        else:
+            out.append(bytes(DroneController._build_legacy_packet(sample, int(flag))))
+    return out
+
+
+def _random_samples(rng, n, normalized):
+    # Includes the awkward values: exact .5 rounding points, out-of-range
+    # inputs and raw bytes that land on the 0x66/0x99 markers.
+    import numpy as np
+
+    if normalized:
+        axes = rng.uniform(-1.3, 1.3, size=(n, 4))
+        halves = (np.arange(256) - 127.5) / 127.5
+        axes[::7, 0] = rng.choice(halves, size=len(axes[::7]))
+        axes[::11, 3] = rng.choice(np.arange(256) / 255.0 + 0.5 / 255.0, size=len(axes[::11]))
+    else:
+        axes = rng.integers(-300, 600, size=(n, 4))
+        axes[::5, 1] = rng.choice([0x66, 0x99, 0x166, -0x67], size=len(axes[::5]))
+    flags = rng.integers(0, 256, size=n)
+    flags2 = rng.integers(0, 256, size=n)
+    return axes, flags, flags2
+
+
+def bench_batch(args):
+    import numpy as np
+
+    from .batch_encoder import encode_batch
+
+    rng = np.random.default_rng(args.seed)
+    for proto in (LEGACY, NEW):
+        for normalized in (True, False):
+            axes, flags, flags2 = _random_samples(rng, args.samples, normalized)
+            scalar_s, expected = _timed(
+                _scalar_packets, axes.tolist(), flags.tolist(), flags2.tolist(), proto, normalized
+            )
+            batch_s, packets = _timed(encode_batch, axes, flags, flags2, proto, normalized)
+            mismatches = sum(row.tobytes() != want for row, want in zip(packets, expected))
+            assert packets.flags["C_CONTIGUOUS"]
+            assert not mismatches, "%d rows differ (%s, normalized=%s)" % (mismatches, proto, normalized)
+            print(
+                "  %-6s %-10s %d samples match  scalar %8.1f ms  batch %6.2f ms  (x%.0f)"
+                % (
+                    proto,
+                    "normalized" if normalized else "raw",
+                    args.samples,
+                    scalar_s * 1e3,
+                    batch_s * 1e3,
+                    scalar_s / batch_s,
+                )
+            )
+
+
+def _uart_capture(np, packets, baud, framing, sample_rate, gap_s, noise, rng):
+    # Edges of a line carrying `packets` one after another, `gap_s` apart,
+    # quantized to the sample clock; `noise` random bytes go in between.
+    from .baud_scan import Capture, parse_framing
+
+    data_bits, parity, stop_bits = parse_framing(framing)
+    bit_time = 1.0 / baud
+    levels = []
+    times = []
+    t = gap_s
+    for packet in packets:
+        payload = bytes(packet) + bytes(rng.integers(0, 256, noise).tolist())
+        for byte in payload:
+            bits = [0] + [(byte >> i) & 1 for i in range(data_bits)]
+            if parity != "N":
+                bits.append((sum(bits) & 1) ^ (parity == "O"))
+            bits += [1] * stop_bits
+            for level in bits:
+                levels.append(level)
+                times.append(t)
+                t += bit_time
+        levels.append(1)
+        times.append(t)
+        t += gap_s
+    levels = np.array(levels)
+    times = np.array(times)
+    changes = np.flatnonzero(np.diff(levels, prepend=1))
+    edges = np.round(times[changes] * sample_rate) / sample_rate
+    return Capture(edges, 1, t, sample_rate)
+
+
+def bench_baudscan(args):
+    import numpy as np
+
+    from .baud_scan import scan
+    from .batch_encoder import encode_batch
+
+    rng = np.random.default_rng(args.seed)
+    axes = rng.uniform(-1.0, 1.0, (args.packets, 4))
+    axes[:, 3] = rng.uniform(0.0, 1.0, args.packets)
+    for baud, framing, proto in ((19200, "8N1", LEGACY), (115200, "8N1", NEW), (57600, "8E1", LEGACY)):
+        packets = encode_batch(axes, proto=proto)
+        capture = _uart_capture(np, packets, baud, framing, args.sample_rate, 1.0 / 400, args.noise, rng)
+        elapsed, results = _timed(scan, capture)
+        best = results[0]
+        assert (best["baud"], best["framing"], best["inverted"]) == (baud, framing, False), best
+        print(
+            "  %6d %s %-6s %6d edges  best %6d %s frames=%d in %d edges (runner-up %d)  scan %6.1f ms (%d candidates)"
+            % (
+                baud,
+                framing,
+                proto,
+                len(capture.edges),
+                best["baud"],
+                best["framing"],
+                best["frames"],
+                best["edges"],
+                results[1]["frames"],
+                elapsed * 1e3,
+                len(results),
+            )
+        )
+
+
+def _encode_runs(np, runs):
+    # Inverse of saleae.decode_runs.
+    values = np.asarray(runs, dtype=np.uint64) - 1
+    sizes = np.ones(len(values), dtype=np.int64)
+    for j in range(5):
+        sizes += values >= np.uint64(1 << (6 + 7 * j))
+    offsets = np.cumsum(sizes) - sizes
+    out = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for j in range(int(sizes.max()) if len(sizes) else 0):
+        take = sizes > j
+        left = (sizes[take] - 1 - j).astype(np.uint64)
+        group = values[take] >> (np.uint64(7) * left)
+        if j == 0:
+            byte = (group & np.uint64(0x3F)) | np.where(left > 0, 0x40, 0).astype(np.uint64)
+        else:
+            byte = (group & np.uint64(0x7F)) | np.where(left > 0, 0x80, 0).astype(np.uint64)
+        out[offsets[take] + j] = byte
+    return out, sizes
+
+
+def _sal_channel(np, edges, initial, total, rate, runs_per_chunk=4096):
+    from .saleae import CHUNK, DIGITAL_TYPE, HEADER, SAL_MAGIC
+
+    bounds = np.concatenate(([0], edges, [total])).astype(np.int64)
+    encoded, sizes = _encode_runs(np, np.diff(bounds))
+    parts = []
+    count = (len(sizes) + runs_per_chunk - 1) // runs_per_chunk
+    parts.append(HEADER.pack(SAL_MAGIC, 3, DIGITAL_TYPE, 1, rate, 0, 0.0, 0, count))
+    byte_ends = np.cumsum(sizes)
+    for i in range(count):
+        lo, hi = i * runs_per_chunk, min(len(sizes), (i + 1) * runs_per_chunk)
+        start = byte_ends[lo - 1] if lo else 0
+        data = encoded[start:byte_ends[hi - 1]].tobytes()
+        parts.append(CHUNK.pack(int(bounds[lo]), int(bounds[hi]), initial ^ (lo & 1), 0, len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def _spi_edges(np, payloads, period_s, bit_s, rate, seconds):
+    # Mode 0 transactions, one every period_s, cycling through payloads.
+    # Returns sample-index edges for (clk, data, cs), all idle low except cs.
+    starts = np.arange(int(seconds / period_s)) * period_s + period_s / 2
+    clk, data, cs = [], [], []
+    for index, payload in enumerate(payloads):
+        t0 = starts[index :: len(payloads)][:, None]
+        nbits = 8 * len(payload)
+        bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8))
+        levels = np.concatenate(([0], bits, [0]))
+        changes = np.flatnonzero(np.diff(levels))
+        clk.append(t0 + np.sort(np.concatenate((np.arange(nbits) + 1.5, np.arange(nbits) + 2.0))) * bit_s)
+        data.append(t0 + (changes + 1) * bit_s)
+        cs.append(t0 + np.array([0.0, nbits + 3.0]) * bit_s)
+    return [
+        np.sort(np.round(np.concatenate([e.ravel() for e in group]) * rate)).astype(np.int64)
+        for group in (clk, data, cs)
+    ]
+
+
+def bench_sal(args):
+    import os
+    import tempfile
+    import zipfile
+
+    import numpy as np
+
+    from .saleae import SalCapture, control_frames, spi_decode
+
+    rate = 24e6
+    packets = []
+    for throttle in (0.0, 0.4):
+        encoder = PacketEncoder(LEGACY)
+        encoder.set_axes(0.1, -0.2, 0.0, throttle, True)
+        packets.append(b"\xa0" + encoder.next_packet())
+    clk, data, cs = _spi_edges(np, packets, args.period / 1e3, 1.0 / args.clock, rate, args.seconds)
+    total = int(args.seconds * rate)
+    path = os.path.join(tempfile.mkdtemp(), "synthetic.sal")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("meta.json", "{}")
+        for index, (edges, initial) in enumerate(((clk, 0), (data, 0), (cs, 1))):
+            archive.writestr("digital-%d.bin" % index, _sal_channel(np, edges, initial, total, rate))
+    size = os.path.getsize(path)
+
+    started = time.perf_counter()
+    with SalCapture(path) as sal:
+        channels = [sal.channel(i) for i in range(3)]
+        loaded = time.perf_counter()
+        transactions = spi_decode(channels[0], channels[1], channels[2])
+        frames, decoder = control_frames(t.data[1:] for t in transactions)
+    done = time.perf_counter()
+    os.unlink(path)
+    assert np.array_equal(np.round(channels[0].edges * rate).astype(np.int64), clk)
+    expected = int(args.seconds / (args.period / 1e3))
+    assert len(frames) == len(transactions) == expected, (len(frames), len(transactions), expected)
+    assert [t.data for t in transactions[:2]] == packets
+    print(
+        "  %.0fs at 24 MHz, %d edges, %.1f MB .sal: load %.2fs, SPI decode %.2fs, %d transactions, %d frames"
+        % (
+            args.seconds,
+            len(clk) + len(data) + len(cs),
+            size / 1e6,
+            loaded - started,
+            done - loaded,
+            len(transactions),
+            len(frames),
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the drone tools")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    frames = sub.add_parser("frames", help="JPEG reassembly: JpegFrameAssembler vs legacy find/del")
+    frames.add_argument("--frames", type=int, default=50)
+    frames.add_argument("--frame-size", type=int, default=150 * 1024)
+    frames.add_argument("--chunk", type=int, default=2048, help="Datagram/read size")
+    frames.set_defaults(func=bench_frames)
+
+    packets = sub.add_parser("packets", help="Control packets/s: PacketEncoder vs per-tick rebuild")
+    packets.add_argument("--packets", type=int, default=200000)
+    packets.add_argument("--every", type=int, default=5, help="Ticks between input changes")
+    packets.set_defaults(func=bench_packets)
+
+    fleet = sub.add_parser("fleet", help="Fleet cadence with N simulated drones on one thread")
+    fleet.add_argument("--drones", type=int, default=60)
+    fleet.add_argument("--rate", type=float, default=50.0)
+    fleet.add_argument("--seconds", type=float, default=5.0)
+    fleet.set_defaults(func=bench_fleet)
+
+    batch = sub.add_parser("batch", help="NumPy batch encoder vs per-sample packets (randomized cross-check)")
+    batch.add_argument("--samples", type=int, default=100000)
+    batch.add_argument("--seed", type=int, default=0)
+    batch.set_defaults(func=bench_batch)
+
+    baudscan = sub.add_parser("baudscan", help="Baud/framing scan of synthetic UART captures")
+    baudscan.add_argument("--packets", type=int, default=2000)
+    baudscan.add_argument("--sample-rate", type=float, default=4e6)
+    baudscan.add_argument("--noise", type=int, default=2, help="Random bytes after each packet")
+    baudscan.add_argument("--seed", type=int, default=0)
+    baudscan.set_defaults(func=bench_baudscan)
+
+    sal = sub.add_parser("sal", help="Load and SPI-decode a synthetic multi-minute .sal capture")
+    sal.add_argument("--seconds", type=float, default=180.0)
+    sal.add_argument("--period", type=float, default=4.0, help="Milliseconds between transactions")
+    sal.add_argument("--clock", type=float, default=400e3, help="SPI clock in Hz")
+    sal.set_defaults(func=bench_sal)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
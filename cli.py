@@ -1,4 +1,6 @@
 import argparse
+import sys
+import threading
 import time
 
 from .controller import DroneController, LEGACY, NEW
@@ -6,10 +8,16 @@ from .controller import DroneController, LEGACY, NEW
 
 def build_parser():
     parser = argparse.ArgumentParser(description="Send control packets to the E88 WiFi drone.")
-    parser.add_argument("--ip", required=True, help="Drone IP address (AP mode)")
+    parser.add_argument("--ip", help="Drone IP address (AP mode); not needed for `send`")
     parser.add_argument("--port", type=int, default=2228, help="UDP port (default: 2228)")
     parser.add_argument("--proto", choices=[LEGACY, NEW], default=LEGACY, help="Packet format")
     parser.add_argument("--rate", type=float, default=25.0, help="Send rate in Hz")
+    parser.add_argument("--serial", help="Write packets to this UART device instead of UDP (e.g. /dev/ttyUSB0)")
+    parser.add_argument("--baud", type=int, default=19200, help="UART baud rate for --serial (default: 19200)")
+    parser.add_argument("--immediate", action="store_true", help="Send right away when the state changes")
+    parser.add_argument(
+        "--min-spacing", type=float, default=0.01, help="Minimum seconds between immediate sends (default: 0.01)"
+    )
 
     parser.add_argument("--roll", type=float, help="Roll [-1..1] (left/right)")
     parser.add_argument("--pitch", type=float, help="Pitch [-1..1] (forward/back)")
@@ -27,14 +35,119 @@ def build_parser():
 
     parser.add_argument("--duration", type=float, default=0.5, help="Seconds to send control for")
     parser.add_argument("--once", action="store_true", help="Send a single packet then exit")
+    parser.add_argument("--record", help="Append every transmitted packet to this flight recorder log")
+    parser.add_argument("--socket", help="Control daemon socket path (default: $XDG_RUNTIME_DIR/e88-drone.sock)")
+
+    sub = parser.add_subparsers(dest="command")
+    play = sub.add_parser("play", help="Play a trajectory file (CSV or binary) with pre-encoded packets")
+    play.add_argument("trajectory", help="Trajectory file")
+    play.add_argument("--loop", type=int, default=1, help="Number of passes, 0 = until aborted (default: 1)")
+    play.add_argument("--hold", action="store_true", help="Hold each row instead of interpolating")
+    play.add_argument("--timing-log", help="Write per-packet timing error to this CSV file")
+
+    discover = sub.add_parser("discover", help="Probe ports and packet formats in parallel and cache the result")
+    discover.add_argument("--ports", help="Comma-separated UDP ports (default: the known E88 ports)")
+    discover.add_argument("--stream-cmd", default="Bv", help="Comma-separated 2-byte stream commands")
+    discover.add_argument("--seconds", type=float, default=1.5, help="Probe time (default: 1.5)")
+    discover.add_argument("--refresh", action="store_true", help="Ignore the cached result")
+
+    sub.add_parser("daemon", help="Keep streaming and take commands on a Unix socket (see `send`)")
+    send = sub.add_parser("send", help="Send commands to a running daemon, e.g. send 'axes throttle=0.5' takeoff")
+    send.add_argument("commands", nargs="*", help="Command lines; none or '-' reads them from stdin")
     return parser
 
 
-def main():
-    parser = build_parser()
-    args = parser.parse_args()
+def discover_drone(args):
+    from .discover import DEFAULT_PORTS, describe, discover
+
+    ports = list(DEFAULT_PORTS)
+    if args.ports:
+        ports = [int(port) for port in args.ports.split(",") if port.strip()]
+    commands = [command.strip() for command in args.stream_cmd.split(",") if command.strip()]
+    entry, from_cache = discover(
+        args.ip, ports, commands, duration=args.seconds, rate_hz=args.rate, refresh=args.refresh
+    )
+    if from_cache:
+        print("Cached result for %s (use --refresh to probe again)" % (entry.get("mac") or entry["ip"]))
+    print(describe(entry))
+
+
+def send_commands(args):
+    from .daemon import DEFAULT_SOCKET, DaemonClient
+
+    lines = args.commands
+    if not lines or lines == ["-"]:
+        lines = sys.stdin
+    failed = False
+    with DaemonClient(args.socket or DEFAULT_SOCKET) as client:
+        for line in lines:
+            if not line.strip():
+                continue
+            reply = client.command(line)
+            print(reply)
+            failed = failed or reply.startswith("err")
+    return 1 if failed else 0
+
+
+def open_transport(args):
+    # --serial writes straight to the RF MCU's UART; otherwise raw UDP.
+    if args.serial:
+        from .transport import SerialTransport
+
+        return SerialTransport(args.serial, args.baud)
+    from .transport import UdpTransport
+
+    return UdpTransport(args.ip, args.port)
+
+
+def play_trajectory(args, recorder=None):
+    from .trajectory import Trajectory, TrajectoryPlayer
 
-    ctrl = DroneController(args.ip, args.port, proto=args.proto, rate_hz=args.rate)
+    compiled = Trajectory.load(args.trajectory).compile(args.proto, args.rate, interpolate=not args.hold)
+    print(
+        "Playing %s: %d packets, %.2fs per pass at %.1f Hz (%s)"
+        % (args.trajectory, len(compiled), compiled.duration, compiled.rate_hz, args.proto)
+    )
+    transport = open_transport(args)
+    player = TrajectoryPlayer(transport, compiled, loops=args.loop, timing_log=args.timing_log, recorder=recorder)
+    try:
+        thread = threading.Thread(target=player.play, daemon=True)
+        thread.start()
+        while thread.is_alive():
+            thread.join(0.1)
+    except KeyboardInterrupt:
+        print("Aborting: sending emergency")
+        player.abort()
+        thread.join()
+    finally:
+        transport.close()
+    print(" ".join("%s=%s" % item for item in player.stats().items()))
+
+
+def run(args, recorder):
+    if args.command == "play":
+        play_trajectory(args, recorder)
+        return
+    if args.command == "discover":
+        discover_drone(args)
+        return
+
+    transport = open_transport(args)
+    ctrl = DroneController(
+        args.ip or args.serial,
+        args.port,
+        proto=args.proto,
+        rate_hz=args.rate,
+        immediate=args.immediate,
+        min_spacing=args.min_spacing,
+        recorder=recorder,
+        transport=transport,
+    )
+    if args.command == "daemon":
+        from .daemon import DEFAULT_SOCKET, serve
+
+        serve(ctrl, args.socket or DEFAULT_SOCKET)
+        return
     try:
         ctrl.set_axes(args.roll, args.pitch, args.yaw, args.throttle, normalized=True)
         ctrl.set_flags(rotate=args.rotate, headless=args.headless, stay_high=args.stay_high)
@@ -58,5 +171,26 @@ def main():
         ctrl.close()
 
 
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.command == "send":
+        sys.exit(send_commands(args))
+    if not args.ip and not (args.serial and args.command in (None, "daemon", "play")):
+        parser.error("--ip is required unless the command is `send` or --serial is given")
+
+    recorder = None
+    if args.record:
+        from .recorder import FlightRecorder
+
+        recorder = FlightRecorder(args.record)
+    try:
+        run(args, recorder)
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+
 if __name__ == "__main__":
     main()
@@ -1,13 +1,28 @@
-import socket
 import threading
 import time
 from dataclasses import dataclass
 
+from .scheduler import DeadlineTicker, IntervalHistogram, ms
+
 
 LEGACY = "legacy"
 NEW = "new"
 
 
+ONESHOT_KEYS = ("takeoff", "land", "emergency", "calibrate")
+# Flag bits held high while a one-shot window is active: (legacy, new).
+ONESHOT_BITS = ((0x01, 0x01), (0x02, 0x01), (0x04, 0x02), (0x80, 0x04))
+
+
+# 0x66/0x99 are the frame markers; axis and checksum bytes are nudged off them.
+_SANITIZED = bytes((v + 1) & 0xFF if v in (0x66, 0x99) else v for v in range(256))
+_NEW_PAD = (0,) * 10
+
+
+def oneshot_window(proto):
+    return 20 if proto == LEGACY else 50
+
+
 @dataclass
 class Axes:
     roll: int = 128
@@ -16,25 +31,305 @@ class Axes:
     throttle: int = 0
 
 
-class DroneController:
-    def __init__(self, ip, port=2228, proto=LEGACY, rate_hz=25):
+class ControlState:
+    # Immutable snapshot of everything that goes into a packet. Writers build
+    # a new one and publish it with a single reference assignment, so the
+    # sender reads a consistent state without taking a lock.
+    __slots__ = (
+        "version",
+        "roll",
+        "pitch",
+        "yaw",
+        "throttle",
+        "flags_legacy",
+        "flags_new",
+        "flags_new2",
+        "oneshot",
+        "changed_at",
+    )
+
+    def __init__(
+        self, version, roll, pitch, yaw, throttle, flags_legacy, flags_new, flags_new2, oneshot, changed_at=None
+    ):
+        self.version = version
+        self.roll = roll
+        self.pitch = pitch
+        self.yaw = yaw
+        self.throttle = throttle
+        self.flags_legacy = flags_legacy
+        self.flags_new = flags_new
+        self.flags_new2 = flags_new2
+        # Request counters, one per ONESHOT_KEYS entry; the sender starts a
+        # window whenever a counter moves.
+        self.oneshot = oneshot
+        # Monotonic time the snapshot was published, for input-to-wire latency.
+        self.changed_at = changed_at
+
+
+class PacketEncoder:
+    # Input threads call set_axes/set_flags/request_oneshot, which only take
+    # _lock to serialise against each other. next_packet() is called by the
+    # single sender: it reads the published ControlState, runs the one-shot
+    # countdowns (sender-owned, so lock-free) and returns a cached bytes
+    # packet that is rebuilt only when the state version, the set of active
+    # one-shot windows or the protocol changes.
+    def __init__(self, proto=LEGACY):
+        self.proto = proto
+        self._lock = threading.Lock()
+        self._state = ControlState(0, 128, 128, 128, 0, 0, 0, 0, (0, 0, 0, 0))
+        # Set on every publish; an immediate-mode sender waits on it.
+        self.changed = threading.Event()
+        self.last_state = self._state
+        self._seen = self._state.oneshot
+        self._left = [0, 0, 0, 0]
+        self._tx_lock = threading.Lock()
+        self._cache_state = None
+        self._cache_mask = -1
+        self._cache_proto = None
+        self._cache = b""
+        self.rebuilds = 0
+
+    @property
+    def state(self):
+        return self._state
+
+    def set_axes(self, roll=None, pitch=None, yaw=None, throttle=None, normalized=True):
+        if normalized:
+            normalize = DroneController._normalize_axis
+            roll = None if roll is None else normalize(roll, center=True)
+            pitch = None if pitch is None else normalize(pitch, center=True)
+            yaw = None if yaw is None else normalize(yaw, center=True)
+            throttle = None if throttle is None else normalize(throttle, center=False)
+        with self._lock:
+            old = self._state
+            roll = old.roll if roll is None else int(roll)
+            pitch = old.pitch if pitch is None else int(pitch)
+            yaw = old.yaw if yaw is None else int(yaw)
+            throttle = old.throttle if throttle is None else int(throttle)
+            if (roll, pitch, yaw, throttle) == (old.roll, old.pitch, old.yaw, old.throttle):
+                # Nothing changed: no new version, no rebuild, no wakeup.
+                return old
+            state = ControlState(
+                old.version + 1,
+                roll,
+                pitch,
+                yaw,
+                throttle,
+                old.flags_legacy,
+                old.flags_new,
+                old.flags_new2,
+                old.oneshot,
+                time.monotonic(),
+            )
+            self._state = state
+        self.changed.set()
+        return state
+
+    def set_flags(self, rotate=None, headless=None, stay_high=None):
+        set_bit = DroneController._set_bit
+        with self._lock:
+            old = self._state
+            flags_legacy = old.flags_legacy
+            flags_new = old.flags_new
+            flags_new2 = old.flags_new2
+            if rotate is not None:
+                flags_legacy = set_bit(flags_legacy, 3, rotate)
+                flags_new = set_bit(flags_new, 3, rotate)
+            if headless is not None:
+                flags_legacy = set_bit(flags_legacy, 4, headless)
+                flags_new2 = set_bit(flags_new2, 0, headless)
+            if stay_high is not None:
+                flags_new2 = set_bit(flags_new2, 1, stay_high)
+            if (flags_legacy, flags_new, flags_new2) == (old.flags_legacy, old.flags_new, old.flags_new2):
+                return old
+            state = ControlState(
+                old.version + 1,
+                old.roll,
+                old.pitch,
+                old.yaw,
+                old.throttle,
+                flags_legacy,
+                flags_new,
+                flags_new2,
+                old.oneshot,
+                time.monotonic(),
+            )
+            self._state = state
+        self.changed.set()
+        return state
+
+    def request_oneshot(self, key):
+        # Returns the new request counter for key.
+        index = ONESHOT_KEYS.index(key)
+        with self._lock:
+            old = self._state
+            oneshot = list(old.oneshot)
+            oneshot[index] += 1
+            state = ControlState(
+                old.version + 1,
+                old.roll,
+                old.pitch,
+                old.yaw,
+                old.throttle,
+                old.flags_legacy,
+                old.flags_new,
+                old.flags_new2,
+                tuple(oneshot),
+                time.monotonic(),
+            )
+            self._state = state
+        self.changed.set()
+        return oneshot[index]
+
+    def emergency_pending(self):
+        index = ONESHOT_KEYS.index("emergency")
+        return self._state.oneshot[index] != self._seen[index]
+
+    def oneshot_sent(self, key, ticket):
+        # ticket is the counter value returned by request_oneshot(); true once
+        # that request's whole window has been handed out by next_packet().
+        index = ONESHOT_KEYS.index(key)
+        return self._seen[index] >= ticket and not self._left[index]
+
+    def oneshot_remaining(self):
+        return {key: left for key, left in zip(ONESHOT_KEYS, self._left) if left}
+
+    def next_packet(self):
+        with self._tx_lock:
+            state = self._state
+            left = self._left
+            if state.oneshot is not self._seen:
+                window = oneshot_window(self.proto)
+                for i, (old, new) in enumerate(zip(self._seen, state.oneshot)):
+                    if old != new:
+                        left[i] = window
+                self._seen = state.oneshot
+            mask = (left[0] > 0) | (left[1] > 0) << 1 | (left[2] > 0) << 2 | (left[3] > 0) << 3
+            if state is not self._cache_state or mask != self._cache_mask or self.proto != self._cache_proto:
+                self._cache = self._encode(state, mask)
+                self._cache_state = state
+                self._cache_mask = mask
+                self._cache_proto = self.proto
+                self.rebuilds += 1
+            if mask:
+                for i in range(4):
+                    if left[i]:
+                        left[i] -= 1
+            self.last_state = state
+            return self._cache
+
+    def _encode(self, state, mask):
+        # Same bytes as DroneController._build_*_packet, without the
+        # intermediate Axes/bytearray: bytes 8..17 of the new format are
+        # zero, so both checksums reduce to the XOR of the six/five fields.
+        flags_legacy = state.flags_legacy
+        flags_new = state.flags_new
+        if mask:
+            for i, (bit_legacy, bit_new) in enumerate(ONESHOT_BITS):
+                if mask & (1 << i):
+                    flags_legacy |= bit_legacy
+                    flags_new |= bit_new
+        roll = _SANITIZED[state.roll & 0xFF]
+        pitch = _SANITIZED[state.pitch & 0xFF]
+        yaw = _SANITIZED[state.yaw & 0xFF]
+        throttle = state.throttle & 0xFF
+        if self.proto == NEW:
+            flags = flags_new & 0xFF
+            flags2 = state.flags_new2 & 0xFF
+            chk = _SANITIZED[roll ^ pitch ^ throttle ^ yaw ^ flags ^ flags2]
+            return bytes((0x66, 0x14, roll, pitch, throttle, yaw, flags, flags2) + _NEW_PAD + (chk, 0x99))
+        flags = flags_legacy & 0xFF
+        chk = _SANITIZED[roll ^ pitch ^ throttle ^ yaw ^ flags]
+        return bytes((0x66, roll, pitch, throttle, yaw, flags, chk, 0x99))
+
+
+class ControlSurface:
+    # State accessors shared by the threaded and asyncio controllers; both
+    # keep their input state in self.encoder.
+    @property
+    def proto(self):
+        return self.encoder.proto
+
+    @proto.setter
+    def proto(self, value):
+        self.encoder.proto = value
+
+    @property
+    def axes(self):
+        state = self.encoder.state
+        return Axes(state.roll, state.pitch, state.yaw, state.throttle)
+
+    @property
+    def flags_legacy(self):
+        return self.encoder.state.flags_legacy
+
+    @property
+    def flags_new(self):
+        return self.encoder.state.flags_new
+
+    @property
+    def flags_new2(self):
+        return self.encoder.state.flags_new2
+
+    def oneshot_remaining(self):
+        # One-shot flags still inside their send window, with packets left.
+        return self.encoder.oneshot_remaining()
+
+    @property
+    def _oneshot(self):
+        return self.oneshot_remaining()
+
+    def set_axes(self, roll=None, pitch=None, yaw=None, throttle=None, normalized=True):
+        self.encoder.set_axes(roll, pitch, yaw, throttle, normalized)
+
+    def set_flags(self, rotate=None, headless=None, stay_high=None):
+        self.encoder.set_flags(rotate, headless, stay_high)
+
+
+class DroneController(ControlSurface):
+    def __init__(
+        self,
+        ip,
+        port=2228,
+        proto=LEGACY,
+        rate_hz=25,
+        immediate=False,
+        min_spacing=0.01,
+        emergency_bypass=True,
+        recorder=None,
+        transport=None,
+    ):
         self.ip = ip
         self.port = int(port)
-        self.proto = proto
+        self.encoder = PacketEncoder(proto)
         self.rate_hz = float(rate_hz)
-        self.axes = Axes()
-        self.flags_legacy = 0
-        self.flags_new = 0
-        self.flags_new2 = 0
-        self._oneshot = {}
-        self._lock = threading.Lock()
+        # Immediate mode: a state change wakes the sender to transmit right
+        # away. No two packets, ticks included, go out less than min_spacing
+        # apart (emergency may skip the wait); a change due within
+        # min_spacing of the next tick rides on that tick. The regular ticks
+        # keep their own timeline either way.
+        self.immediate = immediate
+        self.min_spacing = float(min_spacing)
+        self.emergency_bypass = emergency_bypass
+        self.immediate_sends = 0
         self._running = False
         self._thread = None
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Anything with send(payload, state)/close(); raw UDP by default.
+        # Imported here because transport.py imports ONESHOT_KEYS from us.
+        if transport is None:
+            from .transport import UdpTransport
+
+            transport = UdpTransport(ip, self.port)
+        self.transport = transport
+        self.cadence = IntervalHistogram(1.0 / self.rate_hz)
+        self.latency = IntervalHistogram(1.0 / self.rate_hz, bucket_s=0.0001, buckets=2000)
+        self._wire_version = 0
+        # Optional FlightRecorder; gets every packet that went out.
+        self.recorder = recorder
 
     def close(self):
         self.stop()
-        self._sock.close()
+        self.transport.close()
 
     def start(self):
         if self._running:
@@ -45,32 +340,11 @@ class DroneController:
 
     def stop(self):
         self._running = False
+        self.encoder.changed.set()
         if self._thread is not None:
             self._thread.join(timeout=1.0)
             self._thread = None
 
-    def set_axes(self, roll=None, pitch=None, yaw=None, throttle=None, normalized=True):
-        with self._lock:
-            if roll is not None:
-                self.axes.roll = self._normalize_axis(roll, center=True) if normalized else int(roll)
-            if pitch is not None:
-                self.axes.pitch = self._normalize_axis(pitch, center=True) if normalized else int(pitch)
-            if yaw is not None:
-                self.axes.yaw = self._normalize_axis(yaw, center=True) if normalized else int(yaw)
-            if throttle is not None:
-                self.axes.throttle = self._normalize_axis(throttle, center=False) if normalized else int(throttle)
-
-    def set_flags(self, rotate=None, headless=None, stay_high=None):
-        with self._lock:
-            if rotate is not None:
-                self.flags_legacy = self._set_bit(self.flags_legacy, 3, rotate)
-                self.flags_new = self._set_bit(self.flags_new, 3, rotate)
-            if headless is not None:
-                self.flags_legacy = self._set_bit(self.flags_legacy, 4, headless)
-                self.flags_new2 = self._set_bit(self.flags_new2, 0, headless)
-            if stay_high is not None:
-                self.flags_new2 = self._set_bit(self.flags_new2, 1, stay_high)
-
     def takeoff(self):
         self._oneshot_flag("takeoff")
 
@@ -84,38 +358,92 @@ class DroneController:
         self._oneshot_flag("calibrate")
 
     def send_once(self):
-        payload = self._build_packet()
-        self._sock.sendto(payload, (self.ip, self.port))
+        self._transmit(raise_errors=True)
+
+    def cadence_stats(self):
+        return self.cadence.snapshot()
+
+    def reset_cadence_stats(self):
+        self.cadence.reset()
+
+    def latency_stats(self):
+        # Time from a set_*/one-shot call to the first packet carrying it.
+        latency = self.latency
+        return {
+            "samples": latency.count,
+            "mean_ms": ms(latency.total / latency.count) if latency.count else None,
+            "p50_ms": ms(latency.percentile(0.50)),
+            "p90_ms": ms(latency.percentile(0.90)),
+            "p99_ms": ms(latency.percentile(0.99)),
+            "max_ms": ms(latency.max),
+            "immediate_sends": self.immediate_sends,
+        }
+
+    def reset_latency_stats(self):
+        self.latency.reset()
+        self.immediate_sends = 0
 
     def _loop(self):
-        interval = 1.0 / self.rate_hz
+        ticker = DeadlineTicker(self.rate_hz, self.cadence)
+        ticker.start()
+        changed = self.encoder.changed
         while self._running:
-            payload = self._build_packet()
-            try:
-                self._sock.sendto(payload, (self.ip, self.port))
-            except OSError:
-                pass
-            time.sleep(interval)
+            changed.clear()
+            tick_sent = self._transmit()
+            self.cadence.record_send(tick_sent)
+            last_send = tick_sent
+            # Ticks and immediate sends share last_send, so min_spacing holds
+            # between any two packets.
+            event = changed if self.immediate else None
+            while ticker.wait(tick_sent, event, last_send + self.min_spacing) is None:
+                if not self._running:
+                    return
+                last_send = self._send_change(ticker, last_send)
 
-    def _build_packet(self):
-        with self._lock:
-            axes = Axes(self.axes.roll, self.axes.pitch, self.axes.yaw, self.axes.throttle)
-            flags_legacy = self.flags_legacy
-            flags_new = self.flags_new
-            flags_new2 = self.flags_new2
-            oneshot = dict(self._oneshot)
+    def _send_change(self, ticker, last_send):
+        changed = self.encoder.changed
+        changed.clear()
+        while not (self.emergency_bypass and self.encoder.emergency_pending()):
+            now = time.monotonic()
+            if ticker.deadline - now <= self.min_spacing:
+                # The next tick is due within min_spacing; it carries the change.
+                return last_send
+            remaining = last_send + self.min_spacing - now
+            if remaining <= 0:
+                break
+            changed.wait(remaining)
+            changed.clear()
+            if not self._running:
+                return last_send
+        self.immediate_sends += 1
+        return self._transmit()
 
-        if oneshot:
-            flags_legacy, flags_new, flags_new2 = self._apply_oneshot(flags_legacy, flags_new, flags_new2)
+    def _transmit(self, raise_errors=False):
+        payload = self._build_packet()
+        try:
+            self.transport.send(payload, self.encoder.last_state)
+        except OSError:
+            if raise_errors:
+                raise
+            return time.monotonic()
+        sent_at = time.monotonic()
+        if self.recorder is not None:
+            self.recorder.record(sent_at, self.encoder.proto, payload)
+        state = self.encoder.last_state
+        if state.version != self._wire_version:
+            self._wire_version = state.version
+            if state.changed_at is not None:
+                self.latency.record(sent_at - state.changed_at)
+        return sent_at
 
-        if self.proto == NEW:
-            return self._build_new_packet(axes, flags_new, flags_new2)
-        return self._build_legacy_packet(axes, flags_legacy)
+    def _build_packet(self):
+        return self.encoder.next_packet()
 
-    def _build_legacy_packet(self, axes, flags):
-        roll = self._sanitize_axis(axes.roll)
-        pitch = self._sanitize_axis(axes.pitch)
-        yaw = self._sanitize_axis(axes.yaw)
+    @staticmethod
+    def _build_legacy_packet(axes, flags):
+        roll = DroneController._sanitize_axis(axes.roll)
+        pitch = DroneController._sanitize_axis(axes.pitch)
+        yaw = DroneController._sanitize_axis(axes.yaw)
         payload = bytearray(8)
         payload[0] = 0x66
         payload[1] = roll
@@ -123,14 +451,15 @@ class DroneController:
         payload[3] = axes.throttle & 0xFF
         payload[4] = yaw
         payload[5] = flags & 0xFF
-        payload[6] = self._checksum_legacy(payload)
+        payload[6] = DroneController._checksum_legacy(payload)
         payload[7] = 0x99
         return payload
 
-    def _build_new_packet(self, axes, flags, flags2):
-        roll = self._sanitize_axis(axes.roll)
-        pitch = self._sanitize_axis(axes.pitch)
-        yaw = self._sanitize_axis(axes.yaw)
+    @staticmethod
+    def _build_new_packet(axes, flags, flags2):
+        roll = DroneController._sanitize_axis(axes.roll)
+        pitch = DroneController._sanitize_axis(axes.pitch)
+        yaw = DroneController._sanitize_axis(axes.yaw)
         payload = bytearray(20)
         payload[0] = 0x66
         payload[1] = 0x14
@@ -140,42 +469,12 @@ class DroneController:
         payload[5] = yaw
         payload[6] = flags & 0xFF
         payload[7] = flags2 & 0xFF
-        payload[18] = self._checksum_new(payload)
+        payload[18] = DroneController._checksum_new(payload)
         payload[19] = 0x99
         return payload
 
-    def _apply_oneshot(self, flags_legacy, flags_new, flags_new2):
-        with self._lock:
-            max_ticks = 20 if self.proto == LEGACY else 50
-            if "takeoff" in self._oneshot:
-                flags_legacy |= 0x01
-                flags_new |= 0x01
-                self._decrement_oneshot("takeoff", max_ticks)
-            if "land" in self._oneshot:
-                flags_legacy |= 0x02
-                flags_new |= 0x01
-                self._decrement_oneshot("land", max_ticks)
-            if "emergency" in self._oneshot:
-                flags_legacy |= 0x04
-                flags_new |= 0x02
-                self._decrement_oneshot("emergency", max_ticks)
-            if "calibrate" in self._oneshot:
-                flags_legacy |= 0x80
-                flags_new |= 0x04
-                self._decrement_oneshot("calibrate", max_ticks)
-        return flags_legacy, flags_new, flags_new2
-
-    def _decrement_oneshot(self, key, max_ticks):
-        remaining = self._oneshot.get(key, 0)
-        remaining -= 1
-        if remaining <= 0:
-            self._oneshot.pop(key, None)
-        else:
-            self._oneshot[key] = min(remaining, max_ticks)
-
     def _oneshot_flag(self, key):
-        with self._lock:
-            self._oneshot[key] = 20 if self.proto == LEGACY else 50
+        self.encoder.request_oneshot(key)
 
     @staticmethod
     def _set_bit(value, bit, enabled):
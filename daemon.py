@@ -0,0 +1,173 @@
+# Long-running control daemon: owns one DroneController and its send loop,
+# and takes commands over a Unix domain socket, one line per command:
+#
+#   axes roll=0.2 pitch=-0.1 yaw=0 throttle=0.5 [raw]
+#   flags rotate=1 headless=0 stay_high=1
+#   takeoff | land | emergency | calibrate
+#   neutral | ping | stats | shutdown
+#
+# Every command gets one reply line: "ok", "ok <json>" or "err <reason>".
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from .controller import ONESHOT_KEYS
+
+DEFAULT_SOCKET = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or "/tmp", "e88-drone.sock")
+AXIS_NAMES = ("roll", "pitch", "yaw", "throttle")
+FLAG_NAMES = ("rotate", "headless", "stay_high")
+
+
+def parse_fields(words, names, convert):
+    values = {}
+    for word in words:
+        name, sep, value = word.partition("=")
+        if not sep or name not in names:
+            raise ValueError("expected one of %s as name=value, got %r" % ("/".join(names), word))
+        values[name] = convert(value)
+    return values
+
+
+def parse_flag(value):
+    if value.lower() in ("1", "on", "true", "yes"):
+        return True
+    if value.lower() in ("0", "off", "false", "no"):
+        return False
+    raise ValueError("bad flag value %r" % value)
+
+
+class ControlRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            line = line.decode("utf-8", "replace").strip()
+            try:
+                reply = self.server.execute(line)
+            except (ValueError, TypeError) as exc:
+                reply = "err %s" % exc
+            try:
+                self.wfile.write(reply.encode("utf-8") + b"\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            if line == "shutdown":
+                return
+
+
+class ControlDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, controller, path=DEFAULT_SOCKET):
+        self.controller = controller
+        self.path = path
+        self.commands = 0
+        self._count_lock = threading.Lock()
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.unlink(path)
+            else:
+                probe.close()
+                raise OSError("another daemon is listening on %s" % path)
+        # Create the socket owner-only rather than chmod'ing it after bind(),
+        # which leaves a window where anyone can connect.
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, ControlRequestHandler)
+        finally:
+            os.umask(umask)
+
+    def execute(self, line):
+        words = line.split()
+        if not words:
+            raise ValueError("empty command")
+        command = words[0].lower()
+        args = words[1:]
+        ctrl = self.controller
+        with self._count_lock:
+            self.commands += 1
+            commands = self.commands
+        if command == "axes":
+            normalized = "raw" not in args
+            args = [word for word in args if word != "raw"]
+            values = parse_fields(args, AXIS_NAMES, float if normalized else int)
+            ctrl.set_axes(normalized=normalized, **values)
+        elif command == "flags":
+            ctrl.set_flags(**parse_fields(args, FLAG_NAMES, parse_flag))
+        elif command in ONESHOT_KEYS:
+            getattr(ctrl, command)()
+        elif command == "neutral":
+            ctrl.set_axes(0.0, 0.0, 0.0, 0.0, normalized=True)
+        elif command == "ping":
+            return "ok pong"
+        elif command == "stats":
+            return "ok " + json.dumps(
+                {
+                    "commands": commands,
+                    "axes": vars(ctrl.axes),
+                    "oneshot": ctrl.oneshot_remaining(),
+                    "cadence": {k: v for k, v in ctrl.cadence_stats().items() if k != "histogram_ms"},
+                    "latency": ctrl.latency_stats(),
+                }
+            )
+        elif command == "shutdown":
+            threading.Thread(target=self.shutdown, daemon=True).start()
+        else:
+            raise ValueError("unknown command %r" % command)
+        return "ok"
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def serve(controller, path=DEFAULT_SOCKET):
+    # Runs until a shutdown command or Ctrl-C; the controller streams
+    # neutral sticks from the start so the drone never sees a gap.
+    controller.set_axes(0.0, 0.0, 0.0, 0.0, normalized=True)
+    controller.start()
+    server = ControlDaemon(controller, path)
+    print("Control daemon on %s -> %s:%d (%s)" % (path, controller.ip, controller.port, controller.proto))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        controller.close()
+
+
+class DaemonClient:
+    # Keeps one connection open, so each command is a single round trip.
+    def __init__(self, path=DEFAULT_SOCKET, timeout=2.0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self._rfile = self.sock.makefile("rb")
+
+    def command(self, line):
+        # A blank line would still get an "err" reply, but it is never a
+        # meaningful command, so refuse it before the round trip.
+        if not line.strip():
+            raise ValueError("empty command")
+        self.sock.sendall(line.strip().encode("utf-8") + b"\n")
+        reply = self._rfile.readline()
+        if not reply:
+            raise ConnectionError("daemon closed the connection")
+        return reply.decode("utf-8").rstrip("\n")
+
+    def close(self):
+        self._rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
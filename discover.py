@@ -0,0 +1,252 @@
+# Port/protocol discovery for unknown E88 firmware: every (port, payload)
+# combination gets its own connected UDP socket, all probed at once for a
+# second or two. Payloads are neutral control packets (centred sticks, zero
+# throttle, no flags, so nothing arms) in both formats plus the 2-byte
+# stream start commands. A connected socket surfaces ICMP port unreachable
+# as ConnectionRefusedError, which tells closed ports apart from silent ones.
+import json
+import os
+import selectors
+import socket
+import time
+
+from .controller import LEGACY, NEW, PacketEncoder
+from .scheduler import ms
+
+DEFAULT_PORTS = (2228, 8090, 8080, 2224, 3333, 7099, 40000, 50000)
+DEFAULT_STREAM_COMMANDS = ("Bv",)
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "e88-drone", "discovery.json")
+SOI = b"\xff\xd8"
+
+
+class Probe:
+    def __init__(self, ip, port, kind, payload):
+        self.port = port
+        self.kind = kind
+        self.payload = payload
+        self.sent = 0
+        self.replies = 0
+        self.bytes = 0
+        self.first_reply = None
+        self.sample = b""
+        self.jpeg = False
+        self.refused = False
+        self.started = None
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.sock.connect((ip, port))
+
+    @property
+    def status(self):
+        if self.jpeg or self.bytes >= 1000:
+            return "video"
+        if self.replies:
+            return "reply"
+        if self.refused:
+            return "refused"
+        return "silent"
+
+    def send(self, now):
+        if self.started is None:
+            self.started = now
+        try:
+            self.sock.send(self.payload)
+            self.sent += 1
+        except ConnectionRefusedError:
+            self.refused = True
+        except (BlockingIOError, OSError):
+            pass
+
+    def receive(self, now):
+        while True:
+            try:
+                data = self.sock.recv(65535)
+            except BlockingIOError:
+                return
+            except ConnectionRefusedError:
+                self.refused = True
+                return
+            except OSError:
+                return
+            if self.first_reply is None:
+                self.first_reply = now - (self.started or now)
+                self.sample = data[:16]
+            self.replies += 1
+            self.bytes += len(data)
+            if SOI in data:
+                self.jpeg = True
+
+    def close(self):
+        self.sock.close()
+
+    def result(self):
+        return {
+            "port": self.port,
+            "kind": self.kind,
+            "status": self.status,
+            "sent": self.sent,
+            "replies": self.replies,
+            "bytes": self.bytes,
+            "first_reply_ms": ms(self.first_reply, 1),
+            "sample": self.sample.hex(),
+        }
+
+
+def probe(ip, ports=DEFAULT_PORTS, stream_commands=DEFAULT_STREAM_COMMANDS, duration=1.5, rate_hz=25.0):
+    probes = []
+    for port in ports:
+        for proto in (LEGACY, NEW):
+            probes.append(Probe(ip, port, proto, PacketEncoder(proto).next_packet()))
+        for command in stream_commands:
+            payload = command.encode("ascii")[:2].ljust(2, b"\x00")
+            probes.append(Probe(ip, port, "stream:" + command, payload))
+
+    selector = selectors.DefaultSelector()
+    for item in probes:
+        selector.register(item.sock, selectors.EVENT_READ, item)
+    interval = 1.0 / rate_hz
+    start = time.monotonic()
+    end = start + duration
+    next_send = start
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= end:
+                break
+            if now >= next_send:
+                for item in probes:
+                    if not item.refused:
+                        item.send(now)
+                next_send += interval
+            timeout = max(0.0, min(next_send, end) - time.monotonic())
+            for key, _ in selector.select(timeout):
+                key.data.receive(time.monotonic())
+    finally:
+        selector.close()
+        for item in probes:
+            item.close()
+    return [item.result() for item in probes]
+
+
+def choose(results, ports=DEFAULT_PORTS):
+    # Stream: the combination that returned the most video. Control: a port
+    # that answered a control packet, else the first port (in the order
+    # given) where neither format was refused and no stream came back.
+    order = {port: i for i, port in enumerate(ports)}
+    stream = None
+    videos = [r for r in results if r["status"] == "video" and r["kind"].startswith("stream:")]
+    if videos:
+        best = max(videos, key=lambda r: r["bytes"])
+        stream = {"port": best["port"], "command": best["kind"].split(":", 1)[1]}
+
+    control = None
+    controls = [r for r in results if r["kind"] in (LEGACY, NEW)]
+    answered = [r for r in controls if r["status"] in ("reply", "video")]
+    if answered:
+        best = min(answered, key=lambda r: (r["first_reply_ms"], order.get(r["port"], 0)))
+        control = {"port": best["port"], "proto": best["kind"], "evidence": best["status"]}
+    else:
+        refused = {r["port"] for r in controls if r["status"] == "refused"}
+        stream_ports = {stream["port"]} if stream else set()
+        open_ports = sorted(
+            {r["port"] for r in controls} - refused - stream_ports, key=lambda port: order.get(port, 0)
+        )
+        if open_ports:
+            control = {"port": open_ports[0], "proto": None, "evidence": "not refused", "candidates": open_ports}
+    return {"control": control, "stream": stream}
+
+
+def arp_mac(ip, path="/proc/net/arp"):
+    # The probe traffic leaves a neighbour entry behind on Linux.
+    try:
+        with open(path) as handle:
+            next(handle, None)
+            for line in handle:
+                fields = line.split()
+                if len(fields) >= 4 and fields[0] == ip and fields[2] != "0x0":
+                    mac = fields[3].lower()
+                    if mac != "00:00:00:00:00:00":
+                        return mac
+    except OSError:
+        pass
+    return None
+
+
+def load_cache(path=CACHE_PATH):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache, path=CACHE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as handle:
+        json.dump(cache, handle, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def cache_key(ip, mac=None):
+    return "mac:" + mac if mac else "ip:" + ip
+
+
+def cached(ip, path=CACHE_PATH):
+    cache = load_cache(path)
+    mac = arp_mac(ip)
+    return cache.get(cache_key(ip, mac)) or cache.get(cache_key(ip))
+
+
+def discover(
+    ip,
+    ports=DEFAULT_PORTS,
+    stream_commands=DEFAULT_STREAM_COMMANDS,
+    duration=1.5,
+    rate_hz=25.0,
+    refresh=False,
+    cache_path=CACHE_PATH,
+):
+    # Returns (entry, from_cache). Entries are cached under the drone's MAC
+    # when ARP knows it (DHCP may move the IP), else under the IP.
+    if not refresh:
+        entry = cached(ip, cache_path)
+        if entry is not None:
+            return entry, True
+    results = probe(ip, ports, stream_commands, duration, rate_hz)
+    mac = arp_mac(ip)
+    entry = dict(choose(results, ports), ip=ip, mac=mac, probed_at=time.time(), results=results)
+    cache = load_cache(cache_path)
+    cache[cache_key(ip, mac)] = entry
+    save_cache(cache, cache_path)
+    return entry, False
+
+
+def describe(entry):
+    lines = []
+    for result in entry["results"]:
+        if result["status"] == "refused":
+            continue
+        lines.append(
+            "  %-5d %-10s %-7s replies=%d bytes=%d first=%s"
+            % (
+                result["port"],
+                result["kind"],
+                result["status"],
+                result["replies"],
+                result["bytes"],
+                "%.1fms" % result["first_reply_ms"] if result["first_reply_ms"] is not None else "-",
+            )
+        )
+    control = entry["control"]
+    stream = entry["stream"]
+    if control:
+        proto = control["proto"] or "unknown (try --proto legacy, then new)"
+        lines.append("control: port %d, proto %s (%s)" % (control["port"], proto, control["evidence"]))
+    else:
+        lines.append("control: no open port found")
+    if stream:
+        lines.append("stream:  port %d, command %s" % (stream["port"], stream["command"]))
+    else:
+        lines.append("stream:  no video")
+    return "\n".join(lines)
@@ -0,0 +1,190 @@
+import heapq
+import socket
+import threading
+import time
+
+from .controller import LEGACY, ControlSurface, PacketEncoder
+from .scheduler import DeadlineTicker, IntervalHistogram
+
+
+class FleetDrone(ControlSurface):
+    # One endpoint driven by a Fleet. Input methods match DroneController;
+    # sending is done by the fleet's thread, on this drone's ticker.
+    def __init__(self, ip, port=2228, proto=LEGACY, rate_hz=25, name=None, late_fraction=0.25):
+        self.ip = ip
+        self.port = int(port)
+        self.addr = (ip, self.port)
+        self.name = name or "%s:%d" % self.addr
+        self.encoder = PacketEncoder(proto)
+        self.rate_hz = float(rate_hz)
+        self.period = 1.0 / self.rate_hz
+        self.cadence = IntervalHistogram(self.period)
+        self.ticker = DeadlineTicker(self.rate_hz, self.cadence, late_fraction)
+        self.send_errors = 0
+        self.channel = 0
+
+    def takeoff(self):
+        self.encoder.request_oneshot("takeoff")
+
+    def land(self):
+        self.encoder.request_oneshot("land")
+
+    def emergency(self):
+        self.encoder.request_oneshot("emergency")
+
+    def calibrate(self):
+        self.encoder.request_oneshot("calibrate")
+
+    def cadence_stats(self):
+        return self.cadence.snapshot()
+
+
+class Fleet:
+    # Drives many drones from one thread and one UDP socket. Every drone has
+    # its own DeadlineTicker timeline, kept in a heap of deadlines; drones
+    # sharing a rate get their phases spread over the period so the sends
+    # do not go out as one burst each tick. A drone added while running
+    # takes the middle of the widest phase gap of its rate group; nobody
+    # else's phase moves.
+    def __init__(self, rate_hz=25, late_fraction=0.25, sock=None, recorder=None):
+        self.rate_hz = float(rate_hz)
+        # Optional FlightRecorder; records carry each drone's channel number.
+        self.recorder = recorder
+        self._channels = 0
+        self.late_fraction = late_fraction
+        self.drones = {}
+        self._sock = sock or socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._heap = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def add(self, ip, port=2228, proto=LEGACY, rate_hz=None, name=None):
+        drone = FleetDrone(ip, port, proto, rate_hz or self.rate_hz, name, self.late_fraction)
+        with self._lock:
+            if drone.name in self.drones:
+                raise ValueError("duplicate drone %s" % drone.name)
+            drone.channel = self._channels
+            self._channels += 1
+            self.drones[drone.name] = drone
+            if self._running:
+                self._place(drone, time.monotonic())
+        self._wake.set()
+        return drone
+
+    def remove(self, name):
+        with self._lock:
+            drone = self.drones.pop(name)
+            if self._running:
+                heap = [entry for entry in self._heap if entry[2] is not drone]
+                heapq.heapify(heap)
+                self._heap = heap
+        self._wake.set()
+        return drone
+
+    def start(self):
+        if self._running:
+            return
+        with self._lock:
+            self._running = True
+            self._stagger(time.monotonic())
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self._sock.close()
+
+    def health(self):
+        # Per-drone cadence summary; healthy means no skipped ticks and a p99
+        # interval within the late threshold of the drone's period.
+        report = {}
+        for name, drone in list(self.drones.items()):
+            stats = drone.cadence.snapshot()
+            stats.pop("histogram_ms")
+            p99 = stats["p99_ms"]
+            stats["rate_hz"] = drone.rate_hz
+            stats["send_errors"] = drone.send_errors
+            stats["healthy"] = (
+                p99 is not None
+                and not stats["skipped_ticks"]
+                and p99 <= stats["period_ms"] * (1.0 + self.late_fraction)
+            )
+            report[name] = stats
+        return report
+
+    def reset_health(self):
+        for drone in list(self.drones.values()):
+            drone.cadence.reset()
+
+    def _stagger(self, now):
+        # Called with _lock held at start(): build the heap with each rate
+        # group's phases spread evenly over its period, starting at now.
+        groups = {}
+        for drone in self.drones.values():
+            groups.setdefault(drone.period, []).append(drone)
+        heap = []
+        for period, members in groups.items():
+            step = period / len(members)
+            for i, drone in enumerate(members):
+                drone.ticker.start(now + i * step)
+                drone.cadence.reset()
+                heap.append((drone.ticker.deadline, id(drone), drone))
+        heapq.heapify(heap)
+        self._heap = heap
+
+    def _place(self, drone, now):
+        # Called with _lock held: first deadline for a drone added while
+        # running, in the widest gap between its rate group's phases.
+        period = drone.period
+        phases = sorted((entry[0] - now) % period for entry in self._heap if entry[2].period == period)
+        offset = 0.0
+        if phases:
+            gaps = [b - a for a, b in zip(phases, phases[1:] + [phases[0] + period])]
+            widest = max(range(len(gaps)), key=gaps.__getitem__)
+            offset = (phases[widest] + gaps[widest] / 2) % period
+        drone.ticker.start(now + offset)
+        heapq.heappush(self._heap, (drone.ticker.deadline, id(drone), drone))
+
+    def _loop(self):
+        sock = self._sock
+        while self._running:
+            with self._lock:
+                heap = self._heap
+                if not heap:
+                    deadline = None
+                else:
+                    deadline, _, drone = heap[0]
+            if deadline is None:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                if self._wake.wait(remaining):
+                    # Drones were added or removed; re-read the heap.
+                    self._wake.clear()
+                    continue
+            with self._lock:
+                if heap is not self._heap or not heap or heap[0][2] is not drone:
+                    continue
+                payload = drone.encoder.next_packet()
+                try:
+                    sock.sendto(payload, drone.addr)
+                except OSError:
+                    drone.send_errors += 1
+                else:
+                    if self.recorder is not None:
+                        self.recorder.record(time.monotonic(), drone.encoder.proto, payload, drone.channel)
+                now = time.monotonic()
+                drone.cadence.record_send(now)
+                drone.ticker.check_late(now)
+                heapq.heapreplace(heap, (drone.ticker.advance(), id(drone), drone))
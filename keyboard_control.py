@@ -10,6 +10,7 @@ import time
 from getkey import getkey, keys
 
 from drone_ctrl.controller import DroneController, LEGACY, NEW
+from drone_ctrl.transport import Esp32HttpTransport
 
 try:
     from wifi_cam_streamer.streamer import ThreadedHTTPServer, UdpStreamHandler
@@ -38,6 +39,14 @@ def main():
     parser.add_argument("--port", type=int, default=8090, help="Drone UDP control port")
     parser.add_argument("--proto", choices=[LEGACY, NEW], default=LEGACY, help="Packet format")
     parser.add_argument("--rate", type=float, default=25.0, help="Control send rate (Hz)")
+    parser.add_argument("--immediate", action="store_true", help="Send right away when the state changes")
+    parser.add_argument(
+        "--min-spacing", type=float, default=0.01, help="Minimum seconds between immediate sends (default: 0.01)"
+    )
+    parser.add_argument(
+        "--esp32", action="store_true", help="Control an ESP32 retrofit over HTTP /control instead of UDP"
+    )
+    parser.add_argument("--esp32-port", type=int, default=80, help="ESP32 HTTP port (default: 80)")
     parser.add_argument("--stream", action="store_true", help="Enable UDP MJPEG stream")
     parser.add_argument("--stream-port", type=int, default=45100, help="HTTP stream port")
     parser.add_argument("--stream-udp-port", type=int, default=8080, help="UDP MJPEG source port")
@@ -45,7 +54,16 @@ def main():
     parser.add_argument("--stream-keepalive", type=float, default=1.0, help="Stream keepalive seconds")
     args = parser.parse_args()
 
-    controller = DroneController(args.ip, args.port, proto=args.proto, rate_hz=args.rate)
+    transport = Esp32HttpTransport(args.ip, args.esp32_port) if args.esp32 else None
+    controller = DroneController(
+        args.ip,
+        args.port,
+        proto=args.proto,
+        rate_hz=args.rate,
+        immediate=args.immediate,
+        min_spacing=args.min_spacing,
+        transport=transport,
+    )
     controller.set_axes(0.0, 0.0, 0.0, 0.0, normalized=True)
     controller.start()
 
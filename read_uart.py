@@ -2,7 +2,7 @@
 # However, you need this program to make sense of the output, as you need to read it in frames of 8 bytes or something like that.
 
 # ls -l /dev/cu.usbserial-1130
-# python3 read_uart.py
+# python3 -m drone_ctrl.read_uart --port /dev/cu.usbserial-1130
 # in terminal 2, run -> python3 wifi_cam_streamer/send_takeoff.py --ip 192.168.4.153 --ports 8090 --proto both --duration 1.0
 # read the output from terminal 1
 
@@ -150,22 +150,237 @@
 #     time.sleep(SCAN_INTERVAL)
 
 
-import serial
+import argparse
+import sys
+import time
+from collections import Counter, namedtuple
 
-PORT = "/dev/cu.wchusbserial10"
+from .controller import DroneController, LEGACY, NEW
+
+# usage: python3 -m drone_ctrl.read_uart --port /dev/cu.wchusbserial10 [--baud 19200]
+#        python3 -m drone_ctrl.read_uart --file capture.bin
+
+DEFAULT_PORT = "/dev/cu.wchusbserial10"
 BAUD = 19200
-FRAME_LEN = 8
+LEGACY_LEN = 8
+NEW_LEN = 20
+
+UartFrame = namedtuple("UartFrame", "proto roll pitch throttle yaw flags flags2 raw")
+
+
+def legacy_checksum_ok(frame):
+    return DroneController._checksum_legacy(frame) == frame[6]
+
+
+def new_checksum_ok(frame):
+    return DroneController._checksum_new(frame) == frame[18]
+
+
+class UartFrameDecoder:
+    # Byte-stream decoder for the 0x66 ... 0x99 control frames. feed() takes
+    # chunks of any size; a candidate frame is accepted only if its end
+    # marker and checksum check out, otherwise the decoder skips one byte
+    # and hunts for the next 0x66, so a dropped byte or a mid-frame start
+    # costs at most one frame. 0x66 0x14 is tried as the 20-byte format
+    # first, then as a legacy frame whose roll happens to be 0x14.
+    def __init__(self, protos=(LEGACY, NEW), verify=True):
+        self.legacy = LEGACY in protos
+        self.new = NEW in protos
+        self.verify = verify
+        self._buf = bytearray()
+        self.bytes = 0
+        self.frames = Counter()
+        self.bad_checksum = 0
+        self.skipped = 0
+        self.resyncs = 0
+        self._in_sync = False
+
+    def feed(self, data):
+        self.bytes += len(data)
+        buf = self._buf
+        buf += data
+        out = []
+        pos = 0
+        end = len(buf)
+        while True:
+            start = buf.find(0x66, pos)
+            if start < 0:
+                self._skip(end - pos)
+                pos = end
+                break
+            if start > pos:
+                self._skip(start - pos)
+                pos = start
+            frame, wait = self._match(buf, pos, end)
+            if wait:
+                break
+            if frame is None:
+                self._skip(1)
+                pos += 1
+                continue
+            self._in_sync = True
+            out.append(frame)
+            pos += len(frame.raw)
+        del buf[:pos]
+        return out
+
+    def _skip(self, count):
+        if count <= 0:
+            return
+        if self._in_sync:
+            self.resyncs += 1
+            self._in_sync = False
+        self.skipped += count
+
+    def _match(self, buf, pos, end):
+        # Returns (frame or None, need_more_bytes).
+        available = end - pos
+        if available < 2:
+            # Whichever formats are enabled, the byte after 0x66 decides.
+            return None, True
+        if self.new and buf[pos + 1] == 0x14:
+            if available < NEW_LEN:
+                return None, True
+            raw = bytes(buf[pos:pos + NEW_LEN])
+            if raw[19] == 0x99:
+                if not self.verify or new_checksum_ok(raw):
+                    self.frames[NEW] += 1
+                    return UartFrame(NEW, raw[2], raw[3], raw[4], raw[5], raw[6], raw[7], raw), False
+                self.bad_checksum += 1
+        if self.legacy:
+            if available < LEGACY_LEN:
+                return None, True
+            raw = bytes(buf[pos:pos + LEGACY_LEN])
+            if raw[7] == 0x99:
+                if not self.verify or legacy_checksum_ok(raw):
+                    self.frames[LEGACY] += 1
+                    return UartFrame(LEGACY, raw[1], raw[2], raw[3], raw[4], raw[5], 0, raw), False
+                self.bad_checksum += 1
+        return None, False
+
+    def stats(self):
+        return {
+            "bytes": self.bytes,
+            "frames": sum(self.frames.values()),
+            "legacy": self.frames[LEGACY],
+            "new": self.frames[NEW],
+            "bad_checksum": self.bad_checksum,
+            "skipped_bytes": self.skipped,
+            "resyncs": self.resyncs,
+        }
+
 
-def hexdump(b: bytes) -> str:
+def hexdump(b):
     return " ".join(f"{x:02x}" for x in b)
 
-with serial.Serial(PORT, BAUD, timeout=1) as ser:
-    print(f"Sniffing {PORT} @ {BAUD} baud, {FRAME_LEN}-byte frames")
-    while True:
-        frame = ser.read(FRAME_LEN)
-        if len(frame) < FRAME_LEN:
-            continue
-        print(hexdump(frame), frame)
+
+class FrameSummary:
+    # Aggregates decoded frames between reports: counts per distinct frame
+    # instead of one line per frame.
+    def __init__(self, top=5):
+        self.top = top
+        self.reset()
+
+    def reset(self):
+        self.distinct = Counter()
+        self.count = 0
+        self.bytes = 0
+        self.last = None
+
+    def add(self, frames, nbytes):
+        self.bytes += nbytes
+        for frame in frames:
+            self.distinct[frame.raw] += 1
+        if frames:
+            self.count += len(frames)
+            self.last = frames[-1]
+
+    def report(self, decoder, elapsed, busy):
+        stats = decoder.stats()
+        lines = [
+            "%5.1f frames/s  %7.0f B/s  total=%d legacy=%d new=%d bad_chk=%d skipped=%dB resyncs=%d cpu=%.1f%%"
+            % (
+                self.count / elapsed,
+                self.bytes / elapsed,
+                stats["frames"],
+                stats["legacy"],
+                stats["new"],
+                stats["bad_checksum"],
+                stats["skipped_bytes"],
+                stats["resyncs"],
+                100.0 * busy / elapsed,
+            )
+        ]
+        last = self.last
+        if last is not None:
+            lines.append(
+                "  last: %s roll=%d pitch=%d throttle=%d yaw=%d flags=%02x flags2=%02x"
+                % (last.proto, last.roll, last.pitch, last.throttle, last.yaw, last.flags, last.flags2)
+            )
+        for raw, count in self.distinct.most_common(self.top):
+            lines.append("  %6d x %s" % (count, hexdump(raw)))
+        return "\n".join(lines)
+
+
+def open_source(args):
+    if args.file:
+        return sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+    import serial
+
+    return serial.Serial(args.port, args.baud, timeout=0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sniff and decode E88 control frames on a UART")
+    parser.add_argument("--port", default=DEFAULT_PORT, help="Serial device (default: %s)" % DEFAULT_PORT)
+    parser.add_argument("--baud", type=int, default=BAUD, help="Baud rate (default: %d)" % BAUD)
+    parser.add_argument("--file", help="Decode a raw byte capture instead ('-' for stdin)")
+    parser.add_argument("--proto", choices=[LEGACY, NEW, "both"], default="both", help="Frame formats to accept")
+    parser.add_argument("--no-verify", dest="verify", action="store_false", help="Accept frames with bad checksums")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between summaries")
+    parser.add_argument("--frames", action="store_true", help="Also print every decoded frame")
+    parser.add_argument("--chunk", type=int, default=4096, help="Read size in bytes")
+    args = parser.parse_args()
+
+    protos = (LEGACY, NEW) if args.proto == "both" else (args.proto,)
+    decoder = UartFrameDecoder(protos, verify=args.verify)
+    summary = FrameSummary()
+    source = open_source(args)
+    where = args.file or "%s @ %d baud" % (args.port, args.baud)
+    print("Decoding %s (%s frames)" % (where, "/".join(protos)))
+
+    started = last_report = time.monotonic()
+    busy = 0.0
+    try:
+        while True:
+            data = source.read(args.chunk)
+            if args.file and not data:
+                break
+            t0 = time.monotonic()
+            frames = decoder.feed(data)
+            summary.add(frames, len(data))
+            busy += time.monotonic() - t0
+            if args.frames:
+                for frame in frames:
+                    print(hexdump(frame.raw), frame)
+            now = time.monotonic()
+            if now - last_report >= args.interval:
+                print(summary.report(decoder, now - last_report, busy))
+                summary.reset()
+                busy = 0.0
+                last_report = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+    now = time.monotonic()
+    print(summary.report(decoder, max(now - last_report, 1e-6), busy))
+    print("done in %.2fs: %s" % (now - started, decoder.stats()))
+
+
+if __name__ == "__main__":
+    main()
 
 # after fixing the baud rate, the output is more clean
 # ➜  drone_ctrl git:(main) ✗ python3 read_uart.py
@@ -0,0 +1,199 @@
+# Flight recorder for transmitted control packets.
+#
+# File layout: one 32-byte header (RECORD_MAGIC, wall-clock and monotonic
+# time the file was created) followed by fixed 32-byte RECORD records, so a
+# log of any length can be mapped straight into a NumPy array. Reopening an
+# existing log appends to it, starting with an anchor record (proto code
+# ANCHOR_CODE, packet = wall-clock time as a double) that ties that
+# session's monotonic timestamps to the wall clock, since the header's
+# anchor only holds for the boot that created the file.
+#
+# usage:
+# recorder = FlightRecorder("flight.e88log")
+# ctrl = DroneController(ip, recorder=recorder)
+# ...
+# log = FlightLog("flight.e88log")
+# log.first_emergency(), log.between(t0, t1), log.stick_histogram()
+import collections
+import os
+import struct
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .controller import LEGACY, NEW, ONESHOT_BITS, ONESHOT_KEYS
+
+RECORD_MAGIC = b"E88REC1\x00"
+HEADER = struct.Struct("<8sdd8x")
+RECORD = struct.Struct("<dBBH20s")
+RECORD_SIZE = RECORD.size
+PROTO_CODES = {LEGACY: 0, NEW: 1}
+ANCHOR_CODE = 0xFF
+ANCHOR_WALL = struct.Struct("<d")
+
+# Offsets of (roll, pitch, throttle, yaw, flags) inside each packet format.
+LEGACY_FIELDS = (1, 2, 3, 4, 5)
+NEW_FIELDS = (2, 3, 4, 5, 6)
+AXES = ("roll", "pitch", "throttle", "yaw")
+
+
+class FlightRecorder:
+    # record() only appends a tuple to a deque, so the send path never
+    # touches the file; a background thread packs and writes everything
+    # queued every flush_interval seconds.
+    def __init__(self, path, flush_interval=0.25):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.records = 0
+        self.write_errors = 0
+        self._queue = collections.deque()
+        self._file = open(path, "ab")
+        wall, monotonic = time.time(), time.monotonic()
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(RECORD_MAGIC, wall, monotonic))
+        else:
+            wall = ANCHOR_WALL.pack(wall)
+            self._file.write(RECORD.pack(monotonic, ANCHOR_CODE, len(wall), 0, wall))
+        self._file.flush()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, timestamp, proto, packet, channel=0):
+        self._queue.append((timestamp, proto, packet, channel))
+
+    def flush(self):
+        queue = self._queue
+        if not queue:
+            return 0
+        chunk = bytearray()
+        count = 0
+        while queue:
+            timestamp, proto, packet, channel = queue.popleft()
+            chunk += RECORD.pack(timestamp, PROTO_CODES[proto], len(packet), channel, bytes(packet))
+            count += 1
+        try:
+            self._file.write(chunk)
+            self._file.flush()
+        except OSError:
+            self.write_errors += 1
+            return 0
+        self.records += count
+        return count
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=2.0)
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+class FlightLog:
+    # Read side: maps the whole log as a structured array. Queries return
+    # NumPy arrays or record slices; nothing is parsed record by record.
+    # A log appended to over several sessions is loaded into memory instead,
+    # with the anchor records dropped and every session's timestamps shifted
+    # onto the header's monotonic timeline, so t stays comparable across
+    # reboots and wall_time() holds for every record.
+    def __init__(self, path):
+        if np is None:
+            raise RuntimeError("FlightLog needs numpy (python3 -m pip install numpy)")
+        with open(path, "rb") as handle:
+            magic, self.opened_wall, self.opened_monotonic = HEADER.unpack(handle.read(HEADER.size))
+        if magic != RECORD_MAGIC:
+            raise ValueError("%s: not a flight recorder log" % path)
+        self.dtype = np.dtype(
+            [("t", "<f8"), ("proto", "u1"), ("length", "u1"), ("channel", "<u2"), ("packet", "u1", (20,))]
+        )
+        assert self.dtype.itemsize == RECORD_SIZE
+        self.path = path
+        count = (os.path.getsize(path) - HEADER.size) // RECORD_SIZE
+        if count > 0:
+            self.records = np.memmap(path, dtype=self.dtype, mode="r", offset=HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+        anchors = np.flatnonzero(self.records["proto"] == ANCHOR_CODE)
+        self.sessions = len(anchors) + 1
+        if len(anchors):
+            self.records = self._rebase(self.records, anchors)
+        self.t = self.records["t"]
+        self._sorted = bool(count < 2 or np.all(self.t[1:] >= self.t[:-1]))
+
+    def _rebase(self, records, anchors):
+        walls = np.ascontiguousarray(records["packet"][anchors, :ANCHOR_WALL.size]).view("<f8").ravel()
+        shifts = (walls - records["t"][anchors]) - (self.opened_wall - self.opened_monotonic)
+        # Session 0 is the header's; record i belongs to the last anchor before it.
+        session = np.searchsorted(anchors, np.arange(len(records)), side="right")
+        rebased = np.array(records)
+        rebased["t"] += np.concatenate(([0.0], shifts))[session]
+        return np.delete(rebased, anchors)
+
+    def __len__(self):
+        return len(self.records)
+
+    def wall_time(self, t):
+        # Monotonic record timestamps to Unix time, via the header anchor.
+        return self.opened_wall + (t - self.opened_monotonic)
+
+    def between(self, t0=None, t1=None, channel=None):
+        t = self.t
+        if self._sorted and channel is None:
+            start = 0 if t0 is None else int(np.searchsorted(t, t0, side="left"))
+            stop = len(t) if t1 is None else int(np.searchsorted(t, t1, side="right"))
+            return self.records[start:stop]
+        mask = np.ones(len(t), dtype=bool)
+        if t0 is not None:
+            mask &= t >= t0
+        if t1 is not None:
+            mask &= t <= t1
+        if channel is not None:
+            mask &= self.records["channel"] == channel
+        return self.records[mask]
+
+    def fields(self, records=None):
+        # Columns roll, pitch, throttle, yaw, flags as an N x 5 uint8 array,
+        # read from the right offsets for each record's protocol.
+        if records is None:
+            records = self.records
+        packet = records["packet"]
+        new = records["proto"] == PROTO_CODES[NEW]
+        return np.where(new[:, None], packet[:, list(NEW_FIELDS)], packet[:, list(LEGACY_FIELDS)])
+
+    def flag_set(self, key, records=None):
+        # Boolean column: one-shot flag key held high in each record.
+        if records is None:
+            records = self.records
+        bit_legacy, bit_new = ONESHOT_BITS[ONESHOT_KEYS.index(key)]
+        flags = self.fields(records)[:, 4]
+        new = records["proto"] == PROTO_CODES[NEW]
+        return (flags & np.where(new, bit_new, bit_legacy)) != 0
+
+    def first_emergency(self, t0=None, t1=None, channel=None):
+        # First record with the emergency flag set, or None.
+        records = self.between(t0, t1, channel)
+        hits = np.flatnonzero(self.flag_set("emergency", records))
+        if not len(hits):
+            return None
+        return records[hits[0]]
+
+    def stick_histogram(self, t0=None, t1=None, channel=None):
+        # 256-bin count of each stick's raw byte value over the range.
+        columns = self.fields(self.between(t0, t1, channel))
+        return {name: np.bincount(columns[:, i], minlength=256) for i, name in enumerate(AXES)}
+
+    def intervals(self, t0=None, t1=None, channel=None):
+        return np.diff(self.between(t0, t1, channel)["t"])
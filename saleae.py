@@ -0,0 +1,323 @@
+# Reader and protocol decoders for the Saleae Logic 2 .sal captures in
+# LogicAnalyzer/. A .sal is a zip of meta.json plus one digital-N.bin per
+# channel. The version 3 digital file (type 100) is, little-endian and packed:
+#
+#   header  "<SALEAE>", u32 version, u32 type, u8 (1), f64 sample rate,
+#           u64 capture start (unix ms), f64 fractional ms, u16 (0),
+#           u64 chunk count
+#   chunk   u64 first sample, u64 end sample, u8 level, u8 (0), u64 length,
+#           then `length` bytes of run lengths
+#
+# Each run length is a big-endian varint: the first byte carries 6 bits
+# with 0x40 as "more follows", later bytes carry 7 bits with 0x80 as "more
+# follows"; the run is value + 1 samples. Runs alternate level starting at
+# the chunk's level, every run ends in a transition except the one that
+# ends the capture, and chunks are back to back.
+#
+#   python3 -m drone_ctrl.saleae LogicAnalyzer/Botton2.sal
+#   python3 -m drone_ctrl.saleae LogicAnalyzer/Botton2.sal spi --clk 5 --data 6 --cs 4
+#   python3 -m drone_ctrl.saleae capture.sal uart --channel 2 [--baud 19200]
+import argparse
+import json
+import struct
+import time
+import zipfile
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from .baud_scan import Capture, _receiver_chain, estimate_baud, scan, uart_decode
+from .read_uart import FrameSummary, UartFrameDecoder
+
+SAL_MAGIC = b"<SALEAE>"
+DIGITAL_TYPE = 100
+HEADER = struct.Struct("<8sIIBdQdHQ")
+CHUNK = struct.Struct("<QQBBQ")
+BATCH_BYTES = 1 << 22
+
+# nRF24L01-compatible commands, which the XN297 shares, plus its own 0xfc/0xfd.
+SPI_COMMANDS = {
+    0x50: "ACTIVATE",
+    0x60: "R_RX_PL_WID",
+    0x61: "R_RX_PAYLOAD",
+    0xA0: "W_TX_PAYLOAD",
+    0xB0: "W_TX_PAYLOAD_NOACK",
+    0xE1: "FLUSH_TX",
+    0xE2: "FLUSH_RX",
+    0xE3: "REUSE_TX_PL",
+    0xFC: "CE_FSPI_OFF",
+    0xFD: "CE_FSPI_ON",
+    0xFF: "NOP",
+}
+
+SpiTransaction = namedtuple("SpiTransaction", "start data miso")
+
+
+def spi_command_name(byte):
+    if byte < 0x20:
+        return "R_REGISTER 0x%02x" % byte
+    if byte < 0x40:
+        return "W_REGISTER 0x%02x" % (byte & 0x1F)
+    return SPI_COMMANDS.get(byte, "0x%02x" % byte)
+
+
+def decode_runs(payload):
+    # Run lengths (in samples) of a concatenation of whole chunk payloads.
+    # Where each varint starts depends on the one before it, so token
+    # starts are found with the same pointer-doubling walk baud_scan uses
+    # for UART start bits, and the values are summed per token.
+    data = np.frombuffer(payload, dtype=np.uint8)
+    count = len(data)
+    if not count:
+        return np.empty(0, dtype=np.int64)
+    index = np.arange(count)
+    clear = np.where(data & 0x80 == 0, index, count)
+    first_clear = np.minimum.accumulate(clear[::-1])[::-1]
+    after = np.append(first_clear[1:], count)
+    end = np.where(data & 0x40 != 0, after, index)
+    starts = _receiver_chain(np.minimum(end + 1, count))
+    ends = end[starts]
+    if ends[-1] >= count:
+        raise ValueError("truncated run-length data")
+    is_start = np.zeros(count, dtype=bool)
+    is_start[starts] = True
+    token = np.cumsum(is_start) - 1
+    bits = np.where(is_start, data & 0x3F, data & 0x7F).astype(np.uint64)
+    shifts = (7 * (ends[token] - index)).astype(np.uint64)
+    values = np.add.reduceat(bits << shifts, starts)
+    return values.astype(np.int64) + 1
+
+
+def read_digital(stream):
+    # Returns (sample rate, start time in unix seconds, initial level, edge
+    # sample indices, total samples). Chunks are read one at a time and
+    # decoded in batches of about BATCH_BYTES, so memory stays proportional
+    # to the number of edges, not to the file.
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError("short digital header")
+    magic, version, kind, _, sample_rate, start_ms, start_frac, _, chunks = HEADER.unpack(header)
+    if magic != SAL_MAGIC:
+        raise ValueError("not a Saleae binary file")
+    if version != 3 or kind != DIGITAL_TYPE:
+        raise ValueError("unsupported Saleae file version %d type %d" % (version, kind))
+
+    edges = []
+    initial = None
+    batch = []
+    batch_start = position = 0
+
+    def flush():
+        runs = decode_runs(b"".join(batch))
+        ends = batch_start + np.cumsum(runs)
+        if len(ends) and ends[-1] != position:
+            raise ValueError("run lengths do not add up to the chunk bounds")
+        edges.append(ends)
+        del batch[:]
+
+    size = 0
+    for _ in range(chunks):
+        first, end, level, _, length = CHUNK.unpack(stream.read(CHUNK.size))
+        if initial is None:
+            initial = level
+            position = first
+        elif first != position:
+            raise ValueError("chunks are not contiguous at sample %d" % first)
+        if not batch:
+            batch_start = first
+        batch.append(stream.read(length))
+        position = end
+        size += length
+        if size >= BATCH_BYTES:
+            flush()
+            size = 0
+    if batch:
+        flush()
+    edges = np.concatenate(edges) if edges else np.empty(0, dtype=np.int64)
+    # The last run ends the capture, not the level.
+    return sample_rate, start_ms / 1e3 + start_frac / 1e6, initial or 0, edges[:-1], position
+
+
+class SalCapture:
+    # Opens the zip once; each channel is decoded on first use and cached.
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+        names = self.zip.namelist()
+        self.meta = json.loads(self.zip.read("meta.json")) if "meta.json" in names else {}
+        self.channels = sorted(
+            int(name[len("digital-"):-len(".bin")])
+            for name in names
+            if name.startswith("digital-") and name.endswith(".bin")
+        )
+        self.sample_rate = None
+        self.started_at = None
+        self._captures = {}
+
+    def channel(self, index):
+        capture = self._captures.get(index)
+        if capture is None:
+            with self.zip.open("digital-%d.bin" % index) as stream:
+                rate, started_at, initial, edges, total = read_digital(stream)
+            self.sample_rate = rate
+            self.started_at = started_at
+            capture = Capture(edges / rate, initial, total / rate, rate)
+            self._captures[index] = capture
+        return capture
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def level_at(capture, times):
+    # Line level just before each time; data that changes on the very
+    # sample of a clock edge still reads as its old value.
+    return (capture.initial ^ (np.searchsorted(capture.edges, times, side="left") & 1)).astype(np.uint8)
+
+
+def spi_decode(clk, data, cs=None, miso=None, mode=0, gap=None):
+    # Whole bytes per transaction, MSB first. Transactions are delimited by
+    # chip select going low, or without one by clock gaps longer than `gap`
+    # seconds (default: eight median clock periods). `data` is MOSI, or the
+    # shared data line of a 3-wire bus such as the XN297's.
+    cpol, cpha = mode >> 1 & 1, mode & 1
+    sample_level = 1 if cpol == cpha else 0
+    after = clk.initial ^ (np.arange(1, len(clk.edges) + 1) & 1)
+    times = clk.edges[after == sample_level]
+    if not len(times):
+        return []
+
+    if cs is not None:
+        active = level_at(cs, times) == 0
+        times = times[active]
+        cs_after = cs.initial ^ (np.arange(1, len(cs.edges) + 1) & 1)
+        transaction = np.searchsorted(cs.edges[cs_after == 0], times, side="right")
+    else:
+        intervals = np.diff(times)
+        if gap is None:
+            gap = 8 * float(np.median(intervals)) if len(intervals) else 0.0
+        transaction = np.concatenate(([0], np.cumsum(intervals > gap)))
+    if not len(times):
+        return []
+
+    firsts = np.flatnonzero(np.diff(transaction, prepend=-1))
+    lengths = np.diff(np.append(firsts, len(times)))
+    position = np.arange(len(times)) - np.repeat(firsts, lengths)
+    keep = position < np.repeat(lengths // 8 * 8, lengths)
+    whole = lengths >= 8
+    sizes = (lengths // 8)[whole]
+    bounds = np.cumsum(sizes)[:-1]
+    starts = times[firsts[whole]].tolist()
+    mosi_bytes = np.split(np.packbits(level_at(data, times[keep])), bounds)
+    if miso is not None:
+        miso_bytes = [chunk.tobytes() for chunk in np.split(np.packbits(level_at(miso, times[keep])), bounds)]
+    else:
+        miso_bytes = [None] * len(starts)
+    return [
+        SpiTransaction(start, chunk.tobytes(), received)
+        for start, chunk, received in zip(starts, mosi_bytes, miso_bytes)
+    ]
+
+
+def control_frames(chunks):
+    # Runs byte chunks (a UART stream, or SPI transactions in order)
+    # through the same decoder read_uart.py uses; returns (frames, decoder).
+    decoder = UartFrameDecoder()
+    frames = []
+    for chunk in chunks:
+        frames += decoder.feed(chunk)
+    return frames, decoder
+
+
+def describe_channels(sal):
+    lines = []
+    for index in sal.channels:
+        capture = sal.channel(index)
+        edges = capture.edges
+        if not len(edges):
+            lines.append("  ch%d  constant %d" % (index, capture.initial))
+            continue
+        estimate = estimate_baud(capture)
+        lines.append(
+            "  ch%d  %8d edges  %8.3f-%8.3fs  shortest pulses ~%s Hz"
+            % (index, len(edges), edges[0], edges[-1], "%.0f" % estimate if estimate else "-")
+        )
+    return "\n".join(lines)
+
+
+def _print_frames(frames, decoder, nbytes, duration, busy):
+    summary = FrameSummary()
+    summary.add(frames, nbytes)
+    print(summary.report(decoder, duration, busy))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode Saleae Logic 2 .sal captures")
+    parser.add_argument("capture", help=".sal file")
+    sub = parser.add_subparsers(dest="command")
+
+    uart = sub.add_parser("uart", help="Decode a UART channel into control frames")
+    uart.add_argument("--channel", type=int, required=True)
+    uart.add_argument("--baud", type=int, help="Baud rate (default: detect with baud_scan)")
+    uart.add_argument("--framing", default="8N1")
+    uart.add_argument("--inverted", action="store_true")
+
+    spi = sub.add_parser("spi", help="Decode an SPI bus (the E88 RF chip: clk 5, data 6, cs 4)")
+    spi.add_argument("--clk", type=int, default=5)
+    spi.add_argument("--data", type=int, default=6, help="MOSI, or the shared line of a 3-wire bus")
+    spi.add_argument("--cs", type=int, default=4, help="Chip select channel, -1 to split on clock gaps")
+    spi.add_argument("--miso", type=int)
+    spi.add_argument("--mode", type=int, choices=range(4), default=0)
+    spi.add_argument("--top", type=int, default=12, help="Distinct transactions to print")
+    args = parser.parse_args()
+
+    with SalCapture(args.capture) as sal:
+        started = time.perf_counter()
+        if args.command is None:
+            print(describe_channels(sal))
+        elif args.command == "uart":
+            capture = sal.channel(args.channel)
+            loaded = time.perf_counter()
+            baud, framing, inverted = args.baud, args.framing, args.inverted
+            if baud is None:
+                best = scan(capture)[0]
+                baud, framing, inverted = best["baud"], best["framing"], best["inverted"]
+                print("detected %d %s%s" % (baud, framing, " inverted" if inverted else ""))
+            data, framing_errors, parity_errors = uart_decode(capture, baud, framing, inverted)
+            frames, decoder = control_frames([data.tobytes()])
+            busy = time.perf_counter() - loaded
+            print(
+                "%d edges loaded in %.0f ms, %d bytes (%d framing / %d parity errors)"
+                % (len(capture.edges), (loaded - started) * 1e3, len(data), framing_errors, parity_errors)
+            )
+            _print_frames(frames, decoder, len(data), capture.duration, busy)
+        else:
+            clk = sal.channel(args.clk)
+            data = sal.channel(args.data)
+            cs = sal.channel(args.cs) if args.cs >= 0 else None
+            miso = sal.channel(args.miso) if args.miso is not None else None
+            loaded = time.perf_counter()
+            transactions = spi_decode(clk, data, cs, miso, args.mode)
+            frames, decoder = control_frames(t.data for t in transactions)
+            busy = time.perf_counter() - loaded
+            nbytes = sum(len(t.data) for t in transactions)
+            print(
+                "%d clock edges loaded in %.0f ms, %d transactions, %d bytes decoded in %.0f ms"
+                % (len(clk.edges), (loaded - started) * 1e3, len(transactions), nbytes, busy * 1e3)
+            )
+            commands = Counter(t.data[0] for t in transactions)
+            names = ("%s x%d" % (spi_command_name(c), n) for c, n in commands.most_common())
+            print("commands: " + ", ".join(names))
+            for payload, count in Counter(t.data for t in transactions).most_common(args.top):
+                print("  %6d x %-20s %s" % (count, spi_command_name(payload[0]), payload.hex(" ")))
+            _print_frames(frames, decoder, nbytes, clk.duration, busy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import time
+
+
+def ms(value, digits=3):
+    # Seconds to rounded milliseconds for stats output; None passes through.
+    return round(value * 1e3, digits) if value is not None else None
+
+
+class IntervalHistogram:
+    # Fixed-bucket histogram of inter-packet intervals, cheap enough to
+    # update on every tick of the send loop.
+    def __init__(self, period, bucket_s=0.001, buckets=200):
+        self.period = float(period)
+        self.bucket_s = bucket_s
+        self.reset()
+        self._buckets = buckets
+
+    def reset(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.late = 0
+        self.skipped = 0
+        self._last = None
+
+    def record_send(self, now):
+        last = self._last
+        self._last = now
+        if last is None:
+            return
+        self.record(now - last)
+
+    def record(self, interval):
+        bucket = min(int(interval / self.bucket_s), self._buckets)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += interval
+        if self.min is None or interval < self.min:
+            self.min = interval
+        if self.max is None or interval > self.max:
+            self.max = interval
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= target:
+                return (bucket + 0.5) * self.bucket_s
+        return self.max
+
+    def snapshot(self):
+        return {
+            "period_ms": ms(self.period),
+            "intervals": self.count,
+            "mean_ms": ms(self.total / self.count) if self.count else None,
+            "min_ms": ms(self.min),
+            "max_ms": ms(self.max),
+            "p50_ms": ms(self.percentile(0.50)),
+            "p99_ms": ms(self.percentile(0.99)),
+            "late_ticks": self.late,
+            "skipped_ticks": self.skipped,
+            "histogram_ms": {
+                int(bucket * self.bucket_s * 1e3): count for bucket, count in sorted(self.counts.items())
+            },
+        }
+
+
+class DeadlineTicker:
+    # Absolute tick timeline on the monotonic clock: tick n is due at
+    # start + n * period no matter how long the work between ticks took, so
+    # the rate does not drift. A late tick catches up, but never closer than
+    # min_gap_fraction of a period to the previous one, and a tick that is
+    # already a full period overdue is skipped rather than sent in a burst.
+    def __init__(self, rate_hz, histogram=None, late_fraction=0.25, min_gap_fraction=0.5):
+        self.period = 1.0 / float(rate_hz)
+        self.histogram = histogram
+        self.late_threshold = self.period * late_fraction
+        self.min_gap = self.period * min_gap_fraction
+        self._next = None
+        self._pending = False
+
+    def start(self, now=None):
+        self._next = time.monotonic() if now is None else now
+        return self._next
+
+    @property
+    def deadline(self):
+        return self._next
+
+    def advance(self):
+        # Moves to the next deadline and returns it.
+        self._next += self.period
+        now = time.monotonic()
+        if now - self._next >= self.period:
+            missed = int((now - self._next) / self.period)
+            self._next += missed * self.period
+            if self.histogram is not None:
+                self.histogram.skipped += missed
+        return self._next
+
+    def wait(self, last_send=None, event=None, not_before=None):
+        # With an event, returns None as soon as it is set; the tick stays
+        # pending and the next wait() resumes towards the same deadline.
+        # not_before holds the tick back further, e.g. for spacing from
+        # packets sent between ticks.
+        if not self._pending:
+            self.advance()
+            self._pending = True
+        deadline = self._next
+        wake = deadline
+        if last_send is not None:
+            wake = max(deadline, last_send + self.min_gap)
+        if not_before is not None:
+            wake = max(wake, not_before)
+        remaining = wake - time.monotonic()
+        if remaining > 0:
+            if event is None:
+                time.sleep(remaining)
+            elif event.wait(remaining):
+                return None
+        self._pending = False
+        return self.check_late()
+
+    def check_late(self, now=None):
+        # Lateness of the current deadline, counted in the histogram when it
+        # is past late_threshold. For callers that do their own waiting.
+        lateness = (time.monotonic() if now is None else now) - self._next
+        if lateness > self.late_threshold and self.histogram is not None:
+            self.histogram.late += 1
+        return lateness
@@ -0,0 +1,71 @@
+import asyncio
+import socket
+
+import pytest
+
+from ..async_controller import AsyncDroneController
+
+
+def _listener():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(1.0)
+    return sock
+
+
+def test_restart_after_close_keeps_the_remote_address():
+    sock = _listener()
+
+    async def run():
+        controller = AsyncDroneController("127.0.0.1", sock.getsockname()[1], rate_hz=50)
+        for _ in range(2):
+            await controller.start()
+            await controller.takeoff()
+            await controller.close()
+
+    try:
+        asyncio.run(run())
+        assert sock.recv(64)
+    finally:
+        sock.close()
+
+
+def test_oneshot_before_start_raises():
+    async def run():
+        controller = AsyncDroneController("127.0.0.1", 9, rate_hz=50)
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(controller.takeoff(), 1.0)
+        assert controller.encoder.state.version == 0
+
+    asyncio.run(run())
+
+
+class _FailingTransport:
+    # Lets the first packet through, then fails like a downed interface.
+    def __init__(self):
+        self.sent = 0
+
+    def sendto(self, payload, addr=None):
+        self.sent += 1
+        if self.sent > 1:
+            raise OSError("network is down")
+
+
+def test_send_errors_are_counted_and_the_stream_keeps_ticking():
+    async def run():
+        transport = _FailingTransport()
+        controller = AsyncDroneController("127.0.0.1", 9, rate_hz=50, transport=transport)
+        await controller.start()
+        await asyncio.wait_for(controller.takeoff(), 1.0)
+        assert controller.running
+        assert controller.errors == transport.sent - 1
+        assert isinstance(controller.last_error, OSError)
+        await controller.close()
+
+    asyncio.run(run())
+
+
+def test_send_once_before_start_raises_runtime_error():
+    controller = AsyncDroneController("127.0.0.1", 9)
+    with pytest.raises(RuntimeError):
+        controller.send_once()
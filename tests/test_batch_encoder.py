@@ -0,0 +1,70 @@
+import pytest
+
+from ..controller import LEGACY, NEW, Axes, DroneController
+
+np = pytest.importorskip("numpy")
+
+from ..batch_encoder import SANITIZE, encode_batch  # noqa: E402
+
+
+def _scalar(axes, flags, flags2, proto, normalized):
+    # What DroneController sends for each sample, one packet at a time.
+    normalize = DroneController._normalize_axis
+    out = []
+    for (roll, pitch, yaw, throttle), flag, flag2 in zip(axes.tolist(), flags.tolist(), flags2.tolist()):
+        if normalized:
+            sample = Axes(
+                normalize(roll, center=True),
+                normalize(pitch, center=True),
+                normalize(yaw, center=True),
+                normalize(throttle, center=False),
+            )
+        else:
+            sample = Axes(int(roll), int(pitch), int(yaw), int(throttle))
+        if proto == NEW:
+            out.append(bytes(DroneController._build_new_packet(sample, flag, flag2)))
+        else:
+            out.append(bytes(DroneController._build_legacy_packet(sample, flag)))
+    return out
+
+
+def _assert_matches(axes, flags, flags2, proto, normalized):
+    packets = encode_batch(axes, flags, flags2, proto, normalized)
+    assert packets.flags["C_CONTIGUOUS"]
+    assert [row.tobytes() for row in packets] == _scalar(axes, flags, flags2, proto, normalized)
+
+
+@pytest.mark.parametrize("proto", [LEGACY, NEW])
+@pytest.mark.parametrize("normalized", [True, False])
+def test_random_samples_match_scalar_packets(proto, normalized):
+    rng = np.random.default_rng(0)
+    n = 5000
+    if normalized:
+        axes = rng.uniform(-1.3, 1.3, size=(n, 4))
+    else:
+        axes = rng.integers(-300, 600, size=(n, 4))
+    _assert_matches(axes, rng.integers(0, 256, n), rng.integers(0, 256, n), proto, normalized)
+
+
+@pytest.mark.parametrize("proto", [LEGACY, NEW])
+def test_half_way_values_round_like_the_scalar_path(proto):
+    # Every x.5 rounding point of each stick, plus the clipped extremes.
+    centered = np.concatenate([(np.arange(256) - 127.5) / 127.5, [-1.5, -1.0, 1.0, 1.5]])
+    throttle = np.concatenate([(np.arange(256) + 0.5) / 255.0, [-0.5, 0.0, 1.0, 1.5]])
+    axes = np.column_stack([centered, centered[::-1], centered, throttle])
+    zeros = np.zeros(len(axes), dtype=np.int64)
+    _assert_matches(axes, zeros, zeros, proto, True)
+
+
+@pytest.mark.parametrize("proto", [LEGACY, NEW])
+def test_marker_bytes_are_sanitized_like_the_scalar_path(proto):
+    # Every raw roll byte against every flag byte: axis values and
+    # checksums land on 0x66/0x99, and throttle is left alone.
+    roll, flags = np.meshgrid(np.arange(256), np.arange(256))
+    roll = roll.ravel()
+    axes = np.column_stack([roll, np.full_like(roll, 0x99), np.full_like(roll, 0x66), roll])
+    _assert_matches(axes, flags.ravel(), flags.ravel()[::-1].copy(), proto, False)
+
+
+def test_sanitize_table_matches_scalar_helper():
+    assert SANITIZE.tolist() == [DroneController._sanitize_axis(value) for value in range(256)]
@@ -0,0 +1,29 @@
+from ..controller import LEGACY, NEW, PacketEncoder
+
+
+def test_unchanged_set_axes_publishes_nothing():
+    encoder = PacketEncoder(LEGACY)
+    state = encoder.set_axes(0.0, 0.0, 0.0, 0.0, normalized=True)
+    packet = encoder.next_packet()
+    rebuilds = encoder.rebuilds
+    encoder.changed.clear()
+
+    assert encoder.set_axes(0.0, 0.0, 0.0, 0.0, normalized=True) is state
+    assert encoder.set_axes(roll=0.0) is state
+    assert encoder.state.version == state.version
+    assert not encoder.changed.is_set()
+    assert encoder.next_packet() == packet
+    assert encoder.rebuilds == rebuilds
+
+    changed = encoder.set_axes(throttle=0.5)
+    assert changed.version == state.version + 1
+    assert encoder.changed.is_set()
+
+
+def test_unchanged_set_flags_publishes_nothing():
+    encoder = PacketEncoder(NEW)
+    state = encoder.set_flags(rotate=True, headless=False)
+    encoder.changed.clear()
+    assert encoder.set_flags(rotate=True, headless=False, stay_high=False) is state
+    assert not encoder.changed.is_set()
+    assert encoder.set_flags(stay_high=True).version == state.version + 1
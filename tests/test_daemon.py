@@ -0,0 +1,63 @@
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from ..controller import DroneController
+from ..daemon import ControlDaemon, DaemonClient
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    server = ControlDaemon(controller=None, path=str(tmp_path / "drone.sock"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_blank_line_gets_an_error_reply(daemon):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(2.0)
+    sock.connect(daemon.path)
+    replies = sock.makefile("rb")
+    try:
+        sock.sendall(b"\n   \nping\n")
+        assert replies.readline() == b"err empty command\n"
+        assert replies.readline() == b"err empty command\n"
+        assert replies.readline() == b"ok pong\n"
+    finally:
+        replies.close()
+        sock.close()
+
+
+def test_client_rejects_blank_commands(daemon):
+    with DaemonClient(daemon.path) as client:
+        with pytest.raises(ValueError):
+            client.command("  ")
+        assert client.command("ping") == "ok pong"
+
+
+def test_socket_is_created_owner_only(daemon):
+    assert os.stat(daemon.path).st_mode & 0o777 == 0o600
+
+
+def test_stats_reports_pending_oneshots(tmp_path):
+    controller = DroneController("127.0.0.1", 9)
+    server = ControlDaemon(controller, path=str(tmp_path / "drone.sock"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with DaemonClient(server.path) as client:
+            assert client.command("takeoff") == "ok"
+            controller.send_once()
+            reply = client.command("stats")
+        stats = json.loads(reply[len("ok "):])
+        assert stats["commands"] == 2
+        assert stats["oneshot"] == controller.oneshot_remaining()
+        assert "takeoff" in stats["oneshot"]
+    finally:
+        server.shutdown()
+        server.server_close()
+        controller.close()
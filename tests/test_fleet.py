@@ -0,0 +1,35 @@
+import time
+
+from ..fleet import Fleet
+
+
+def _phases(fleet, drones):
+    with fleet._lock:
+        return [drone.ticker.deadline % drone.period for drone in drones]
+
+
+def test_adding_and_removing_a_drone_leaves_running_drones_alone():
+    fleet = Fleet(rate_hz=50)
+    try:
+        running = [fleet.add("127.0.0.1", 9, name="a"), fleet.add("127.0.0.1", 9, name="b")]
+        fleet.start()
+        time.sleep(0.2)
+        phases = _phases(fleet, running)
+        sent = [drone.cadence.count for drone in running]
+
+        newcomer = fleet.add("127.0.0.1", 9, name="c")
+        placed = _phases(fleet, [newcomer])[0]
+        time.sleep(0.1)
+        fleet.remove("c")
+        time.sleep(0.1)
+
+        period = newcomer.period
+        after = _phases(fleet, running)
+        assert all(abs((a - b + period / 2) % period - period / 2) < 1e-6 for a, b in zip(after, phases))
+        assert all(now > before for now, before in zip([d.cadence.count for d in running], sent))
+        # a and b are half a period apart; c takes a quarter-period slot.
+        offset = (placed - phases[0]) % period
+        assert min(abs(offset - period / 4), abs(offset - 3 * period / 4)) < 1e-6
+        assert not any(stats["skipped_ticks"] for stats in fleet.health().values())
+    finally:
+        fleet.close()
@@ -0,0 +1,22 @@
+import pytest
+
+from ..controller import LEGACY, NEW, Axes, DroneController
+from ..read_uart import UartFrameDecoder
+
+
+def _packets():
+    axes = Axes(0x40, 0x90, 0x80, 0x20)
+    return {
+        LEGACY: bytes(DroneController._build_legacy_packet(axes, 0x01)),
+        NEW: bytes(DroneController._build_new_packet(axes, 0x01, 0x00)),
+    }
+
+
+@pytest.mark.parametrize("protos", [(NEW,), (LEGACY,), (LEGACY, NEW)])
+@pytest.mark.parametrize("split", [1, 2, 5])
+def test_frame_split_across_chunks(protos, split):
+    packet = _packets()[protos[0]]
+    decoder = UartFrameDecoder(protos)
+    frames = decoder.feed(packet[:split]) + decoder.feed(packet[split:])
+    assert [frame.raw for frame in frames] == [packet]
+    assert decoder.stats()["skipped_bytes"] == 0
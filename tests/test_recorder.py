@@ -0,0 +1,43 @@
+import pytest
+
+from .. import recorder as recorder_module
+from ..controller import LEGACY
+from ..recorder import FlightLog, FlightRecorder
+
+np = pytest.importorskip("numpy")
+
+PACKET = bytes(8)
+
+
+def _session(path, monkeypatch, wall, monotonic, count):
+    monkeypatch.setattr(recorder_module.time, "time", lambda: wall)
+    monkeypatch.setattr(recorder_module.time, "monotonic", lambda: monotonic)
+    with FlightRecorder(str(path), flush_interval=60) as recorder:
+        for i in range(count):
+            recorder.record(monotonic + 0.04 * (i + 1), LEGACY, PACKET)
+
+
+def test_appended_session_after_reboot_keeps_wall_time(tmp_path, monkeypatch):
+    path = tmp_path / "flight.e88log"
+    # First boot: monotonic 5000 s at wall 1000; after a reboot an hour
+    # later the monotonic clock has restarted near zero.
+    _session(path, monkeypatch, wall=1000.0, monotonic=5000.0, count=3)
+    _session(path, monkeypatch, wall=4600.0, monotonic=20.0, count=2)
+
+    log = FlightLog(str(path))
+    assert len(log) == 5
+    assert log.sessions == 2
+    assert not np.any(log.records["proto"] == recorder_module.ANCHOR_CODE)
+    expected = [1000.04, 1000.08, 1000.12, 4600.04, 4600.08]
+    assert np.allclose(log.wall_time(log.t), expected)
+    assert len(log.between(t0=log.t[3])) == 2
+
+
+def test_single_session_log_stays_mapped(tmp_path, monkeypatch):
+    path = tmp_path / "flight.e88log"
+    _session(path, monkeypatch, wall=1000.0, monotonic=5000.0, count=3)
+
+    log = FlightLog(str(path))
+    assert log.sessions == 1
+    assert isinstance(log.records, np.memmap)
+    assert np.allclose(log.wall_time(log.t), [1000.04, 1000.08, 1000.12])
@@ -0,0 +1,65 @@
+import csv
+import threading
+
+import pytest
+
+from ..controller import LEGACY, ONESHOT_KEYS
+
+np = pytest.importorskip("numpy")
+
+from ..trajectory import TRAJECTORY_DTYPE, Trajectory, TrajectoryPlayer  # noqa: E402
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, payload, state=None):
+        self.sent.append((payload, state))
+
+
+def _compiled(rate_hz=200.0):
+    records = np.array(
+        [(0.0, 0.0, 0.0, 0.0, 0.0, 0, 0), (0.1, 0.5, -0.5, 0.0, 0.8, 0, 1), (0.2, 0.0, 0.0, 0.0, 0.2, 0, 0)],
+        dtype=TRAJECTORY_DTYPE,
+    )
+    return Trajectory(records).compile(LEGACY, rate_hz)
+
+
+def test_play_sends_every_packet_with_its_state(tmp_path):
+    compiled = _compiled()
+    transport = RecordingTransport()
+    log = tmp_path / "timing.csv"
+    player = TrajectoryPlayer(transport, compiled, loops=2, timing_log=str(log))
+    stats = player.play()
+
+    assert stats["sent"] + stats["skipped"] == 2 * len(compiled)
+    assert not stats["aborted"]
+    takeoff = ONESHOT_KEYS.index("takeoff")
+    for payload, state in transport.sent:
+        k = (state.version - 1) % len(compiled)
+        assert payload == compiled.packets[k]
+        assert state.throttle == compiled.controls[k][3]
+    counters = [state.oneshot[takeoff] for _, state in transport.sent]
+    assert counters == sorted(counters) and counters[-1] == 2
+    with open(log, newline="") as handle:
+        assert len(list(csv.DictReader(handle))) == stats["sent"]
+
+
+def test_abort_sends_an_emergency_window():
+    compiled = _compiled(rate_hz=100.0)
+    transport = RecordingTransport()
+    player = TrajectoryPlayer(transport, compiled, loops=0)
+    thread = threading.Thread(target=player.play)
+    thread.start()
+    threading.Timer(0.1, player.abort).start()
+    thread.join(5.0)
+    assert not thread.is_alive()
+
+    assert player.stats()["aborted"]
+    tail = transport.sent[-compiled.abort_count:]
+    assert all(payload == compiled.abort_packet for payload, _ in tail)
+    before = transport.sent[-compiled.abort_count - 1][1].oneshot
+    emergency = ONESHOT_KEYS.index("emergency")
+    after = tail[0][1].oneshot
+    assert [a - b for a, b in zip(after, before)] == [int(i == emergency) for i in range(len(ONESHOT_KEYS))]
@@ -0,0 +1,106 @@
+import socket
+import threading
+import time
+
+from ..controller import DroneController
+from ..transport import Esp32HttpTransport, SerialTransport
+
+
+class FakeSerial:
+    def __init__(self, baudrate=19200):
+        self.baudrate = baudrate
+        self.port = "fake"
+        self.written = []
+        self.flushes = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def write(self, data):
+        assert not self.closed
+        with self.lock:
+            self.written.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        assert not self.closed
+        self.flushes += 1
+
+    def close(self):
+        self.closed = True
+
+
+def test_send_once_then_close_writes_the_frame():
+    for _ in range(50):
+        port = FakeSerial()
+        ctrl = DroneController("127.0.0.1", transport=SerialTransport(serial_port=port))
+        ctrl.set_axes(0.0, 0.0, 0.0, 0.5, normalized=True)
+        ctrl.send_once()
+        ctrl.close()
+        assert port.written == [ctrl.encoder.next_packet()]
+        assert port.closed
+
+
+def test_close_writes_only_the_newest_pending_frame():
+    port = FakeSerial()
+    transport = SerialTransport(serial_port=port)
+    transport.send(b"\x66first\x99")
+    transport.send(b"\x66second\x99")
+    transport.close()
+    assert port.written[-1] == b"\x66second\x99"
+    assert transport.frames == len(port.written)
+
+
+class FakeEsp32:
+    # Answers each GET in order on one keep-alive connection, after `delay`.
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.paths = []
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        conn, _ = self.listener.accept()
+        buffer = b""
+        with conn:
+            while True:
+                while b"\r\n\r\n" not in buffer:
+                    data = conn.recv(4096)
+                    if not data:
+                        return
+                    buffer += data
+                head, buffer = buffer.split(b"\r\n\r\n", 1)
+                self.paths.append(head.split(b" ")[1].decode("ascii"))
+                time.sleep(self.delay)
+                conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nOK")
+
+    def close(self):
+        self.listener.close()
+
+
+def test_esp32_close_delivers_a_queued_emergency():
+    esp = FakeEsp32()
+    ctrl = DroneController("127.0.0.1", transport=Esp32HttpTransport("127.0.0.1", esp.port))
+    ctrl.emergency()
+    ctrl.send_once()
+    ctrl.close()
+    esp.close()
+    assert esp.paths[0] == "/control?var=emergency&val=1"
+
+
+def test_esp32_pipelined_rtt_is_per_response():
+    esp = FakeEsp32(delay=0.1)
+    transport = Esp32HttpTransport("127.0.0.1", esp.port, pipeline=4)
+    ctrl = DroneController("127.0.0.1", transport=transport)
+    ctrl.set_axes(0.2, -0.2, 0.1, 0.5, normalized=True)
+    ctrl.send_once()
+    deadline = time.monotonic() + 5.0
+    while transport.requests < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    ctrl.close()
+    esp.close()
+    assert transport.requests == 4
+    # Timed from the shared write, the last response would read ~400 ms.
+    assert transport.rtt.max < 0.2
@@ -0,0 +1,150 @@
+import http.client
+import os
+import threading
+
+import pytest
+
+from ..benchmarks import _fake_jpeg
+from ..wifi_drone_webcam import (
+    JpegFrameAssembler,
+    StreamHandler,
+    ThreadedHTTPServer,
+    placeholder_jpeg,
+    preferred_transports,
+)
+
+
+def _datagrams(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _commit_all(assembler, datagrams):
+    frames = []
+    for data in datagrams:
+        view = assembler.writable(len(data))
+        view[:len(data)] = data
+        frames.extend(assembler.commit(len(data), datagram=True))
+    return frames
+
+
+def test_restart_frames_pass_and_lost_fragment_is_rejected():
+    frames = [_fake_jpeg(16 * 1024, seed) for seed in range(3)]
+    datagrams = _datagrams(b"".join(frames), 1400)
+
+    assembler = JpegFrameAssembler()
+    assert _commit_all(assembler, datagrams) == frames
+
+    assembler = JpegFrameAssembler()
+    lost = len(datagrams) // 2
+    out = _commit_all(assembler, datagrams[:lost] + datagrams[lost + 1:])
+    assert out == [frames[0], frames[2]]
+    assert assembler.rejected == 1
+
+
+def test_lost_run_of_eight_restart_intervals_is_rejected():
+    # Losing a multiple of eight intervals keeps the RST0..RST7 order intact,
+    # so only the count against the frame geometry gives it away.
+    frame = _fake_jpeg(16 * 1024, 0)
+    first = frame.index(b"\xff\xd0")
+    second = frame.index(b"\xff\xd0", first + 2)
+    assembler = JpegFrameAssembler()
+    assert assembler.feed(frame[:first] + frame[second:]) == []
+    assert assembler.reject_reasons == {"missing_restarts": 1}
+
+
+def test_lost_tail_restart_interval_is_rejected():
+    frame = _fake_jpeg(16 * 1024, 0)
+    # Cut the last restart interval, keeping the frame otherwise well formed.
+    rst = frame.rindex(b"\xff\xd7")
+    assembler = JpegFrameAssembler()
+    assert assembler.feed(frame[:rst] + b"\xff\xd9") == []
+    assert assembler.reject_reasons == {"missing_restarts": 1}
+
+
+def test_short_fragment_without_dri_is_rejected():
+    frame = placeholder_jpeg(640, 480)
+    datagrams = _datagrams(frame * 2, 64)
+
+    assembler = JpegFrameAssembler(check_fragments=True)
+    assert _commit_all(assembler, datagrams) == [frame, frame]
+
+    datagrams[10] = datagrams[10][:40]
+    assembler = JpegFrameAssembler()
+    assert len(_commit_all(assembler, datagrams)) == 2
+
+    assembler = JpegFrameAssembler(check_fragments=True)
+    assert _commit_all(assembler, datagrams) == [frame]
+    assert assembler.reject_reasons == {"missing_fragments": 1}
+
+
+def test_stray_large_datagram_does_not_poison_later_frames():
+    frame = placeholder_jpeg(640, 480)
+    assembler = JpegFrameAssembler(check_fragments=True)
+    assert _commit_all(assembler, _datagrams(frame * 5, 64)) == [frame] * 5
+    assert _commit_all(assembler, [b"\x00" * 100]) == []
+    assert _commit_all(assembler, _datagrams(frame * 50, 64)) == [frame] * 50
+    assert assembler.rejected == 0
+
+
+def test_recurring_fragment_sizes_are_accepted():
+    frame = placeholder_jpeg(640, 480)
+    stream = frame * 3
+    datagrams = []
+    while stream:
+        size = 64 if len(datagrams) % 2 == 0 else 60
+        datagrams.append(stream[:size])
+        stream = stream[size:]
+    assembler = JpegFrameAssembler(check_fragments=True)
+    assert _commit_all(assembler, datagrams) == [frame] * 3
+
+
+# Stand-in ffmpeg: silent on the transports listed in $FAKE_FFMPEG_DEAD,
+# otherwise writes a few bytes of "video".
+FAKE_FFMPEG = """#!/bin/sh
+while [ "$1" != "-rtsp_transport" ]; do shift; done
+case ",$FAKE_FFMPEG_DEAD," in *",$2,"*) exit 1;; esac
+printf 'video over %s' "$2"
+"""
+
+
+@pytest.fixture
+def passthrough(tmp_path, monkeypatch):
+    def serve(script, dead=""):
+        ffmpeg = tmp_path / "ffmpeg"
+        ffmpeg.write_text(script)
+        ffmpeg.chmod(0o755)
+        monkeypatch.setenv("PATH", str(tmp_path) + os.pathsep + os.environ.get("PATH", ""))
+        monkeypatch.setenv("FAKE_FFMPEG_DEAD", dead)
+        server = ThreadedHTTPServer(("127.0.0.1", 0), StreamHandler)
+        server.rtsp_url = "rtsp://127.0.0.1:1/test-%s" % tmp_path.name
+        server.rtsp_transports = ["tcp", "udp"]
+        server.rtsp_supervision = {"connect_timeout": 2.0}
+        monkeypatch.setattr(StreamHandler, "log_message", lambda *args: None)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        conn = http.client.HTTPConnection(*server.server_address, timeout=10)
+        conn.request("GET", "/stream.ts")
+        response = conn.getresponse()
+        return server, response.status, response.read()
+
+    servers = []
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_passthrough_falls_back_to_the_next_transport(passthrough):
+    server, status, body = passthrough(FAKE_FFMPEG, dead="tcp")
+    assert (status, body) == (200, b"video over udp")
+    assert preferred_transports[server.rtsp_url] == "udp"
+
+
+def test_passthrough_reports_502_when_every_transport_fails(passthrough):
+    _, status, body = passthrough(FAKE_FFMPEG, dead="tcp,udp")
+    assert (status, body) == (502, b"")
+
+
+def test_passthrough_reports_503_when_ffmpeg_cannot_start(passthrough):
+    _, status, _ = passthrough("#!/nonexistent/interpreter\n")
+    assert status == 503
@@ -0,0 +1,330 @@
+# Scripted flights: load a time-stamped trajectory, encode every packet up
+# front with batch_encoder, then stream them out on an absolute timeline.
+#
+# CSV: header row with t,roll,pitch,yaw,throttle (normalized, seconds from
+# start) and optional rotate,headless,stay_high (0/1) and event columns,
+# where event is one of takeoff/land/emergency/calibrate or empty.
+# Binary: TRAJECTORY_MAGIC followed by TRAJECTORY_DTYPE records.
+import collections
+import csv
+import threading
+import time
+
+import numpy as np
+
+from .batch_encoder import encode_batch, normalize_axes
+from .controller import LEGACY, NEW, ONESHOT_BITS, ONESHOT_KEYS, ControlState, oneshot_window
+from .scheduler import DeadlineTicker, IntervalHistogram, ms
+
+TRAJECTORY_MAGIC = b"E88TRJ1\n"
+TRAJECTORY_DTYPE = np.dtype(
+    [
+        ("t", "<f8"),
+        ("roll", "<f4"),
+        ("pitch", "<f4"),
+        ("yaw", "<f4"),
+        ("throttle", "<f4"),
+        ("toggles", "u1"),
+        ("event", "u1"),
+    ]
+)
+# Bits of the toggles field; event is 0 or 1 + index into ONESHOT_KEYS.
+ROTATE = 0x01
+HEADLESS = 0x02
+STAY_HIGH = 0x04
+
+
+class Trajectory:
+    def __init__(self, records):
+        records = np.asarray(records, dtype=TRAJECTORY_DTYPE)
+        if not len(records):
+            raise ValueError("empty trajectory")
+        if np.any(np.diff(records["t"]) < 0):
+            raise ValueError("trajectory timestamps must not decrease")
+        if records["event"].max() > len(ONESHOT_KEYS):
+            raise ValueError("unknown event code %d" % records["event"].max())
+        self.records = records
+
+    @property
+    def duration(self):
+        return float(self.records["t"][-1])
+
+    @property
+    def events(self):
+        rows = self.records[self.records["event"] > 0]
+        return [(float(row["t"]), ONESHOT_KEYS[row["event"] - 1]) for row in rows]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as handle:
+            head = handle.read(len(TRAJECTORY_MAGIC))
+        if head == TRAJECTORY_MAGIC:
+            return cls.from_binary(path)
+        return cls.from_csv(path)
+
+    @classmethod
+    def from_csv(cls, path):
+        rows = []
+        with open(path, newline="") as handle:
+            for line, row in enumerate(csv.DictReader(handle), start=2):
+                try:
+                    toggles = 0
+                    for column, bit in (("rotate", ROTATE), ("headless", HEADLESS), ("stay_high", STAY_HIGH)):
+                        if int(row.get(column) or 0):
+                            toggles |= bit
+                    event = (row.get("event") or "").strip()
+                    rows.append(
+                        (
+                            float(row["t"]),
+                            float(row["roll"]),
+                            float(row["pitch"]),
+                            float(row["yaw"]),
+                            float(row["throttle"]),
+                            toggles,
+                            ONESHOT_KEYS.index(event) + 1 if event else 0,
+                        )
+                    )
+                except (KeyError, TypeError, ValueError) as exc:
+                    raise ValueError("%s:%d: bad trajectory row (%s)" % (path, line, exc)) from None
+        return cls(np.array(rows, dtype=TRAJECTORY_DTYPE))
+
+    @classmethod
+    def from_binary(cls, path):
+        with open(path, "rb") as handle:
+            if handle.read(len(TRAJECTORY_MAGIC)) != TRAJECTORY_MAGIC:
+                raise ValueError("%s: not a binary trajectory" % path)
+            records = np.fromfile(handle, dtype=TRAJECTORY_DTYPE)
+        return cls(records)
+
+    def save_binary(self, path):
+        with open(path, "wb") as handle:
+            handle.write(TRAJECTORY_MAGIC)
+            self.records.tofile(handle)
+
+    def compile(self, proto=LEGACY, rate_hz=25.0, interpolate=True):
+        # One packet per tick at rate_hz. Axes are interpolated between rows
+        # (or held), toggles are held, and each event starts a full one-shot
+        # window on the first tick at or after its timestamp; the tail is
+        # extended with the last sample if a window runs past the end.
+        rate_hz = float(rate_hz)
+        records = self.records
+        ticks = int(np.floor(self.duration * rate_hz + 1e-9)) + 1
+        window = oneshot_window(proto)
+        starts = []
+        for t, key in self.events:
+            start = int(np.ceil(t * rate_hz - 1e-9))
+            starts.append((start, ONESHOT_KEYS.index(key)))
+            ticks = max(ticks, start + window)
+
+        times = np.arange(ticks) / rate_hz
+        axes = np.empty((ticks, 4), dtype=np.float64)
+        held = np.clip(np.searchsorted(records["t"], times, side="right") - 1, 0, len(records) - 1)
+        for column, name in enumerate(("roll", "pitch", "yaw", "throttle")):
+            values = records[name].astype(np.float64)
+            if interpolate and len(records) > 1:
+                axes[:, column] = np.interp(times, records["t"], values)
+            else:
+                axes[:, column] = values[held]
+
+        toggles = records["toggles"][held]
+        rotate = ((toggles & ROTATE) != 0).astype(np.uint8)
+        headless = ((toggles & HEADLESS) != 0).astype(np.uint8)
+        stay_high = ((toggles & STAY_HIGH) != 0).astype(np.uint8)
+        # Same bit positions DroneController.set_flags uses.
+        flags_legacy = (rotate << 3) | (headless << 4)
+        flags_new = rotate << 3
+        flags_new2 = headless | (stay_high << 1)
+        # Per-tick request counters, as ControlState.oneshot would hold them.
+        requests = np.zeros((ticks, len(ONESHOT_KEYS)), dtype=np.int64)
+        for start, index in starts:
+            bit_legacy, bit_new = ONESHOT_BITS[index]
+            flags_legacy[start:start + window] |= bit_legacy
+            flags_new[start:start + window] |= bit_new
+            requests[start:, index] += 1
+
+        if proto == NEW:
+            packets = encode_batch(axes, flags_new, flags_new2, proto=NEW)
+        else:
+            packets = encode_batch(axes, flags_legacy, proto=LEGACY)
+
+        emergency_legacy, emergency_new = ONESHOT_BITS[ONESHOT_KEYS.index("emergency")]
+        abort = encode_batch(
+            np.zeros((1, 4)),
+            emergency_new if proto == NEW else emergency_legacy,
+            proto=proto,
+        )[0].tobytes()
+        controls = np.column_stack([normalize_axes(axes), flags_legacy, flags_new, flags_new2])
+        return CompiledTrajectory(packets, rate_hz, abort, window, proto, controls, requests)
+
+
+class CompiledTrajectory:
+    # controls holds each tick's raw roll, pitch, yaw, throttle and flag
+    # bytes and requests its one-shot counters, so state() can hand
+    # transports that work from ControlState (Esp32HttpTransport) the same
+    # flight the packets encode.
+    def __init__(self, packets, rate_hz, abort_packet, abort_count, proto, controls, requests):
+        self.array = packets
+        self.packets = [row.tobytes() for row in packets]
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.abort_packet = abort_packet
+        self.abort_count = abort_count
+        self.proto = proto
+        self.controls = controls
+        self.requests = requests
+
+    def __len__(self):
+        return len(self.packets)
+
+    @property
+    def duration(self):
+        return len(self.packets) * self.period
+
+    def state(self, k, pass_number=0):
+        # Counters keep climbing from pass to pass, so a looped event is a
+        # new request each time.
+        roll, pitch, yaw, throttle, flags_legacy, flags_new, flags_new2 = self.controls[k].tolist()
+        oneshot = tuple((self.requests[k] + pass_number * self.requests[-1]).tolist())
+        version = pass_number * len(self.packets) + k + 1
+        return ControlState(version, roll, pitch, yaw, throttle, flags_legacy, flags_new, flags_new2, oneshot)
+
+    def abort_state(self, last):
+        # Neutral sticks and one new emergency request on top of the last
+        # state sent.
+        emergency = ONESHOT_KEYS.index("emergency")
+        oneshot = tuple(count + (i == emergency) for i, count in enumerate(last.oneshot))
+        roll, pitch, yaw, throttle = normalize_axes(np.zeros((1, 4)))[0].tolist()
+        return ControlState(last.version + 1, roll, pitch, yaw, throttle, 0, 0, 0, oneshot)
+
+
+class TimingLog:
+    # Per-packet timing CSV. record() only appends to a deque, like
+    # FlightRecorder, and a background thread writes the rows, so the send
+    # path never touches the file.
+    def __init__(self, path, flush_interval=0.25):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue = collections.deque()
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(["pass", "tick", "scheduled_s", "sent_s", "error_ms"])
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, pass_number, tick, scheduled, sent, error):
+        self._queue.append((pass_number, tick, scheduled, sent, error))
+
+    def flush(self):
+        queue = self._queue
+        rows = []
+        while queue:
+            pass_number, tick, scheduled, sent, error = queue.popleft()
+            rows.append([pass_number, tick, "%.6f" % scheduled, "%.6f" % sent, "%.3f" % (error * 1e3)])
+        if rows:
+            self._writer.writerows(rows)
+            self._file.flush()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=2.0)
+        self.flush()
+        self._file.close()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+class TrajectoryPlayer:
+    # Streams a CompiledTrajectory through a controller transport
+    # (UdpTransport, SerialTransport, Esp32HttpTransport, ...) on a
+    # DeadlineTicker timeline: packet k of a pass is due at start + k *
+    # period, and a tick that is already a full period late is skipped with
+    # its packet rather than sent in a burst, so the flight stays on
+    # schedule. abort() stops playback at once and sends a full emergency
+    # window with neutral sticks. The caller owns the transport.
+    def __init__(self, transport, compiled, loops=1, timing_log=None, recorder=None):
+        self.transport = transport
+        self.recorder = recorder
+        self.compiled = compiled
+        self.loops = loops
+        self.timing_log = timing_log
+        self._abort = threading.Event()
+        self.errors = IntervalHistogram(compiled.period, bucket_s=0.0001, buckets=2000)
+        self.sent = 0
+        self.send_errors = 0
+        self.aborted = False
+
+    def abort(self):
+        self._abort.set()
+
+    def play(self):
+        compiled = self.compiled
+        packets = compiled.packets
+        count = len(packets)
+        total = count * self.loops if self.loops else None
+        aborting = self._abort
+        errors = self.errors
+        log = TimingLog(self.timing_log) if self.timing_log else None
+        ticker = DeadlineTicker(compiled.rate_hz, errors)
+        start = ticker.start()
+        n = 0
+        state = compiled.state(0)
+        try:
+            while total is None or n < total:
+                pass_number, k = divmod(n, count)
+                deadline = ticker.deadline
+                state = compiled.state(k, pass_number)
+                sent_at = self._send(packets[k], state)
+                error = sent_at - deadline
+                errors.record(error)
+                if log is not None:
+                    log.record(pass_number, k, deadline - start, sent_at - start, error)
+                if total is not None and n + 1 >= total:
+                    break
+                if ticker.wait(event=aborting) is None:
+                    break
+                n = int(round((ticker.deadline - start) / compiled.period))
+            if aborting.is_set():
+                self._send_abort(compiled.abort_state(state))
+        finally:
+            if log is not None:
+                log.close()
+        return self.stats()
+
+    def _send(self, packet, state):
+        try:
+            self.transport.send(packet, state)
+        except OSError:
+            self.send_errors += 1
+            return time.monotonic()
+        sent_at = time.monotonic()
+        self.sent += 1
+        if self.recorder is not None:
+            self.recorder.record(sent_at, self.compiled.proto, packet)
+        return sent_at
+
+    def _send_abort(self, state):
+        self.aborted = True
+        packet = self.compiled.abort_packet
+        ticker = DeadlineTicker(self.compiled.rate_hz)
+        ticker.start()
+        for i in range(self.compiled.abort_count):
+            if i:
+                ticker.wait()
+            self._send(packet, state)
+
+    def stats(self):
+        errors = self.errors
+        return {
+            "sent": self.sent,
+            "skipped": errors.skipped,
+            "late": errors.late,
+            "send_errors": self.send_errors,
+            "aborted": self.aborted,
+            "error_mean_ms": ms(errors.total / errors.count) if errors.count else None,
+            "error_p50_ms": ms(errors.percentile(0.50)),
+            "error_p99_ms": ms(errors.percentile(0.99)),
+            "error_max_ms": ms(errors.max),
+        }
@@ -0,0 +1,350 @@
+# Transports under DroneController. The send loop calls
+# transport.send(payload, state) once per packet with the encoded bytes and
+# the ControlState they were built from; a transport uses whichever suits
+# the link.
+import collections
+import socket
+import threading
+import time
+
+from .controller import ONESHOT_KEYS
+from .scheduler import IntervalHistogram, ms
+
+
+class UdpTransport:
+    # The raw E88 packet straight to the drone's UDP control port.
+    def __init__(self, ip, port):
+        self.addr = (ip, int(port))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, payload, state=None):
+        self.sock.sendto(payload, self.addr)
+
+    def stats(self):
+        return {"kind": "udp", "addr": "%s:%d" % self.addr}
+
+    def close(self):
+        self.sock.close()
+
+
+class SerialTransport:
+    # Writes the packets straight to the RF MCU's UART (19200 8N1 on the
+    # E88 boards, see read_uart.py), bypassing Wi-Fi. An 8-byte frame takes
+    # ~4 ms on the wire, so send() only drops the packet into a one-frame
+    # slot and a writer thread puts it on the line; a frame that is replaced
+    # before the writer gets to it is never sent. After each write the
+    # writer drains the tty and then waits out the frame's wire time, so the
+    # driver never holds a queue of stale frames behind the current one.
+    def __init__(self, device=None, baudrate=19200, serial_port=None, bits_per_byte=10):
+        if serial_port is None:
+            import serial
+
+            serial_port = serial.Serial(device, baudrate, timeout=0, write_timeout=1.0)
+        self.port = serial_port
+        self.baudrate = serial_port.baudrate
+        self.byte_time = float(bits_per_byte) / self.baudrate
+        self.frames = 0
+        self.superseded = 0
+        self.errors = 0
+        self.last_error = None
+        self._busy = 0.0
+        self._since = None
+        self._slot = None
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def send(self, payload, state=None):
+        with self._cond:
+            if self._slot is not None:
+                self.superseded += 1
+            self._slot = bytes(payload)
+            self._cond.notify()
+
+    def stats(self):
+        elapsed = time.monotonic() - self._since if self._since is not None else 0.0
+        return {
+            "kind": "serial",
+            "device": getattr(self.port, "port", None),
+            "baudrate": self.baudrate,
+            "frames": self.frames,
+            "superseded": self.superseded,
+            "errors": self.errors,
+            "last_error": str(self.last_error) if self.last_error else None,
+            "rate_hz": round(self.frames / elapsed, 2) if elapsed > 0 else None,
+            "occupancy": round(self._busy / elapsed, 4) if elapsed > 0 else None,
+        }
+
+    def reset_stats(self):
+        with self._cond:
+            self.frames = 0
+            self.superseded = 0
+            self._busy = 0.0
+            self._since = time.monotonic()
+
+    def close(self):
+        # The writer puts a frame that is still in the slot on the line
+        # before it exits, so a final neutral or emergency packet is not lost.
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join()
+        self.port.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and self._slot is None:
+                    self._cond.wait()
+                if self._slot is None:
+                    break
+                payload = self._slot
+                self._slot = None
+            started = time.monotonic()
+            if self._since is None:
+                self._since = started
+            try:
+                self.port.write(payload)
+                self.port.flush()
+            except Exception as exc:
+                # serial.SerialException and OSError; pyserial is optional here.
+                self.errors += 1
+                self.last_error = exc
+                time.sleep(0.05)
+                continue
+            wire = len(payload) * self.byte_time
+            remaining = started + wire - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            self.frames += 1
+            self._busy += wire
+        try:
+            self.port.flush()
+        except Exception as exc:
+            self.errors += 1
+            self.last_error = exc
+
+
+def centered_percent(value):
+    # Inverse of drone_axis_centered_from_percent() in app_httpd.cpp.
+    return max(-100, min(100, int(round((value & 0xFF) * 200.0 / 255.0 - 100.0))))
+
+
+def throttle_percent(value):
+    # Inverse of drone_throttle_from_percent() in app_httpd.cpp.
+    return max(0, min(100, int(round((value & 0xFF) * 100.0 / 255.0))))
+
+
+class Esp32HttpTransport:
+    # Drives the ESP32 retrofit through GET /control?var=..&val=.. (see
+    # cmd_handler in ESP32Drone/app_httpd.cpp), which takes one variable per
+    # request and builds the UART packets itself. send() only diffs the
+    # state against what was last queued and never blocks the send loop; a
+    # worker thread owns one keep-alive connection. Pending updates are
+    # keyed by variable, so a burst of stick moves collapses into the
+    # latest value, and at most `pipeline` requests are written back to
+    # back before their responses are read. One-shots go out first.
+    def __init__(self, host, port=80, path="/control", pipeline=4, timeout=2.0):
+        self.host = host
+        self.port = int(port)
+        self.path = path
+        self.pipeline = max(1, int(pipeline))
+        self.timeout = timeout
+        self.rtt = IntervalHistogram(0.1, bucket_s=0.0005, buckets=4000)
+        self.requests = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.connects = 0
+        self.last_error = None
+        self._queued = {}
+        self._oneshots = collections.deque()
+        self._last = {}
+        self._seen_oneshot = (0,) * len(ONESHOT_KEYS)
+        self._cond = threading.Condition()
+        self._sock = None
+        self._buffer = b""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def send(self, payload, state=None):
+        if state is None:
+            return
+        values = (
+            ("throttle", throttle_percent(state.throttle)),
+            ("yaw", centered_percent(state.yaw)),
+            ("pitch", centered_percent(state.pitch)),
+            ("roll", centered_percent(state.roll)),
+        )
+        with self._cond:
+            changed = False
+            for name, value in values:
+                if self._last.get(name) != value:
+                    self._last[name] = value
+                    if name in self._queued:
+                        self.coalesced += 1
+                    self._queued[name] = value
+                    changed = True
+            seen = self._seen_oneshot
+            if state.oneshot != seen:
+                for name, old, new in zip(ONESHOT_KEYS, seen, state.oneshot):
+                    if new != old and name not in self._oneshots:
+                        self._oneshots.append(name)
+                        changed = True
+            self._seen_oneshot = state.oneshot
+            if changed:
+                self._cond.notify()
+
+    def stats(self):
+        rtt = self.rtt
+        return {
+            "kind": "esp32-http",
+            "addr": "%s:%d" % (self.host, self.port),
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "connects": self.connects,
+            "last_error": str(self.last_error) if self.last_error else None,
+            "rtt_p50_ms": ms(rtt.percentile(0.50), 2),
+            "rtt_p99_ms": ms(rtt.percentile(0.99), 2),
+            "rtt_max_ms": ms(rtt.max, 2),
+        }
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=self.timeout + 1.0)
+        self._disconnect()
+
+    def _take_batch(self):
+        # Called with _cond held. Emergency first, then the other one-shots,
+        # then the latest value of each axis.
+        batch = []
+        if "emergency" in self._oneshots:
+            self._oneshots.remove("emergency")
+            batch.append(("emergency", 1))
+        while self._oneshots and len(batch) < self.pipeline:
+            batch.append((self._oneshots.popleft(), 1))
+        for name in list(self._queued):
+            if len(batch) >= self.pipeline:
+                break
+            batch.append((name, self._queued.pop(name)))
+        return batch
+
+    def _requeue(self, batch):
+        # Called with _cond held; newer values queued meanwhile win.
+        for name, value in batch:
+            if name in ONESHOT_KEYS:
+                if name not in self._oneshots:
+                    self._oneshots.appendleft(name)
+            else:
+                self._queued.setdefault(name, value)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queued and not self._oneshots:
+                    self._cond.wait()
+                running = self._running
+                if not running:
+                    # Like SerialTransport.close(), still deliver what was
+                    # queued last, so an emergency right before close() is
+                    # not lost; stick values no longer matter.
+                    self._queued.clear()
+                    if not self._oneshots:
+                        return
+                batch = self._take_batch()
+            try:
+                self._exchange(batch)
+            except (OSError, ValueError) as exc:
+                self.errors += 1
+                self.last_error = exc
+                self._disconnect()
+                if not running:
+                    return
+                with self._cond:
+                    # Back off a little so a dead ESP32 is not hammered.
+                    self._cond.wait(0.2)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._buffer = b""
+        self.connects += 1
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def _exchange(self, batch):
+        # Whatever did not get a response is requeued, so it is retried on a
+        # fresh connection unless a newer value has been queued since.
+        host = "%s:%d" % (self.host, self.port) if self.port != 80 else self.host
+        requests = b"".join(
+            (
+                "GET %s?var=%s&val=%d HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\n\r\n"
+                % (self.path, name, value, host)
+            ).encode("ascii")
+            for name, value in batch
+        )
+        done = 0
+        try:
+            if self._sock is None:
+                self._connect()
+            started = time.monotonic()
+            self._sock.sendall(requests)
+            for name, value in batch:
+                # The ESP32 answers pipelined requests in order, so each one
+                # is timed from the previous response, not the shared write.
+                status, keep_alive = self._read_response()
+                received = time.monotonic()
+                self.rtt.record(received - started)
+                started = received
+                self.requests += 1
+                done += 1
+                if status >= 400:
+                    self.errors += 1
+                    self.last_error = "HTTP %d for %s=%d" % (status, name, value)
+                if not keep_alive:
+                    self._disconnect()
+                    break
+        finally:
+            if done < len(batch):
+                with self._cond:
+                    self._requeue(batch[done:])
+
+    def _read_response(self):
+        while b"\r\n\r\n" not in self._buffer:
+            self._recv_more()
+        head, self._buffer = self._buffer.split(b"\r\n\r\n", 1)
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ", 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise ValueError("bad status line %r" % lines[0])
+        status = int(parts[1])
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+        if "content-length" not in headers:
+            # No framing (e.g. chunked): drop the connection after this one.
+            return status, False
+        length = int(headers["content-length"])
+        while len(self._buffer) < length:
+            self._recv_more()
+        self._buffer = self._buffer[length:]
+        keep_alive = headers.get("connection") != "close" and parts[0] != "HTTP/1.0"
+        return status, keep_alive
+
+    def _recv_more(self):
+        data = self._sock.recv(4096)
+        if not data:
+            raise ConnectionError("connection closed by %s" % self.host)
+        self._buffer += data
@@ -2,9 +2,15 @@
 # usage : python3 wifi_cam_streamer/streamer.py --ip 192.168.4.153 --source udp --udp-port 8080 --udp-command Bv
 
 import argparse
+import asyncio
+import bisect
+import collections
 import http.server
+import json
 import os
+import select
 import socket
+import struct
 import subprocess
 import sys
 import threading
@@ -17,6 +23,15 @@ RTSP_REAR = "rtsp://%s:554/avi_rt/rear.sd"
 RTSP_H264 = "rtsp://%s:554/264_rt/XXX.sd"
 RTSP_H264_REAR = "rtsp://%s:554/264_rt/rear.sd"
 
+# Remux-only outputs for H.264 sources: (Content-Type, ffmpeg muxer args).
+PASSTHROUGH_FORMATS = {
+    "/stream.ts": ("video/mp2t", ["-f", "mpegts"]),
+    "/stream.mp4": (
+        "video/mp4",
+        ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof"],
+    ),
+}
+
 
 def which(cmd):
     for path in os.environ.get("PATH", "").split(os.pathsep):
@@ -26,45 +41,797 @@ def which(cmd):
     return None
 
 
+INDEX_HTML = (
+    "<html><head><title>WiFi CAM Stream</title></head>"
+    "<body><img src=\"/stream\" style=\"width:100%\"></body></html>"
+)
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+
+# SOFn markers that carry a frame header (C4 = DHT, C8 = JPG, CC = DAC).
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Sequential DCT frames, where every scan restarts once per Ri MCUs and the
+# number of RST markers follows from the frame geometry.
+SEQUENTIAL_SOF = frozenset((0xC0, 0xC1, 0xC9))
+
+
+class JpegFrameAssembler:
+    # Reassembles JPEG frames from a byte stream in a preallocated arena.
+    # Callers write straight into writable() with recv_into/readinto and then
+    # commit() the byte count; scanning resumes where the previous call
+    # stopped, so every byte is inspected once and each frame is copied once.
+    #
+    # With validate=True (the default) frames are walked structurally rather
+    # than cut at the first FFD9: header segments are skipped by their length
+    # (so an EXIF thumbnail's markers are never seen), the entropy-coded scan
+    # is checked for restart-marker order, and a frame is rejected when a new
+    # SOI tears into it or its structure is broken. With a DRI restart
+    # interval, a sequential scan must also carry every RST marker its MCU
+    # count calls for, which catches lost datagrams.
+    #
+    # check_fragments=True is for senders that cut frames into fixed-size
+    # fragments: a frame without DRI is then rejected when a datagram
+    # (commits flagged datagram=True) inside it is a one-off shorter than the
+    # frame's own most common fragment size, i.e. a truncated fragment. Off
+    # by default, since a sender with arbitrary fragment sizes would fail it.
+    def __init__(self, capacity=2 * 1024 * 1024, validate=True, check_fragments=False):
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self.validate = validate
+        self.check_fragments = check_fragments
+        self._len = 0
+        self._start = -1
+        self._scan = 0
+        self._in_scan = False
+        self._has_sof = False
+        self._scan_start = 0
+        self._rst_next = 0
+        self._rst_seen = 0
+        self._rst_expected = None
+        self._restart_interval = 0
+        self._components = {}
+        self._mcu_grid = None
+        self._bounds = []
+        self.frames = 0
+        self.overflows = 0
+        self.rejected = 0
+        self.reject_reasons = collections.Counter()
+
+    @property
+    def capacity(self):
+        return len(self._buf)
+
+    def writable(self, min_free=65536):
+        if len(self._buf) - self._len < min_free:
+            self._compact(min_free)
+        return self._view[self._len:]
+
+    def commit(self, nbytes, datagram=False):
+        # datagram=True: these bytes are one whole UDP datagram (one fragment
+        # of the sender's frame), for the check_fragments check.
+        self._len += nbytes
+        if datagram and nbytes and self.validate and self.check_fragments:
+            self._bounds.append(self._len)
+        return self._extract()
+
+    def feed(self, data):
+        frames = []
+        data = memoryview(data)
+        while data:
+            target = self.writable(min(len(data), 65536))
+            n = min(len(target), len(data))
+            target[:n] = data[:n]
+            data = data[n:]
+            frames.extend(self.commit(n))
+        return frames
+
+    def reset(self):
+        self._len = 0
+        self._start = -1
+        self._scan = 0
+        self._bounds = []
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "rejected": self.rejected,
+            "reject_reasons": dict(self.reject_reasons),
+            "overflows": self.overflows,
+        }
+
+    def _extract(self):
+        frames = []
+        buf = self._buf
+        while True:
+            if self._start < 0:
+                # A marker may straddle the previous chunk boundary.
+                pos = buf.find(SOI, max(self._scan - 1, 0), self._len)
+                if pos == -1:
+                    self._scan = self._len
+                    break
+                self._start = pos
+                self._scan = pos + 2
+                self._in_scan = False
+                self._has_sof = False
+                self._restart_interval = 0
+                self._mcu_grid = None
+            if self.validate:
+                end = self._walk()
+            else:
+                end = buf.find(EOI, max(self._scan - 1, self._start + 2), self._len)
+                end = end + 2 if end != -1 else None
+                if end is None:
+                    self._scan = self._len
+            if end is None:
+                break
+            if end < 0:
+                continue
+            frames.append(bytes(self._view[self._start:end]))
+            self.frames += 1
+            self._start = -1
+            self._scan = end
+        return frames
+
+    def _reject(self, reason, resume):
+        self.rejected += 1
+        self.reject_reasons[reason] += 1
+        self._start = -1
+        self._scan = resume
+        return -1
+
+    def _walk(self):
+        # Advances the structural walk of the frame at self._start. Returns
+        # the offset just past EOI for a complete frame, None when more data
+        # is needed, or -1 after rejecting the frame.
+        buf = self._buf
+        n = self._len
+        pos = self._scan
+        while True:
+            if self._in_scan:
+                q = buf.find(0xFF, pos, n)
+                if q == -1 or q + 1 >= n:
+                    self._scan = n if q == -1 else q
+                    return None
+                m = buf[q + 1]
+                if m == 0x00:
+                    pos = q + 2
+                elif m == 0xFF:
+                    pos = q + 1
+                elif 0xD0 <= m <= 0xD7:
+                    if m != 0xD0 + self._rst_next:
+                        return self._reject("restart_sequence", q)
+                    self._rst_next = (self._rst_next + 1) & 7
+                    self._rst_seen += 1
+                    pos = q + 2
+                elif m == 0xD9:
+                    if q == self._scan_start:
+                        return self._reject("empty_scan", q + 2)
+                    if self._rst_expected is not None:
+                        if self._rst_seen < self._rst_expected:
+                            return self._reject("missing_restarts", q + 2)
+                    elif not self._fragments_complete(q + 2):
+                        return self._reject("missing_fragments", q + 2)
+                    return q + 2
+                elif m == 0xD8:
+                    return self._reject("torn", q)
+                else:
+                    # Another segment (multi-scan JPEG): back to headers.
+                    if self._rst_expected is not None and self._rst_seen < self._rst_expected:
+                        return self._reject("missing_restarts", q)
+                    self._in_scan = False
+                    pos = q
+                continue
+
+            if pos + 1 >= n:
+                self._scan = pos
+                return None
+            if buf[pos] != 0xFF:
+                return self._reject("bad_marker", pos)
+            m = buf[pos + 1]
+            if m == 0xFF:
+                pos += 1
+                continue
+            if m == 0xD8:
+                return self._reject("torn", pos)
+            if m == 0xD9:
+                return self._reject("no_scan", pos + 2)
+            if 0xD0 <= m <= 0xD7 or m == 0x01:
+                pos += 2
+                continue
+            if pos + 3 >= n:
+                self._scan = pos
+                return None
+            length = (buf[pos + 2] << 8) | buf[pos + 3]
+            if length < 2:
+                return self._reject("bad_length", pos + 2)
+            end = pos + 2 + length
+            if end > n:
+                self._scan = pos
+                return None
+            if m in SOF_MARKERS:
+                if not self._frame_header(m, pos, length):
+                    return self._reject("bad_frame_header", end)
+                self._has_sof = True
+            elif m == 0xDD:
+                if length != 4:
+                    return self._reject("bad_length", end)
+                self._restart_interval = (buf[pos + 4] << 8) | buf[pos + 5]
+            elif m == 0xDA:
+                if not self._has_sof:
+                    return self._reject("no_frame_header", end)
+                self._in_scan = True
+                self._scan_start = end
+                self._rst_next = 0
+                self._rst_seen = 0
+                self._rst_expected = self._expected_restarts(pos, length)
+            pos = end
+
+    def _frame_header(self, marker, pos, length):
+        # SOFn: P, Y, X, Nf, then (id, HiVi, Tq) per component.
+        buf = self._buf
+        if length < 8 or length < 8 + 3 * buf[pos + 9]:
+            return False
+        self._components = {}
+        self._mcu_grid = None
+        height = (buf[pos + 5] << 8) | buf[pos + 6]
+        width = (buf[pos + 7] << 8) | buf[pos + 8]
+        for i in range(buf[pos + 9]):
+            c = pos + 10 + 3 * i
+            self._components[buf[c]] = (buf[c + 1] >> 4, buf[c + 1] & 15)
+        # Height 0 means a later DNL segment sets it; skip the check then.
+        if marker in SEQUENTIAL_SOF and height and width and self._components:
+            self._mcu_grid = (width, height)
+        return True
+
+    def _expected_restarts(self, pos, length):
+        # RST markers between the Ri-MCU intervals of the scan at pos, or
+        # None when the scan's MCU count is unknown or restarts are off.
+        if not self._restart_interval or self._mcu_grid is None or length < 3:
+            return None
+        buf = self._buf
+        width, height = self._mcu_grid
+        hmax = max(h for h, v in self._components.values())
+        vmax = max(v for h, v in self._components.values())
+        if not hmax or not vmax:
+            return None
+        if buf[pos + 4] == 1:
+            # Non-interleaved: one MCU per 8x8 block of that component.
+            h, v = self._components.get(buf[pos + 5], (hmax, vmax))
+            cols = (-(-width * h // hmax) + 7) // 8
+            rows = (-(-height * v // vmax) + 7) // 8
+        else:
+            cols = -(-width // (8 * hmax))
+            rows = -(-height // (8 * vmax))
+        return -(-(cols * rows) // self._restart_interval) - 1
+
+    def _fragments_complete(self, end):
+        # The datagrams strictly inside [start, end) are whole fragments of
+        # this frame. The bar is their most common size, taken per frame so a
+        # stray datagram elsewhere never sets it; a shorter size that recurs
+        # is the sender's own pattern (e.g. alternating 64/60), so only a
+        # shorter one-off counts as a truncated fragment.
+        bounds = self._bounds
+        first = bisect.bisect_right(bounds, self._start)
+        last = bisect.bisect_left(bounds, end) - 1
+        if last - first < 2:
+            return True
+        sizes = [bounds[i + 1] - bounds[i] for i in range(first, last)]
+        counts = collections.Counter(sizes)
+        fragment = max(counts, key=lambda size: (counts[size], size))
+        return all(size >= fragment or counts[size] > 1 for size in counts)
+
+    def _compact(self, min_free):
+        if self._start >= 0:
+            keep = self._start
+        else:
+            # Only a trailing 0xFF can still begin a marker.
+            keep = max(self._scan - 1, 0)
+        tail = self._len - keep
+        if tail > len(self._buf) - min_free:
+            # Frame larger than the arena: drop it and resynchronise.
+            self.overflows += 1
+            self.reset()
+            return
+        if tail:
+            if keep >= tail:
+                self._buf[:tail] = self._view[keep:self._len]
+            else:
+                self._buf[:tail] = bytes(self._view[keep:self._len])
+        self._len = tail
+        self._scan -= keep
+        self._scan_start -= keep
+        if self._bounds:
+            drop = bisect.bisect_right(self._bounds, keep)
+            self._bounds = [b - keep for b in self._bounds[drop:]]
+        if self._start >= 0:
+            self._start = 0
+
+
+def mjpeg_part_header(frame):
+    return b"%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % (BOUNDARY, len(frame))
+
+
 def jpeg_frames_from_pipe(pipe):
-    buf = bytearray()
-    soi = b"\xff\xd8"
-    eoi = b"\xff\xd9"
+    assembler = JpegFrameAssembler()
+    readinto = getattr(pipe, "readinto1", None) or pipe.readinto
     while True:
-        chunk = pipe.read(4096)
-        if not chunk:
+        n = readinto(assembler.writable())
+        if not n:
             return
-        buf.extend(chunk)
-        while True:
-            start = buf.find(soi)
-            if start == -1:
-                if len(buf) > 2 * 1024 * 1024:
-                    buf.clear()
-                break
-            end = buf.find(eoi, start + 2)
-            if end == -1:
-                if start > 0:
-                    del buf[:start]
-                break
-            frame = bytes(buf[start:end + 2])
-            del buf[:end + 2]
+        for frame in assembler.commit(n):
             yield frame
 
 
-class StreamHandler(http.server.BaseHTTPRequestHandler):
+class FrameClient:
+    # One viewer's delivery queue. The producer only ever appends here, so a
+    # slow viewer drops its own oldest frames instead of stalling capture.
+    def __init__(self, name, maxlen=1):
+        self.name = name
+        self.maxlen = maxlen
+        self.delivered = 0
+        self.skipped = 0
+        self.blocked = 0.0
+        self.connected_at = time.time()
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+        self._closed = False
+
+    def put(self, part):
+        with self._cond:
+            if len(self._queue) >= self.maxlen:
+                self._queue.popleft()
+                self.skipped += 1
+            self._queue.append(part)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._queue or self._closed, timeout):
+                return None
+            if not self._queue:
+                return None
+            return self._queue.popleft()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def send(self, wfile, part):
+        header, frame = part
+        start = time.monotonic()
+        wfile.write(header)
+        wfile.write(frame)
+        wfile.write(b"\r\n")
+        self.blocked += time.monotonic() - start
+        self.delivered += 1
+
+    def stats(self):
+        return {
+            "client": self.name,
+            "delivered": self.delivered,
+            "skipped": self.skipped,
+            "blocked_s": round(self.blocked, 3),
+            "connected_s": round(time.time() - self.connected_at, 1),
+        }
+
+
+class FrameHub:
+    # Frames are published as (part_header, jpeg) so the multipart header is
+    # built once per frame no matter how many viewers receive it.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = []
+        self._listeners = []
+        self._part = None
+        self._closed = False
+        self.published = 0
+
+    def publish(self, frame):
+        part = (mjpeg_part_header(frame), frame)
+        with self._lock:
+            self._part = part
+            self.published += 1
+            clients = list(self._clients)
+            listeners = list(self._listeners)
+        for client in clients:
+            client.put(part)
+        for listener in listeners:
+            listener(part)
+
+    def add_listener(self, listener):
+        # listener(part) runs on the producer thread and must not block;
+        # it is called with None once the hub closes.
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def subscribe(self, name, maxlen=1):
+        client = FrameClient(name, maxlen)
+        with self._lock:
+            if self._closed:
+                client.close()
+                return client
+            self._clients.append(client)
+            part = self._part
+        if part is not None:
+            client.put(part)
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+        client.close()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            clients = list(self._clients)
+            listeners = list(self._listeners)
+        for client in clients:
+            client.close()
+        for listener in listeners:
+            listener(None)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def stats(self):
+        with self._lock:
+            clients = list(self._clients)
+        return [client.stats() for client in clients]
+
+
+class FrameProducer:
+    def __init__(self, key):
+        self.key = key
+        self.hub = FrameHub()
+        self._viewers = 0
+        self._running = False
+        self._thread = None
+
+    def attach(self):
+        self._viewers += 1
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._run_and_close, daemon=True)
+            self._thread.start()
+
+    def detach(self):
+        self._viewers = max(0, self._viewers - 1)
+
+    def stop(self):
+        self._running = False
+        self._stop()
+
+    @property
+    def viewers(self):
+        return self._viewers
+
+    @property
+    def running(self):
+        return self._running
+
+    def stats(self):
+        return {
+            "source": str(self.key),
+            "viewers": self._viewers,
+            "frames": self.hub.published,
+            "clients": self.hub.stats(),
+        }
+
+    def _run_and_close(self):
+        try:
+            self._run()
+        finally:
+            self._running = False
+            self.hub.close()
+
+    def _run(self):
+        raise NotImplementedError
+
+    def _stop(self):
+        pass
+
+
+class ProducerPool:
+    # Reference-counts producers by key. With idle_grace > 0 a producer whose
+    # last viewer left keeps running for that many seconds so a reconnecting
+    # viewer picks it up warm instead of paying for a fresh start.
+    def __init__(self, idle_grace=0.0):
+        self.idle_grace = idle_grace
+        self._lock = threading.Lock()
+        self._producers = {}
+        self._reap_tokens = {}
+
+    def acquire(self, key, factory):
+        with self._lock:
+            producer = self._producers.get(key)
+            if producer is None or producer.hub.closed:
+                producer = factory()
+                self._producers[key] = producer
+            self._reap_tokens.pop(key, None)
+            producer.attach()
+            return producer
+
+    def release(self, producer):
+        with self._lock:
+            producer.detach()
+            if producer.viewers > 0 or self._producers.get(producer.key) is not producer:
+                return
+            if self.idle_grace <= 0:
+                del self._producers[producer.key]
+                producer.stop()
+                return
+            token = object()
+            self._reap_tokens[producer.key] = token
+        timer = threading.Timer(self.idle_grace, self._reap, (producer, token))
+        timer.daemon = True
+        timer.start()
+
+    def _reap(self, producer, token):
+        with self._lock:
+            if self._reap_tokens.get(producer.key) is not token:
+                return
+            del self._reap_tokens[producer.key]
+            if producer.viewers > 0 or self._producers.get(producer.key) is not producer:
+                return
+            del self._producers[producer.key]
+        producer.stop()
+
+    def stats(self):
+        with self._lock:
+            producers = list(self._producers.values())
+        return [producer.stats() for producer in producers]
+
+
+class FfmpegReader:
+    # One ffmpeg process plus the thread draining its stdout.
+    def __init__(self, cmd, transport, on_frame):
+        self.transport = transport
+        self.started = time.monotonic()
+        self.first_frame = None
+        self.last_frame = None
+        self.frames = 0
+        self._on_frame = on_frame
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        try:
+            for frame in jpeg_frames_from_pipe(self._proc.stdout):
+                now = time.monotonic()
+                if self.first_frame is None:
+                    self.first_frame = now
+                self.last_frame = now
+                self.frames += 1
+                self._on_frame(self, frame)
+        except (OSError, ValueError):
+            pass
+
+    @property
+    def alive(self):
+        return self._proc.poll() is None
+
+    def stalled(self, now, connect_timeout, stall_timeout):
+        if not self.alive:
+            return True
+        if self.last_frame is None:
+            return now - self.started > connect_timeout
+        return now - self.last_frame > stall_timeout
+
+    def kill(self):
+        try:
+            self._proc.kill()
+        except OSError:
+            pass
+        self._proc.wait()
+
+
+# Last RTSP transport that delivered frames, per URL; new producers start there.
+preferred_transports = {}
+
+
+def rtsp_transport_order(rtsp_url, transports):
+    # The preferred transport first, then the rest in their configured order.
+    first = preferred_transports.get(rtsp_url, transports[0])
+    if first not in transports:
+        first = transports[0]
+    i = transports.index(first)
+    return transports[i:] + transports[:i]
+
+
+class FfmpegFrameProducer(FrameProducer):
+    # Supervises ffmpeg rather than waiting for it to exit: a reader that has
+    # produced no frame for stall_timeout (connect_timeout before the first
+    # frame) is replaced straight away, by a pre-connected standby on the
+    # alternate transport when one is warm, else by a fresh process on the
+    # next transport.
+    def __init__(
+        self,
+        ffmpeg,
+        rtsp_url,
+        transports,
+        fps=15,
+        quality=5,
+        stall_timeout=2.0,
+        connect_timeout=5.0,
+        standby=False,
+    ):
+        super().__init__((rtsp_url, tuple(transports), fps, quality))
+        self.ffmpeg = ffmpeg
+        self.rtsp_url = rtsp_url
+        self.transports = transports
+        self.fps = fps
+        self.quality = quality
+        self.stall_timeout = stall_timeout
+        self.connect_timeout = connect_timeout
+        self.standby = standby
+        self.stalls = 0
+        self.time_to_first_frame = None
+        self.recoveries = collections.deque(maxlen=20)
+        self._active = None
+        self._standby = None
+        self._stall_at = None
+        self._wake = threading.Event()
+        self._created = time.monotonic()
+
+    def _command(self, transport):
+        return [
+            self.ffmpeg,
+            "-loglevel",
+            "error",
+            "-rtsp_transport",
+            transport,
+            "-i",
+            self.rtsp_url,
+            "-vf",
+            "fps=%g" % self.fps,
+            "-f",
+            "mjpeg",
+            "-q:v",
+            str(self.quality),
+            "pipe:1",
+        ]
+
+    def _spawn(self, transport):
+        try:
+            return FfmpegReader(self._command(transport), transport, self._on_frame)
+        except OSError:
+            return None
+
+    def _next_transport(self, transport):
+        if transport not in self.transports:
+            return self.transports[0]
+        return self.transports[(self.transports.index(transport) + 1) % len(self.transports)]
+
+    def _on_frame(self, reader, frame):
+        if reader is not self._active or not self._running:
+            return
+        if reader.frames == 1:
+            preferred_transports[self.rtsp_url] = reader.transport
+            if self.time_to_first_frame is None:
+                self.time_to_first_frame = reader.first_frame - self._created
+            elif self._stall_at is not None:
+                self.recoveries.append(reader.first_frame - self._stall_at)
+            self._stall_at = None
+        self.hub.publish(frame)
+
+    def _promote(self, failed, now):
+        self.stalls += 1
+        if self._stall_at is None:
+            self._stall_at = failed.last_frame if failed.last_frame is not None else now
+        standby = self._standby
+        if standby is not None and standby.alive:
+            self._standby = None
+            self._active = standby
+            failed.kill()
+            if standby.first_frame is not None:
+                # Frames are already flowing on the standby; it only has to
+                # start publishing, so recovery is about one frame interval.
+                self.recoveries.append(now - self._stall_at)
+                self._stall_at = None
+                preferred_transports[self.rtsp_url] = standby.transport
+            return
+        failed.kill()
+        self._active = self._spawn(self._next_transport(failed.transport))
+
+    def _run(self):
+        first = rtsp_transport_order(self.rtsp_url, self.transports)[0]
+        self._active = self._spawn(first)
+        try:
+            while self._running:
+                self._wake.wait(0.1)
+                if not self._running:
+                    break
+                now = time.monotonic()
+                active = self._active
+                if active is None:
+                    self._active = self._spawn(first)
+                    if self._active is None:
+                        return
+                elif active.stalled(now, self.connect_timeout, self.stall_timeout):
+                    self._promote(active, now)
+                if self.standby and len(self.transports) > 1:
+                    self._supervise_standby(now)
+        finally:
+            for reader in (self._active, self._standby):
+                if reader is not None:
+                    reader.kill()
+            self._active = None
+            self._standby = None
+
+    def _supervise_standby(self, now):
+        standby = self._standby
+        if standby is not None and standby.stalled(now, self.connect_timeout, self.stall_timeout):
+            standby.kill()
+            standby = self._standby = None
+        if standby is None and self._active is not None:
+            self._standby = self._spawn(self._next_transport(self._active.transport))
+
+    def _stop(self):
+        self._wake.set()
+
+    def stats(self):
+        stats = super().stats()
+        active = self._active
+        standby = self._standby
+        stats.update(
+            {
+                "transport": active.transport if active is not None else None,
+                "standby": standby.transport if standby is not None else None,
+                "stalls": self.stalls,
+                "time_to_first_frame_s": round(self.time_to_first_frame, 3)
+                if self.time_to_first_frame is not None
+                else None,
+                "recovery_s": [round(r, 3) for r in self.recoveries],
+            }
+        )
+        return stats
+
+
+udp_producers = ProducerPool()
+rtsp_producers = ProducerPool(idle_grace=5.0)
+
+
+def acquire_rtsp_producer(ffmpeg, rtsp_url, transports, fps=15, quality=5, **supervision):
+    key = (rtsp_url, tuple(transports), fps, quality)
+    return rtsp_producers.acquire(
+        key, lambda: FfmpegFrameProducer(ffmpeg, rtsp_url, transports, fps, quality, **supervision)
+    )
+
+
+def stats_snapshot():
+    return {"udp": udp_producers.stats(), "rtsp": rtsp_producers.stats()}
+
+
+class MjpegStreamHandler(http.server.BaseHTTPRequestHandler):
     server_version = "WiFiCamStreamer/1.0"
 
     def do_GET(self):
-        if self.path not in ("/", "/stream"):
+        if self.path in PASSTHROUGH_FORMATS:
+            self.do_passthrough(*PASSTHROUGH_FORMATS[self.path])
+            return
+
+        if self.path not in ("/", "/stream", "/stats"):
             self.send_response(404)
             self.end_headers()
             return
 
         if self.path == "/":
-            html = (
-                "<html><head><title>WiFi CAM Stream</title></head>"
-                "<body><img src=\"/stream\" style=\"width:100%\"></body></html>"
-            )
+            html = INDEX_HTML
             self.send_response(200)
             self.send_header("Content-Type", "text/html")
             self.send_header("Content-Length", str(len(html)))
@@ -72,22 +839,98 @@ class StreamHandler(http.server.BaseHTTPRequestHandler):
             self.wfile.write(html.encode("ascii"))
             return
 
-        ffmpeg = which("ffmpeg")
-        if not ffmpeg:
-            self.send_response(500)
+        if self.path == "/stats":
+            body = json.dumps(stats_snapshot(), indent=2).encode("ascii")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
             self.end_headers()
-            self.wfile.write(b"ffmpeg not found in PATH")
+            self.wfile.write(body)
             return
 
-        rtsp_url = self.server.rtsp_url
+        self.do_stream()
+
+    def do_stream(self):
+        raise NotImplementedError
+
+    def do_passthrough(self, content_type, mux_args):
+        self.send_response(404)
+        self.end_headers()
+
+    def send_stream_headers(self):
         self.send_response(200)
         self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=%s" % BOUNDARY.decode("ascii"))
         self.send_header("Cache-Control", "no-cache")
         self.send_header("Pragma", "no-cache")
         self.end_headers()
 
-        transports = self.server.rtsp_transports
-        for transport in transports:
+    def stream_from_hub(self, hub):
+        client = hub.subscribe("%s:%d" % self.client_address[:2])
+        try:
+            while True:
+                part = client.get(timeout=5.0)
+                if part is None:
+                    if client.closed:
+                        break
+                    continue
+                try:
+                    client.send(self.wfile, part)
+                except (BrokenPipeError, ConnectionResetError):
+                    break
+        finally:
+            hub.unsubscribe(client)
+            self.log_message(
+                "stream closed: delivered=%d skipped=%d blocked=%.2fs",
+                client.delivered,
+                client.skipped,
+                client.blocked,
+            )
+
+
+class StreamHandler(MjpegStreamHandler):
+    def do_stream(self):
+        ffmpeg = which("ffmpeg")
+        if not ffmpeg:
+            self.send_response(500)
+            self.end_headers()
+            self.wfile.write(b"ffmpeg not found in PATH")
+            return
+
+        self.send_stream_headers()
+
+        # One ffmpeg per (url, transports, fps, quality), shared by all viewers.
+        producer = acquire_rtsp_producer(
+            ffmpeg,
+            self.server.rtsp_url,
+            self.server.rtsp_transports,
+            getattr(self.server, "rtsp_fps", 15),
+            getattr(self.server, "rtsp_quality", 5),
+            **getattr(self.server, "rtsp_supervision", {})
+        )
+        try:
+            self.stream_from_hub(producer.hub)
+        finally:
+            rtsp_producers.release(producer)
+
+    def do_passthrough(self, content_type, mux_args):
+        # Remux the drone's H.264 as-is (-c copy): no decode, no re-encode,
+        # native frame rate. Each viewer gets its own ffmpeg because a
+        # byte-stream container cannot drop data the way MJPEG frames can.
+        ffmpeg = which("ffmpeg")
+        if not ffmpeg:
+            self.send_response(500)
+            self.end_headers()
+            self.wfile.write(b"ffmpeg not found in PATH")
+            return
+
+        rtsp_url = self.server.rtsp_url
+        timeout = getattr(self.server, "rtsp_supervision", {}).get("connect_timeout", 5.0)
+        # Same transport order as the MJPEG ingest. The 200 goes out only
+        # once ffmpeg has produced its first bytes, so a dead camera or a
+        # failed transport still gets a proper error status.
+        proc = chunk = None
+        spawned = 0
+        for transport in rtsp_transport_order(rtsp_url, list(self.server.rtsp_transports)):
             cmd = [
                 ffmpeg,
                 "-loglevel",
@@ -96,33 +939,57 @@ class StreamHandler(http.server.BaseHTTPRequestHandler):
                 transport,
                 "-i",
                 rtsp_url,
-                "-vf",
-                "fps=15",
-                "-f",
-                "mjpeg",
-                "-q:v",
-                "5",
-                "pipe:1",
-            ]
-
-            proc = None
+                "-an",
+                "-c",
+                "copy",
+            ] + mux_args + ["pipe:1"]
             try:
-                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                for frame in jpeg_frames_from_pipe(proc.stdout):
-                    try:
-                        self.wfile.write(BOUNDARY + b"\r\n")
-                        self.wfile.write(b"Content-Type: image/jpeg\r\n")
-                        self.wfile.write(b"Content-Length: %d\r\n\r\n" % len(frame))
-                        self.wfile.write(frame)
-                        self.wfile.write(b"\r\n")
-                    except (BrokenPipeError, ConnectionResetError):
-                        return
-            except Exception:
-                pass
-            finally:
-                if proc is not None:
-                    proc.kill()
-                    proc.wait()
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            except OSError as exc:
+                self.log_message("passthrough: cannot start ffmpeg: %s", exc)
+                continue
+            spawned += 1
+            chunk = self._first_bytes(proc, timeout)
+            if chunk:
+                break
+            self.log_message("passthrough: no data over %s within %.1fs", transport, timeout)
+            proc.kill()
+            proc.wait()
+            proc = None
+
+        if proc is None:
+            # 502: ffmpeg ran but the camera gave nothing; 503: it never ran.
+            self.send_response(502 if spawned else 503)
+            self.end_headers()
+            return
+        preferred_transports[rtsp_url] = transport
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Pragma", "no-cache")
+        self.end_headers()
+
+        sent = 0
+        try:
+            while chunk:
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                chunk = proc.stdout.read1(65536)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            proc.kill()
+            proc.wait()
+            self.log_message("passthrough closed: transport=%s bytes=%d", transport, sent)
+
+    @staticmethod
+    def _first_bytes(proc, timeout):
+        # b"" when ffmpeg exits or stays silent for timeout seconds.
+        ready, _, _ = select.select([proc.stdout], [], [], timeout)
+        if not ready:
+            return b""
+        return proc.stdout.read1(65536)
 
 
 class ThreadedHTTPServer(http.server.ThreadingHTTPServer):
@@ -141,91 +1008,498 @@ def build_rtsp_url(ip, mode):
     return mode
 
 
-def jpeg_frames_from_udp(sock, keepalive=None):
-    buf = bytearray()
-    soi = b"\xff\xd8"
-    eoi = b"\xff\xd9"
-    last_keepalive = 0.0
-    while True:
-        if keepalive is not None and time.time() - last_keepalive >= keepalive["interval"]:
+# Linux: ask for a cumulative "dropped because the receive queue was full"
+# counter as ancillary data on every datagram.
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40 if sys.platform.startswith("linux") else None)
+
+
+class UdpReceiver:
+    # Receives datagrams straight into a JpegFrameAssembler arena. The socket
+    # is switched to non-blocking: one wait for the first datagram, then the
+    # kernel queue is drained in a single pass of up to `batch` recvs.
+    def __init__(self, sock, rcvbuf=None, batch=64, timeout=2.0):
+        self.sock = sock
+        self.batch = batch
+        self.timeout = timeout
+        self.datagrams = 0
+        self.batches = 0
+        self.truncated = 0
+        self.kernel_drops = 0
+        self.rcvbuf = None
+        if rcvbuf:
+            for option in (getattr(socket, "SO_RCVBUFFORCE", None), socket.SO_RCVBUF):
+                if option is None:
+                    continue
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, option, int(rcvbuf))
+                    break
+                except OSError:
+                    continue
+        try:
+            self.rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        except OSError:
+            pass
+        self._ancbuf = 0
+        if SO_RXQ_OVFL is not None:
             try:
-                sock.sendto(keepalive["data"], keepalive["addr"])
+                sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+                self._ancbuf = socket.CMSG_SPACE(4)
             except OSError:
                 pass
-            last_keepalive = time.time()
+        sock.setblocking(False)
+
+    def _recv(self, view):
+        if not self._ancbuf:
+            return self.sock.recv_into(view)
+        n, ancdata, flags, _ = self.sock.recvmsg_into([view], self._ancbuf)
+        if flags & socket.MSG_TRUNC:
+            self.truncated += 1
+        for level, kind, data in ancdata:
+            if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL and len(data) >= 4:
+                self.kernel_drops = struct.unpack("=I", data[:4])[0]
+        return n
+
+    def receive(self, assembler):
+        # Returns the frames completed by one batch; raises socket.timeout
+        # when nothing arrives within self.timeout.
+        frames = []
+        for i in range(self.batch):
+            try:
+                n = self._recv(assembler.writable())
+            except (BlockingIOError, InterruptedError):
+                if i:
+                    break
+                ready, _, _ = select.select([self.sock], [], [], self.timeout)
+                if not ready:
+                    raise socket.timeout("no UDP data for %.1fs" % self.timeout)
+                continue
+            self.datagrams += 1
+            if n:
+                frames.extend(assembler.commit(n, datagram=True))
+        self.batches += 1
+        return frames
+
+    def stats(self):
+        return {
+            "rcvbuf": self.rcvbuf,
+            "datagrams": self.datagrams,
+            "datagrams_per_batch": round(self.datagrams / self.batches, 1) if self.batches else 0,
+            "truncated": self.truncated,
+            "kernel_drops": self.kernel_drops,
+        }
+
+
+class KeepaliveSender:
+    # Re-sends the stream command on its own timer so keepalives keep going
+    # out on schedule even while the receive side is blocked or idle.
+    def __init__(self, sock, data, addr, interval):
+        self.sock = sock
+        self.data = data
+        self.addr = addr
+        self.interval = interval
+        self.sent = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def send_now(self):
         try:
-            data = sock.recv(2048)
+            self.sock.sendto(self.data, self.addr)
+            self.sent += 1
         except OSError:
-            return
-        if not data:
-            continue
-        buf.extend(data)
-        while True:
-            start = buf.find(soi)
-            if start == -1:
-                if len(buf) > 2 * 1024 * 1024:
-                    buf.clear()
-                break
-            end = buf.find(eoi, start + 2)
-            if end == -1:
-                if start > 0:
-                    del buf[:start]
-                break
-            frame = bytes(buf[start:end + 2])
-            del buf[:end + 2]
-            yield frame
+            pass
 
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.send_now()
 
-class UdpStreamHandler(http.server.BaseHTTPRequestHandler):
-    server_version = "WiFiCamStreamer/1.0"
 
-    def do_GET(self):
-        if self.path not in ("/", "/stream"):
-            self.send_response(404)
-            self.end_headers()
-            return
+def placeholder_jpeg(width=320, height=240):
+    # Smallest valid baseline greyscale JPEG: flat mid-grey, every 8x8 block
+    # coded as "DC diff 0, EOB" with one-symbol Huffman tables (2 bits/block).
+    def segment(marker, payload):
+        return struct.pack(">BBH", 0xFF, marker, len(payload) + 2) + payload
 
-        if self.path == "/":
-            html = (
-                "<html><head><title>WiFi CAM Stream</title></head>"
-                "<body><img src=\"/stream\" style=\"width:100%\"></body></html>"
-            )
-            self.send_response(200)
-            self.send_header("Content-Type", "text/html")
-            self.send_header("Content-Length", str(len(html)))
-            self.end_headers()
-            self.wfile.write(html.encode("ascii"))
-            return
+    one_symbol = bytes([1] + [0] * 15) + b"\x00"
+    blocks = ((width + 7) // 8) * ((height + 7) // 8)
+    nbits = 2 * blocks
+    scan = bytearray(nbits // 8)
+    if nbits % 8:
+        scan.append(0xFF >> (nbits % 8))
+    return b"".join(
+        (
+            SOI,
+            segment(0xDB, b"\x00" + b"\x01" * 64),
+            segment(0xC0, struct.pack(">BHHB", 8, height, width, 1) + b"\x01\x11\x00"),
+            segment(0xC4, b"\x00" + one_symbol),
+            segment(0xC4, b"\x10" + one_symbol),
+            segment(0xDA, b"\x01\x01\x00\x00\x3f\x00"),
+            bytes(scan),
+            EOI,
+        )
+    )
 
-        self.send_response(200)
-        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=%s" % BOUNDARY.decode("ascii"))
-        self.send_header("Cache-Control", "no-cache")
-        self.send_header("Pragma", "no-cache")
-        self.end_headers()
 
+def jpeg_frames_from_udp(sock, keepalive=None, receiver=None, assembler=None):
+    # Yields each completed frame, and None after a receive round (or
+    # timeout) that completed none, so callers can run watchdogs and notice
+    # shutdown. Ends only on a real socket error.
+    if assembler is None:
+        assembler = JpegFrameAssembler()
+    if receiver is None:
+        receiver = UdpReceiver(sock)
+    sender = None
+    if keepalive is not None:
+        sender = KeepaliveSender(sock, keepalive["data"], keepalive["addr"], keepalive["interval"])
+        sender.send_now()
+        sender.start()
+    try:
+        while True:
+            try:
+                frames = receiver.receive(assembler)
+            except socket.timeout:
+                frames = ()
+            except OSError:
+                return
+            if not frames:
+                yield None
+            for frame in frames:
+                yield frame
+    finally:
+        if sender is not None:
+            sender.stop()
+
+
+class UdpFrameProducer(FrameProducer):
+    # Keeps the stream alive across drone hiccups: when no frame arrives for
+    # frame_deadline seconds the start command is re-sent with exponential
+    # backoff, and viewers optionally get a grey placeholder frame meanwhile.
+    def __init__(
+        self,
+        addr,
+        command,
+        keepalive_interval,
+        rcvbuf=None,
+        frame_deadline=3.0,
+        max_backoff=8.0,
+        placeholder=False,
+        validate=True,
+        check_fragments=False,
+    ):
+        super().__init__(addr)
+        self.addr = addr
+        self.command = command
+        self.keepalive_interval = keepalive_interval
+        self.rcvbuf = rcvbuf
+        self.frame_deadline = frame_deadline
+        self.max_backoff = max_backoff
+        self.placeholder = placeholder_jpeg() if placeholder else None
+        self.receiver = None
+        self.assembler = JpegFrameAssembler(validate=validate, check_fragments=check_fragments)
+        self.restarts = 0
+        self.recoveries = collections.deque(maxlen=20)
+        self._last_frame = None
+        self._outage_since = None
+        self._next_restart = 0.0
+        self._backoff = 0.5
+
+    def stats(self):
+        stats = super().stats()
+        if self.receiver is not None:
+            stats.update(self.receiver.stats())
+        stats.update(
+            {
+                "frames_rejected": self.assembler.rejected,
+                "reject_reasons": dict(self.assembler.reject_reasons),
+                "restarts": self.restarts,
+                "reconnecting": self._outage_since is not None,
+                "recovery_s": [round(r, 3) for r in self.recoveries],
+            }
+        )
+        return stats
+
+    def _run(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.settimeout(2.0)
+        self.receiver = UdpReceiver(sock, rcvbuf=self.rcvbuf, timeout=0.25)
+        self._last_frame = time.monotonic()
         try:
-            sock.sendto(self.server.udp_command, self.server.udp_addr)
+            sock.sendto(self.command, self.addr)
             keepalive = None
-            if self.server.udp_keepalive > 0:
+            if self.keepalive_interval > 0:
                 keepalive = {
-                    "data": self.server.udp_command,
-                    "addr": self.server.udp_addr,
-                    "interval": self.server.udp_keepalive,
+                    "data": self.command,
+                    "addr": self.addr,
+                    "interval": self.keepalive_interval,
                 }
-            for frame in jpeg_frames_from_udp(sock, keepalive):
-                try:
-                    self.wfile.write(BOUNDARY + b"\r\n")
-                    self.wfile.write(b"Content-Type: image/jpeg\r\n")
-                    self.wfile.write(b"Content-Length: %d\r\n\r\n" % len(frame))
-                    self.wfile.write(frame)
-                    self.wfile.write(b"\r\n")
-                except (BrokenPipeError, ConnectionResetError):
+            for frame in jpeg_frames_from_udp(sock, keepalive, self.receiver, self.assembler):
+                if not self._running:
                     break
+                now = time.monotonic()
+                if frame is None:
+                    self._watchdog(sock, now)
+                    continue
+                if self._outage_since is not None:
+                    self.recoveries.append(now - self._outage_since)
+                    self._outage_since = None
+                    self._backoff = 0.5
+                self._last_frame = now
+                self.hub.publish(frame)
+        except OSError:
+            pass
         finally:
             sock.close()
 
+    def _watchdog(self, sock, now):
+        if now - self._last_frame < self.frame_deadline:
+            return
+        if self._outage_since is None:
+            self._outage_since = self._last_frame
+            self._next_restart = now
+        if now < self._next_restart:
+            return
+        try:
+            sock.sendto(self.command, self.addr)
+        except OSError:
+            pass
+        self.restarts += 1
+        self._next_restart = now + self._backoff
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+        if self.placeholder is not None:
+            self.hub.publish(self.placeholder)
+
+
+def acquire_udp_producer(addr, command, keepalive_interval, rcvbuf=None, **recovery):
+    return udp_producers.acquire(
+        addr, lambda: UdpFrameProducer(addr, command, keepalive_interval, rcvbuf, **recovery)
+    )
+
+
+class UdpStreamHandler(MjpegStreamHandler):
+    def do_stream(self):
+        self.send_stream_headers()
+
+        # All viewers of one (ip, udp_port) share a single capture socket and
+        # reassembler; each viewer only drains its own bounded queue.
+        producer = acquire_udp_producer(
+            self.server.udp_addr,
+            self.server.udp_command,
+            self.server.udp_keepalive,
+            getattr(self.server, "udp_rcvbuf", None),
+            **getattr(self.server, "udp_recovery", {})
+        )
+        try:
+            self.stream_from_hub(producer.hub)
+        finally:
+            udp_producers.release(producer)
+
+
+class AsyncViewer:
+    def __init__(self, name, writer):
+        self.name = name
+        self.writer = writer
+        self.delivered = 0
+        self.skipped = 0
+        self.blocked = 0.0
+        self.connected_at = time.time()
+        self.pending = None
+        self.closed = False
+        self.ready = asyncio.Event()
+
+    def offer(self, part):
+        if self.pending is not None:
+            self.skipped += 1
+        self.pending = part
+        self.ready.set()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    def stats(self):
+        return {
+            "client": self.name,
+            "delivered": self.delivered,
+            "skipped": self.skipped,
+            "blocked_s": round(self.blocked, 3),
+            "connected_s": round(time.time() - self.connected_at, 1),
+        }
+
+
+class AsyncMjpegServer:
+    # Serves /, /stream and /stats from one event loop. The frame source is
+    # a FrameProducer obtained from acquire() while at least one viewer is
+    # connected; its hub listener hands each (header, jpeg) part to every
+    # viewer's latest-frame slot, and viewers send it with one writelines().
+    def __init__(self, host, port, acquire, release):
+        self.host = host
+        self.port = port
+        self._acquire = acquire
+        self._release = release
+        self._producer = None
+        self._viewers = set()
+        self._loop = None
+
+    async def serve_forever(self):
+        self._loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        async with server:
+            await server.serve_forever()
+
+    def _on_part(self, part):
+        # Producer thread -> event loop.
+        self._loop.call_soon_threadsafe(self._dispatch, part)
+
+    def _dispatch(self, part):
+        for viewer in list(self._viewers):
+            if part is None:
+                viewer.close()
+            else:
+                viewer.offer(part)
+        if part is None:
+            self._detach_source()
+
+    def _attach_source(self):
+        if self._producer is None:
+            self._producer = self._acquire()
+            self._producer.hub.add_listener(self._on_part)
+
+    def _detach_source(self):
+        producer = self._producer
+        if producer is not None:
+            self._producer = None
+            producer.hub.remove_listener(self._on_part)
+            self._release(producer)
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while True:
+                line = await reader.readline()
+                if not line or line in (b"\r\n", b"\n"):
+                    break
+            parts = request.split()
+            path = parts[1].decode("ascii", "replace") if len(parts) >= 2 else ""
+            if path == "/":
+                await self._send_body(writer, "200 OK", "text/html", INDEX_HTML.encode("ascii"))
+            elif path == "/stats":
+                body = json.dumps(self.stats(), indent=2).encode("ascii")
+                await self._send_body(writer, "200 OK", "application/json", body)
+            elif path == "/stream":
+                await self._stream(writer)
+            else:
+                await self._send_body(writer, "404 Not Found", "text/plain", b"")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send_body(self, writer, status, content_type, body):
+        writer.write(
+            b"HTTP/1.0 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n\r\n"
+            % (status.encode("ascii"), content_type.encode("ascii"), len(body))
+        )
+        writer.write(body)
+        await writer.drain()
+
+    async def _stream(self, writer):
+        writer.write(
+            b"HTTP/1.0 200 OK\r\n"
+            b"Content-Type: multipart/x-mixed-replace; boundary=%s\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Pragma: no-cache\r\n\r\n" % BOUNDARY
+        )
+        peer = writer.get_extra_info("peername") or ("?", 0)
+        viewer = AsyncViewer("%s:%d" % tuple(peer[:2]), writer)
+        self._viewers.add(viewer)
+        self._attach_source()
+        try:
+            while True:
+                await viewer.ready.wait()
+                viewer.ready.clear()
+                if viewer.closed:
+                    break
+                part, viewer.pending = viewer.pending, None
+                if part is None:
+                    continue
+                header, frame = part
+                start = time.monotonic()
+                writer.writelines((header, frame, b"\r\n"))
+                await writer.drain()
+                viewer.blocked += time.monotonic() - start
+                viewer.delivered += 1
+        finally:
+            self._viewers.discard(viewer)
+            if not self._viewers:
+                self._detach_source()
+
+    def stats(self):
+        return {
+            "server": "asyncio",
+            "viewers": [viewer.stats() for viewer in self._viewers],
+            "frames": self._producer.hub.published if self._producer is not None else 0,
+        }
+
+
+def udp_recovery(args):
+    return {
+        "frame_deadline": args.udp_frame_deadline,
+        "placeholder": args.udp_placeholder,
+        "validate": args.jpeg_validate,
+        "check_fragments": args.jpeg_check_fragments,
+    }
+
+
+def rtsp_supervision(args):
+    return {
+        "stall_timeout": args.stall_timeout,
+        "connect_timeout": args.connect_timeout,
+        "standby": args.rtsp_standby,
+    }
+
+
+def run_async_server(args):
+    if args.source == "udp":
+        addr = (args.ip, args.udp_port)
+        command = args.udp_command.encode("ascii")[:2].ljust(2, b"\x00")
+
+        def acquire():
+            return acquire_udp_producer(
+                addr, command, args.udp_keepalive, args.udp_rcvbuf, **udp_recovery(args)
+            )
+
+        release = udp_producers.release
+        print("UDP source:", "%s:%d" % addr)
+        print("UDP command:", command)
+    else:
+        ffmpeg = which("ffmpeg")
+        if not ffmpeg:
+            sys.exit("ffmpeg not found in PATH")
+        rtsp_url = build_rtsp_url(args.ip, args.mode)
+        transports = [t.strip() for t in args.rtsp_transport.split(",") if t.strip()]
+
+        def acquire():
+            return acquire_rtsp_producer(
+                ffmpeg, rtsp_url, transports, args.fps, args.quality, **rtsp_supervision(args)
+            )
+
+        release = rtsp_producers.release
+
+        print("RTSP URL:", rtsp_url)
+
+    server = AsyncMjpegServer("0.0.0.0", args.port, acquire, release)
+    print("HTTP stream (asyncio): http://127.0.0.1:%d/stream" % args.port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
 
 def main():
     parser = argparse.ArgumentParser(description="WiFi CAM RTSP to MJPEG streamer")
@@ -242,11 +1516,42 @@ def main():
         help="front, rear, h264, h264_rear, or full rtsp:// URL",
     )
     parser.add_argument("--port", type=int, default=45100, help="HTTP port")
+    parser.add_argument(
+        "--server",
+        default="threaded",
+        choices=["threaded", "asyncio"],
+        help="HTTP server: one thread per viewer, or a single asyncio event loop",
+    )
     parser.add_argument(
         "--rtsp-transport",
         default="tcp,udp",
         help="Comma-separated RTSP transports to try (default: tcp,udp)",
     )
+    parser.add_argument("--fps", type=float, default=15, help="RTSP transcode frame rate (default: 15)")
+    parser.add_argument("--quality", type=int, default=5, help="RTSP transcode JPEG -q:v (default: 5)")
+    parser.add_argument(
+        "--idle-grace",
+        type=float,
+        default=5.0,
+        help="Seconds an unwatched RTSP transcoder stays warm before it is reaped",
+    )
+    parser.add_argument(
+        "--stall-timeout",
+        type=float,
+        default=2.0,
+        help="Seconds without an RTSP frame before ffmpeg is restarted or failed over",
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=5.0,
+        help="Seconds a new ffmpeg may take to deliver its first frame",
+    )
+    parser.add_argument(
+        "--rtsp-standby",
+        action="store_true",
+        help="Keep a pre-connected ffmpeg on the alternate transport for instant failover",
+    )
     parser.add_argument(
         "--udp-port",
         type=int,
@@ -264,13 +1569,49 @@ def main():
         default=1.0,
         help="Seconds between UDP keepalive commands (0 to disable)",
     )
+    parser.add_argument(
+        "--udp-rcvbuf",
+        type=int,
+        default=4 * 1024 * 1024,
+        help="UDP socket receive buffer in bytes (default: 4 MiB; capped by net.core.rmem_max)",
+    )
+    parser.add_argument(
+        "--udp-frame-deadline",
+        type=float,
+        default=3.0,
+        help="Seconds without a UDP frame before the start command is re-sent (with backoff)",
+    )
+    parser.add_argument(
+        "--udp-placeholder",
+        action="store_true",
+        help="Show a grey placeholder frame to viewers while the UDP stream is reconnecting",
+    )
+    parser.add_argument(
+        "--no-jpeg-validate",
+        dest="jpeg_validate",
+        action="store_false",
+        help="Cut UDP frames at FFD8..FFD9 without checking JPEG structure",
+    )
+    parser.add_argument(
+        "--jpeg-check-fragments",
+        action="store_true",
+        help="Reject UDP frames with a short datagram inside (for senders using equal-size fragments)",
+    )
     args = parser.parse_args()
 
+    rtsp_producers.idle_grace = args.idle_grace
+
+    if args.server == "asyncio":
+        run_async_server(args)
+        return
+
     if args.source == "udp":
         server = ThreadedHTTPServer(("0.0.0.0", args.port), UdpStreamHandler)
         server.udp_addr = (args.ip, args.udp_port)
         server.udp_command = args.udp_command.encode("ascii")[:2].ljust(2, b"\x00")
         server.udp_keepalive = args.udp_keepalive
+        server.udp_rcvbuf = args.udp_rcvbuf
+        server.udp_recovery = udp_recovery(args)
         print("UDP source:", "%s:%d" % (args.ip, args.udp_port))
         print("UDP command:", server.udp_command)
     else:
@@ -278,7 +1619,11 @@ def main():
         server = ThreadedHTTPServer(("0.0.0.0", args.port), StreamHandler)
         server.rtsp_url = rtsp_url
         server.rtsp_transports = [t.strip() for t in args.rtsp_transport.split(",") if t.strip()]
+        server.rtsp_fps = args.fps
+        server.rtsp_quality = args.quality
+        server.rtsp_supervision = rtsp_supervision(args)
         print("RTSP URL:", rtsp_url)
+        print("H.264 passthrough: http://127.0.0.1:%d/stream.ts (or /stream.mp4)" % args.port)
 
     print("HTTP stream: http://127.0.0.1:%d/stream" % args.port)
 